@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from events import load_events
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "claudio",
+                         "sessions")
+COLUMNS = ("time", "event", "error")
+
+
+class Session(object):
+    # One recorded session, held column-wise.
+    def __init__(self, path: str, time: np.ndarray, event: np.ndarray,
+                 error: np.ndarray) -> None:
+        self.path = path
+        self.time = time
+        self.event = event
+        self.error = error
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def times(self, event: int) -> np.ndarray:
+        return self.time[self.event == event]
+
+    @property
+    def name(self) -> Dict[str, str]:
+        return parse_name(self.path)
+
+
+def parse_name(path: str) -> Dict[str, str]:
+    # {date}_{subject}_{condition}.csv, or {date}_{box}_{subject}_{cond}
+    # from multibox; anything else is kept whole as the stem.
+    stem = os.path.splitext(os.path.basename(path))[0]
+    parts = stem.split("_")
+    if len(parts) == 3:
+        return dict(zip(("date", "subject", "condition"), parts))
+    if len(parts) == 4:
+        return dict(zip(("date", "chamber", "subject", "condition"), parts))
+    return {"stem": stem}
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_path(path: str, cache_dir: str = CACHE_DIR) -> str:
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key[:16])
+
+
+def _stamp(path: str) -> dict:
+    st = os.stat(path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def build_cache(path: str, cache_dir: str = CACHE_DIR) -> str:
+    # Parse `path` once into one .npy per column. A cache whose stamp
+    # (mtime, size) is stale is kept if the content hash still matches.
+    where = cache_path(path, cache_dir)
+    meta_file = os.path.join(where, "source.json")
+    stamp = _stamp(path)
+    meta = None
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if all(meta.get(k) == v for k, v in stamp.items()):
+            return where
+    digest = file_hash(path)
+    if meta is None or meta.get("sha1") != digest:
+        records = load_events(path)
+        os.makedirs(where, exist_ok=True)
+        for column in COLUMNS:
+            values = records[column] if column in records.dtype.names \
+                else np.zeros(len(records))
+            tmp = os.path.join(where, f"{column}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(values))
+            os.replace(tmp, os.path.join(where, f"{column}.npy"))
+    tmp = f"{meta_file}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(stamp, path=os.path.abspath(path), sha1=digest), f)
+    os.replace(tmp, meta_file)
+    return where
+
+
+def open_cache(path: str, where: str) -> Session:
+    columns = [
+        np.load(os.path.join(where, f"{column}.npy"), mmap_mode="r")
+        for column in COLUMNS
+    ]
+    return Session(path, *columns)
+
+
+def load_session(path: str, cache_dir: Optional[str] = CACHE_DIR) -> Session:
+    if cache_dir is None:
+        records = load_events(path)
+        return Session(path, records["time"], records["event"],
+                       records["error"])
+    return open_cache(path, build_cache(path, cache_dir))
+
+
+def load_sessions(paths: Iterable[str],
+                  cache_dir: str = CACHE_DIR,
+                  processes: Optional[int] = None) -> List[Session]:
+    # Workers only parse and write the caches; the sessions themselves are
+    # memory-mapped here, so no event data is pickled between processes.
+    paths = list(paths)
+    with ProcessPoolExecutor(processes) as pool:
+        wheres = list(pool.map(build_cache, paths, [cache_dir] * len(paths)))
+    return [open_cache(p, w) for p, w in zip(paths, wheres)]
+
+
+def _pairs(times: np.ndarray, lo: np.ndarray,
+           hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Every (window, time) pair with lo[w] <= time < hi[w], as flat index
+    # arrays, without a Python loop over windows. `times` must be sorted.
+    first = np.searchsorted(times, lo)
+    counts = np.maximum(np.searchsorted(times, hi) - first, 0)
+    owner = np.repeat(np.arange(len(lo)), counts)
+    start = np.cumsum(counts) - counts
+    index = np.arange(counts.sum()) - np.repeat(start - first, counts)
+    return owner, index
+
+
+def peth(times: np.ndarray, refs: np.ndarray, window: Tuple[float, float],
+         bin_width: float) -> Tuple[np.ndarray, np.ndarray]:
+    # Peri-event time histogram of `times` around each of `refs`, in events
+    # per second per reference.
+    lo, hi = window
+    edges = np.arange(lo, hi + bin_width / 2, bin_width)
+    owner, index = _pairs(times, refs + lo, refs + hi)
+    bins = ((times[index] - refs[owner] - lo) / bin_width).astype(np.int64)
+    hist = np.bincount(np.minimum(bins, len(edges) - 2),
+                       minlength=len(edges) - 1)
+    return edges, hist / (max(len(refs), 1) * bin_width)
+
+
+def iti_rates(times: np.ndarray, marks: np.ndarray) -> np.ndarray:
+    # Event rate within each interval between consecutive marks.
+    counts = np.diff(np.searchsorted(times, marks))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return counts / np.diff(marks)
+
+
+def peak_function(times: np.ndarray,
+                  marks: np.ndarray,
+                  bin_width: float = 1.0,
+                  span: float = 60.0,
+                  probe_factor: float = 2.0) -> Tuple[np.ndarray, np.ndarray]:
+    # Lick rate against time since the previous US, over probe trials only.
+    # Probes are the intervals longer than `probe_factor` times the median
+    # interval, the US being withheld through them.
+    edges = np.arange(0., span + bin_width / 2, bin_width)
+    nbins = len(edges) - 1
+    gaps = np.diff(marks)
+    if len(gaps) == 0:
+        return edges, np.full(nbins, np.nan)
+    probe = gaps > probe_factor * np.median(gaps)
+    starts, ends = marks[:-1][probe], marks[1:][probe]
+    ends = np.minimum(ends, starts + span)
+    owner, index = _pairs(times, starts, ends)
+    bins = ((times[index] - starts[owner]) / bin_width).astype(np.int64)
+    hist = np.bincount(np.minimum(bins, nbins - 1), minlength=nbins)
+    # Each bin is divided by the number of probes that lasted into it.
+    covered = np.minimum(np.ceil((ends - starts) / bin_width), nbins)
+    exposure = len(starts) - np.cumsum(
+        np.bincount(covered.astype(np.int64), minlength=nbins + 1))[:nbins]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(exposure > 0, hist / (exposure * bin_width), np.nan)
+    return edges, rate
+
+
+def summarize(session: Session, lick: int, us: int,
+              bin_width: float = 1.0, span: float = 60.0) -> dict:
+    licks = np.sort(session.times(lick))
+    marks = np.sort(session.times(us))
+    edges, rate = peak_function(licks, marks, bin_width, span)
+    peak = np.nan if np.isnan(rate).all() else \
+        float(edges[np.nanargmax(rate)] + bin_width / 2)
+    return dict(session.name,
+                path=session.path,
+                events=len(session),
+                licks=len(licks),
+                us=len(marks),
+                iti_rate=float(np.nanmean(iti_rates(licks, marks)))
+                if len(marks) > 1 else np.nan,
+                peak_time=peak)
+
+
+if __name__ == '__main__':
+    import argparse
+    import csv
+    import sys
+    from glob import glob
+
+    parser = argparse.ArgumentParser(
+        description="summarize recorded sessions (parsed once, then cached)")
+    parser.add_argument("files", nargs="+", help="session files or globs")
+    parser.add_argument("--lick", type=int, default=10)
+    parser.add_argument("--us", type=int, default=12)
+    parser.add_argument("--bin", type=float, default=1.0)
+    parser.add_argument("--span", type=float, default=60.0)
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.files for p in glob(pattern)})
+    paths = [
+        p for p in paths
+        if not p.endswith(("_timing.csv", "_log.jsonl", "_schedule.csv"))
+    ]
+    sessions = load_sessions(paths, args.cache, args.processes)
+    rows = [
+        summarize(s, args.lick, args.us, args.bin, args.span)
+        for s in sessions
+    ]
+    fields = sorted({k for row in rows for k in row})
+    out = csv.DictWriter(sys.stdout, fieldnames=fields)
+    out.writeheader()
+    out.writerows(rows)
@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from analysis import file_hash, load_session, load_sessions
+
+ARCHIVE = os.path.join(os.path.expanduser("~"), ".local", "share", "claudio",
+                       "archive.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    started TEXT NOT NULL,
+    status TEXT NOT NULL,
+    subject TEXT,
+    condition TEXT,
+    chamber TEXT,
+    schedule TEXT,
+    experimenter TEXT,
+    config TEXT NOT NULL,
+    sha1 TEXT,
+    events INTEGER,
+    licks INTEGER,
+    us INTEGER,
+    trials INTEGER
+);
+CREATE INDEX IF NOT EXISTS sessions_subject
+    ON sessions (subject, schedule, chamber);
+CREATE INDEX IF NOT EXISTS sessions_schedule
+    ON sessions (schedule, chamber);
+CREATE TABLE IF NOT EXISTS trials (
+    session INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    trial INTEGER NOT NULL,
+    phase INTEGER,
+    cs INTEGER,
+    us INTEGER,
+    probe INTEGER,
+    start REAL,
+    cs_onset REAL,
+    us_onset REAL,
+    us_offset REAL,
+    licks INTEGER,
+    PRIMARY KEY (session, trial)
+);
+"""
+
+FILTERS = ("subject", "condition", "chamber", "schedule", "experimenter",
+           "status")
+
+
+class Archive(object):
+    def __init__(self, path: str = ARCHIVE) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)),
+                        exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def register(self,
+                 path: str,
+                 expvars: dict,
+                 meta: Optional[dict] = None,
+                 chamber: Optional[str] = None,
+                 schedule: Optional[str] = None) -> int:
+        # Called when recording starts, so that an interrupted session is
+        # still found (with status "recording").
+        meta = meta or {}
+        with self.db:
+            cur = self.db.execute(
+                "INSERT OR REPLACE INTO sessions (path, started, status, "
+                "subject, condition, chamber, schedule, experimenter, "
+                "config) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), datetime.now().isoformat(),
+                 "recording", meta.get("subject"), meta.get("condition"),
+                 chamber, schedule or expvars.get("schedule"),
+                 meta.get("experimenter"),
+                 json.dumps({"Experimental": expvars, "Metadata": meta},
+                            default=str)))
+        return cur.lastrowid
+
+    def complete(self, session: int, path: str, table: np.ndarray,
+                 lick: int, us: int) -> None:
+        # Counts, content hash and per-trial lick counts of the written file.
+        data = load_session(path, None)
+        licks = np.sort(data.times(lick))
+        origin = data.times(0)
+        origin = float(origin[0]) if len(origin) else 0.
+        bounds = origin + np.concatenate([[0.], table["us_offset"]])
+        starts = bounds[:-1] - origin
+        per_trial = np.diff(np.searchsorted(licks, bounds))
+        rows = [(session, i, int(row["phase"]), int(row["cs"]),
+                 int(row["us"]), int(row["probe"]), float(start),
+                 float(row["cs_onset"]), float(row["us_onset"]),
+                 float(row["us_offset"]), int(n))
+                for i, (row, start, n) in enumerate(
+                    zip(table, starts, per_trial))]
+        with self.db:
+            self.db.execute(
+                "UPDATE sessions SET status = ?, sha1 = ?, events = ?, "
+                "licks = ?, us = ?, trials = ? WHERE id = ?",
+                ("complete", file_hash(path), len(data), len(licks),
+                 int(np.count_nonzero(data.event == us)),
+                 len(table), session))
+            self.db.execute("DELETE FROM trials WHERE session = ?",
+                            (session, ))
+            self.db.executemany(
+                "INSERT INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows)
+        return None
+
+    def find(self, **filters: Any) -> List[sqlite3.Row]:
+        # e.g. find(schedule="FT", subject="sub-07", chamber="Box_2")
+        unknown = set(filters) - set(FILTERS)
+        if unknown:
+            raise ValueError(f"cannot filter sessions by {sorted(unknown)}")
+        where = " AND ".join(f"{k} = ?" for k in filters) or "1"
+        return self.db.execute(
+            f"SELECT * FROM sessions WHERE {where} ORDER BY started",
+            tuple(filters.values())).fetchall()
+
+    def trials(self, session: int) -> List[sqlite3.Row]:
+        return self.db.execute(
+            "SELECT * FROM trials WHERE session = ? ORDER BY trial",
+            (session, )).fetchall()
+
+    def load(self, **filters: Any) -> Dict[str, Any]:
+        # Path -> Session (see analysis.py) for every match.
+        paths = [row["path"] for row in self.find(**filters)]
+        return dict(zip(paths, load_sessions(paths)))
+
+
+def open_archive(var: dict) -> Optional[Archive]:
+    # `archive: false` turns archiving off, a path moves the database.
+    where = var.get("archive", ARCHIVE)
+    if not where:
+        return None
+    return Archive(where)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="query the session archive")
+    parser.add_argument("--db", default=ARCHIVE)
+    for key in FILTERS:
+        parser.add_argument(f"--{key}")
+    args = parser.parse_args()
+
+    filters = {
+        k: getattr(args, k)
+        for k in FILTERS if getattr(args, k) is not None
+    }
+    with Archive(args.db) as archive:
+        for row in archive.find(**filters):
+            print(f"{row['id']:5d} {row['started'][:16]} {row['status']:9s} "
+                  f"{row['subject']} {row['condition']} {row['chamber']} "
+                  f"{row['schedule']} {row['trials']} trials, "
+                  f"{row['licks']} licks  {row['path']}")
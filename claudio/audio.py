@@ -0,0 +1,201 @@
+from queue import Empty, SimpleQueue
+from threading import Event, Thread
+from time import perf_counter, sleep
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from backends import load
+
+# Backend callbacks are called as callback(out, frames, dac), where `dac` is
+# the perf_counter() time at which the first frame of `out` reaches the DAC.
+Render = Callable[[np.ndarray, int, float], None]
+
+
+class Cue(object):
+    def __init__(self, name: str, at: Optional[float]) -> None:
+        self.name = name
+        self.at = at
+        self.requested = perf_counter()
+        self.onset: Optional[float] = None
+        self._started = Event()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[float]:
+        self._started.wait(timeout)
+        return self.onset
+
+
+class Voice(object):
+    def __init__(self, cue: Cue, wave: np.ndarray) -> None:
+        self.cue = cue
+        self.wave = wave
+        self.pos = -1
+
+
+class AudioStream(object):
+    def __init__(self, backend, device, samplerate: int, channels: int,
+                 blocksize: int) -> None:
+        self.samplerate = samplerate
+        self.channels = channels
+        self.waves: Dict[str, np.ndarray] = {}
+        self.late = 0
+        self._cues: SimpleQueue = SimpleQueue()
+        self._voices: List[Voice] = []
+        self._handle = backend.open(device, samplerate, channels, blocksize,
+                                    self._render)
+
+    def load(self, name: str, wave: np.ndarray) -> None:
+        self.waves[name] = np.ascontiguousarray(wave, dtype=np.float32)
+
+    def trigger(self, name: str, at: Optional[float] = None) -> Cue:
+        # Only hands the cue to the audio thread; mixing happens there.
+        cue = Cue(name, at)
+        self._cues.put(Voice(cue, self.waves[name]))
+        return cue
+
+    def _render(self, out: np.ndarray, frames: int, dac: float) -> None:
+        out.fill(0.)
+        while True:
+            try:
+                self._voices.append(self._cues.get_nowait())
+            except Empty:
+                break
+        playing = []
+        for voice in self._voices:
+            start = 0
+            if voice.pos < 0:
+                cue = voice.cue
+                if cue.at is not None:
+                    start = int(round((cue.at - dac) * self.samplerate))
+                    if start >= frames:
+                        playing.append(voice)
+                        continue
+                    if start < 0:
+                        self.late += 1
+                        start = 0
+                cue.onset = dac + start / self.samplerate
+                cue._started.set()
+                voice.pos = 0
+            n = min(frames - start, len(voice.wave) - voice.pos)
+            out[start:start + n] += voice.wave[voice.pos:voice.pos + n, None]
+            voice.pos += n
+            if voice.pos < len(voice.wave):
+                playing.append(voice)
+        self._voices = playing
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+class SoundDeviceBackend(object):
+    def __init__(self) -> None:
+        import sounddevice as sd
+
+        self.sd = sd
+
+    def open(self, device, samplerate: int, channels: int, blocksize: int,
+             render: Render):
+        def callback(outdata, frames, time, status) -> None:
+            # Move PortAudio's stream clock onto perf_counter().
+            dac = perf_counter() + (time.outputBufferDacTime -
+                                    time.currentTime)
+            render(outdata, frames, dac)
+
+        stream = self.sd.OutputStream(device=device,
+                                      samplerate=samplerate,
+                                      channels=channels,
+                                      blocksize=blocksize,
+                                      dtype="float32",
+                                      latency="low",
+                                      callback=callback)
+        stream.start()
+        return stream
+
+
+class BlockPlayer(object):
+    def __init__(self, target: Callable[[Event], None]) -> None:
+        self._stop = Event()
+        self._thread = Thread(target=target, args=(self._stop, ), daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class SoundCardBackend(object):
+    def __init__(self) -> None:
+        import soundcard as sc
+
+        self.sc = sc
+
+    def speaker(self, device):
+        if device is None:
+            return self.sc.default_speaker()
+        if isinstance(device, int):
+            # Same selection as sound_check.py: USB speakers by index.
+            usb = [s for s in self.sc.all_speakers() if "USB" in str(s)]
+            return usb[device]
+        return self.sc.get_speaker(device)
+
+    def open(self, device, samplerate: int, channels: int, blocksize: int,
+             render: Render):
+        speaker = self.speaker(device)
+
+        def run(stop: Event) -> None:
+            out = np.zeros((blocksize, channels), dtype=np.float32)
+            with speaker.player(samplerate=samplerate,
+                                channels=channels,
+                                blocksize=blocksize) as player:
+                while not stop.is_set():
+                    # soundcard does not report DAC time; play() returns once
+                    # the block is queued, so it sounds about a block later.
+                    render(out, blocksize, perf_counter() +
+                           blocksize / samplerate)
+                    player.play(out)
+
+        return BlockPlayer(run)
+
+
+class FakeBackend(object):
+    def __init__(self, latency: float = 0.005) -> None:
+        self.latency = latency
+        self.blocks: List[np.ndarray] = []
+
+    def open(self, device, samplerate: int, channels: int, blocksize: int,
+             render: Render):
+        period = blocksize / samplerate
+
+        def run(stop: Event) -> None:
+            due = perf_counter()
+            while not stop.is_set():
+                out = np.zeros((blocksize, channels), dtype=np.float32)
+                render(out, blocksize, due + self.latency)
+                if out.any():
+                    self.blocks.append(out)
+                due += period
+                sleep(max(due - perf_counter(), 0.))
+
+        return BlockPlayer(run)
+
+
+class AudioEngine(object):
+    def __init__(self, backend: str = "sounddevice") -> None:
+        self.backend = load("audio", backend)()
+        self.streams: Dict[object, AudioStream] = {}
+
+    def open(self,
+             device=None,
+             samplerate: int = 48000,
+             channels: int = 1,
+             blocksize: int = 256) -> AudioStream:
+        key = (device, samplerate, channels)
+        if key not in self.streams:
+            self.streams[key] = AudioStream(self.backend, device, samplerate,
+                                            channels, blocksize)
+        return self.streams[key]
+
+    def close(self) -> None:
+        for stream in self.streams.values():
+            stream.close()
+        self.streams.clear()
@@ -0,0 +1,208 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from events import load_events
+from protocol import PULSE_EVENT
+from schedule import CS
+from scheduler import timing_filename
+
+# Coarse lateness bins of the report, in milliseconds.
+HIST_MS = [-np.inf, 0., 0.1, 0.2, 0.5, 1., 2., 5., 10., 20., 50., 100., np.inf]
+WORST = 10
+
+
+class Histogram(object):
+    # Fixed-width bins (plus one under and one over), so that adding a batch
+    # costs one bincount and histograms merge by addition.
+    def __init__(self, width: float = 0.0002, span: float = 0.1) -> None:
+        self.width = width
+        self.nbins = int(round(span / width))
+        self.counts = np.zeros(self.nbins + 2, dtype=np.int64)
+        self.max = -np.inf
+
+    def add(self, values: np.ndarray) -> None:
+        if len(values) == 0:
+            return None
+        i = np.floor(values / self.width).astype(np.int64) + 1
+        np.clip(i, 0, self.nbins + 1, out=i)
+        self.counts += np.bincount(i, minlength=self.nbins + 2)
+        self.max = max(self.max, float(values.max()))
+        return None
+
+    def __len__(self) -> int:
+        return int(self.counts.sum())
+
+    def percentile(self, q: float) -> float:
+        # The middle of the bin holding the q-th percentile.
+        n = len(self)
+        if n == 0:
+            return float("nan")
+        k = int(np.searchsorted(np.cumsum(self.counts), q / 100 * n))
+        return min((k - 0.5) * self.width, self.max)
+
+    def summary(self) -> dict:
+        return {
+            "n": len(self),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max if len(self) else float("nan"),
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"width": self.width, "max": self.max,
+                       "counts": self.counts.tolist()}, f)
+        return None
+
+    @classmethod
+    def load(cls, path: str) -> "Histogram":
+        with open(path) as f:
+            saved = json.load(f)
+        width = saved["width"]
+        hist = cls(width, width * (len(saved["counts"]) - 2))
+        hist.counts[:] = saved["counts"]
+        hist.max = saved["max"]
+        return hist
+
+
+def latency_filename(filename: str) -> str:
+    return os.path.splitext(filename)[0] + "_latency.json"
+
+
+def audit_filename(filename: str) -> str:
+    return os.path.splitext(filename)[0] + "_audit.json"
+
+
+def stats(late: np.ndarray) -> dict:
+    late = late[~np.isnan(late)]
+    if len(late) == 0:
+        return {"n": 0}
+    p50, p90, p99 = np.percentile(late, [50, 90, 99])
+    return {
+        "n": len(late),
+        "mean": float(late.mean()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "max": float(late.max()),
+        "hist_ms": np.histogram(late * 1e3, HIST_MS)[0].tolist(),
+    }
+
+
+def drift(at: np.ndarray, late: np.ndarray) -> float:
+    # Change in lateness over the session, in seconds per hour.
+    keep = ~np.isnan(late)
+    if np.count_nonzero(keep) < 3 or np.ptp(at[keep]) <= 0.:
+        return float("nan")
+    return float(np.polyfit(at[keep], late[keep], 1)[0] * 3600.)
+
+
+def matched(planned: np.ndarray, device: np.ndarray) -> np.ndarray:
+    # Device stamps against the commands they answer, in order; commands
+    # left unanswered (an interrupted session) come out NaN.
+    late = np.full(len(planned), np.nan)
+    n = min(len(planned), len(device))
+    late[:n] = device[:n] - planned[:n]
+    return late
+
+
+def audit_session(filename: str, var: dict,
+                  recorded: Optional[str] = None) -> dict:
+    # Timing of one session, from the stimulator's timing file, the device
+    # acknowledgements in the event file and the reader's latency histogram.
+    us = var.get("us", 12)
+    timing = np.loadtxt(timing_filename(filename), delimiter=",",
+                        skiprows=1, ndmin=2)
+    if timing.size == 0:
+        # Nothing was delivered: an early abort, or a closed-loop session
+        # without a reinforced response.
+        timing = np.empty((0, 6))
+    events = load_events(recorded or filename)
+    start = events["time"][events["event"] == 0]
+    origin = float(start[0]) if len(start) else \
+        float(timing[0, 1]) if len(timing) else 0.
+    code, planned, issued, confirmed = timing[:, [0, 1, 2, 4]].T
+    woke = timing[:, 5] if timing.shape[1] > 5 \
+        else np.full(len(timing), np.nan)
+    groups = {
+        "cs": CS,
+        "us": us,
+        "omitted": -us,
+        "us_onset": PULSE_EVENT + us,
+    }
+    report: dict = {"session": os.path.basename(filename)}
+    stimuli: Dict[str, dict] = {}
+    for name, event in groups.items():
+        rows = code == event
+        if not rows.any():
+            continue
+        entry = {
+            "wake": stats(woke[rows] - planned[rows]),
+            "issue": stats(issued[rows] - planned[rows]),
+        }
+        if not np.isnan(confirmed[rows]).all():
+            entry["confirmed"] = stats(confirmed[rows] - planned[rows])
+        stimuli[name] = entry
+    # Board-timed pulses: their acknowledged edges against the plan, and
+    # the delivered width against the planned one (the reward volume).
+    onsets = events["time"][events["event"] == PULSE_EVENT + us]
+    offsets = events["time"][events["event"] == -(PULSE_EVENT + us)]
+    on_plan = planned[code == PULSE_EVENT + us]
+    off_plan = planned[code == us]
+    if len(onsets) and len(on_plan):
+        device = matched(on_plan, onsets)
+        stimuli["us_onset"]["device"] = stats(device)
+        # Closed-loop sessions stamp no US offset; their pulses all last
+        # us-duration.
+        if len(off_plan) == 0:
+            off_plan = on_plan + var.get("us-duration", np.nan)
+        n = min(len(onsets), len(offsets), len(on_plan), len(off_plan))
+        stimuli["us_onset"]["width"] = stats(
+            (offsets[:n] - onsets[:n]) - (off_plan[:n] - on_plan[:n]))
+        report["device_drift"] = drift(on_plan - origin, device)
+    report["stimuli"] = stimuli
+    late = issued - planned
+    worst: List[dict] = [{
+        "event": int(code[i]),
+        "at": float(planned[i] - origin),
+        "late": float(late[i]),
+    } for i in np.argsort(-late)[:WORST]]
+    report["worst"] = worst
+    report["drift"] = drift(planned - origin, late)
+    if os.path.exists(latency_filename(filename)):
+        report["input"] = Histogram.load(latency_filename(filename)).summary()
+    return report
+
+
+def write_audit(filename: str, var: dict,
+                recorded: Optional[str] = None) -> dict:
+    report = audit_session(filename, var, recorded)
+    with open(audit_filename(filename), "w") as f:
+        json.dump(report, f, indent=1)
+    if os.path.exists(latency_filename(filename)):
+        os.remove(latency_filename(filename))
+    return report
+
+
+def audit_line(report: dict) -> str:
+    cells = [
+        f"{name} p99 {entry['issue']['p99'] * 1e3:.2f} ms"
+        for name, entry in report["stimuli"].items()
+        if entry["issue"]["n"]
+    ]
+    if "input" in report and report["input"]["n"]:
+        cells.append(f"input p99 {report['input']['p99'] * 1e3:.2f} ms")
+    if report["worst"]:
+        cells.append(f"worst {report['worst'][0]['late'] * 1e3:.2f} ms")
+    return "timing: " + ", ".join(cells)
+
+
+if __name__ == '__main__':
+    import sys
+
+    for filename in sys.argv[1:]:
+        print(json.dumps(audit_session(filename, {}), indent=1))
@@ -0,0 +1,234 @@
+import importlib
+import os
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Every optional dependency sits behind one of these names and is imported
+# only when a config (or CLAUDIO_UI) picks it.
+REGISTRY = {
+    "audio": {
+        "sounddevice": "audio:SoundDeviceBackend",
+        "soundcard": "audio:SoundCardBackend",
+        "fake": "audio:FakeBackend",
+    },
+    "hardware": {
+        "pino": "backends:PinoHardware",
+        "simulated": "backends:SimulatedHardware",
+    },
+    "ui": {
+        "gui": "backends:GuiFrontend",
+        "cli": "backends:CliFrontend",
+    },
+}
+
+
+def load(kind: str, name: str) -> Any:
+    entries = REGISTRY.get(kind)
+    if entries is None:
+        raise ValueError(f"undefined backend kind: {kind}")
+    if name not in entries:
+        raise ValueError(f"undefined {kind} backend: {name} "
+                         f"(one of {', '.join(entries)})")
+    module, attr = entries[name].split(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+class StartupTimer(object):
+    # Wall time of each start-up stage, from the first import of this module
+    # (scripts import it first) to the moment the agents start.
+    def __init__(self) -> None:
+        self.begin = perf_counter()
+        self.last = self.begin
+        self.stages: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str) -> float:
+        now = perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+        return now - self.begin
+
+    def as_dict(self) -> dict:
+        # `begin` is a perf_counter() time, comparable with the session log's
+        # record times (e.g. the first trial's).
+        return dict(self.stages, total=self.last - self.begin,
+                    begin=self.begin)
+
+    def report(self) -> str:
+        cells = ", ".join(f"{stage} {t * 1e3:.0f} ms"
+                          for stage, t in self.stages)
+        return f"startup: {cells}; total {(self.last - self.begin):.2f} s"
+
+
+STARTUP = StartupTimer()
+
+
+class PinoHardware(object):
+    # An Arduino running proto.ino, through pino.
+    def __init__(self, config) -> None:
+        from pino.ino import HIGH, LOW, Arduino
+
+        from firmware import open_comport
+        from protocol import Board
+
+        comport = config.get_comport()
+        self.port = comport.get("port")
+        self.com = open_comport(comport)
+        self.ino = Arduino(self.com)
+        # pino knows nothing of the pulse and mask commands.
+        self.board = Board(self.com)
+        self._levels = (LOW, HIGH)
+
+    def setup(self,
+              us: int,
+              lick: int,
+              debounce: float = 0.,
+              bin_width: float = 0.,
+              cs_pin: Optional[int] = None) -> None:
+        from pino.ino import OUTPUT, SSINPUT_PULLUP
+
+        self.ino.set_pinmode(us, OUTPUT)
+        if cs_pin is not None:
+            self.ino.set_pinmode(cs_pin, OUTPUT)
+        self.ino.set_pinmode(lick, SSINPUT_PULLUP)
+        self.board.set_debounce(debounce)
+        self.board.set_bin(bin_width)
+
+    def digital_write(self, pin: int, level: int) -> None:
+        self.ino.digital_write(pin, self._levels[level])
+
+    def pulse(self, pin: int, duration: float) -> None:
+        self.board.pulse(pin, duration)
+
+    def write_pins(self, levels: Dict[int, int]) -> None:
+        self.board.write_pins(levels)
+
+    def load_steps(self, pins, at, length) -> None:
+        self.board.load_steps(pins, at, length)
+
+    def start_sequence(self) -> None:
+        self.board.start_sequence()
+
+    def stop_sequence(self) -> None:
+        self.board.stop_sequence()
+
+    def close(self) -> None:
+        return None
+
+
+class SimulatedHardware(object):
+    # A VirtualArduino on a pty, licking at `sim-lick-rate` per second and
+    # delaying commands and reports by `sim-command-latency` and
+    # `sim-report-latency`; for checking a rig's software without a board.
+    def __init__(self, config) -> None:
+        from firmware import wait_ready
+        from protocol import Board
+        from virtual_ino import VirtualArduino
+
+        expvars = config.get_experimental()
+        # With `loopback`, the US pin is wired back to that input, as for
+        # calibration.py.
+        loopback = expvars.get("loopback")
+        self.virtual = VirtualArduino(
+            lick_rate=expvars.get("sim-lick-rate", 0.),
+            baudrate=config.get_comport().get("baudrate", 115200),
+            command_latency=expvars.get("sim-command-latency", 0.),
+            report_latency=expvars.get("sim-report-latency", 0.),
+            loopback=None if loopback is None else
+            {expvars.get("us", 12): loopback}).start()
+        self.port = self.virtual.port
+        self.com = self.virtual.connect()
+        self.ino = Board(self.com)
+        wait_ready(self.ino)
+
+    def setup(self,
+              us: int,
+              lick: int,
+              debounce: float = 0.,
+              bin_width: float = 0.,
+              cs_pin: Optional[int] = None) -> None:
+        from protocol import MODE_OUTPUT, MODE_SSINPUT_PULLUP
+
+        self.ino.set_pinmode(us, MODE_OUTPUT)
+        if cs_pin is not None:
+            self.ino.set_pinmode(cs_pin, MODE_OUTPUT)
+        self.ino.set_pinmode(lick, MODE_SSINPUT_PULLUP)
+        self.ino.set_debounce(debounce)
+        self.ino.set_bin(bin_width)
+
+    def digital_write(self, pin: int, level: int) -> None:
+        self.ino.digital_write(pin, level)
+
+    def pulse(self, pin: int, duration: float) -> None:
+        self.ino.pulse(pin, duration)
+
+    def write_pins(self, levels: Dict[int, int]) -> None:
+        self.ino.write_pins(levels)
+
+    def load_steps(self, pins, at, length) -> None:
+        self.ino.load_steps(pins, at, length)
+
+    def start_sequence(self) -> None:
+        self.ino.start_sequence()
+
+    def stop_sequence(self) -> None:
+        self.ino.stop_sequence()
+
+    def close(self) -> None:
+        self.com.close()
+        self.virtual.stop()
+
+
+def release_outputs(hardware, var: dict) -> None:
+    # Stops any sequence (ending its pulses) and drives the US and CS pins
+    # LOW, trying every step even if one fails; the first failure is
+    # raised afterwards.
+    steps = [hardware.stop_sequence] + [
+        lambda pin=pin: hardware.digital_write(pin, 0)
+        for pin in (var.get("us"), var.get("cs-pin")) if pin is not None
+    ]
+    errors = []
+    for step in steps:
+        try:
+            step()
+        except Exception as e:
+            errors.append(e)
+    if errors:
+        raise errors[0]
+    return None
+
+
+def open_hardware(config) -> Any:
+    name = config.get_experimental().get("hardware", "pino")
+    return load("hardware", name)(config)
+
+
+class GuiFrontend(object):
+    # PySimpleGUI windows: chamber and config picker, then the filename.
+    def __init__(self) -> None:
+        from guifunc import wins
+
+        self.wins = wins
+
+    def config(self, pattern: str = "./config/gui/*.yml"):
+        return self.wins.set_config(pattern)
+
+    def filename(self, config, script: str) -> str:
+        return self.wins.set_filename(config)
+
+
+class CliFrontend(object):
+    # Config from pino's command line (-y), filename from its metadata.
+    def config(self, pattern: str = ""):
+        from pino.ui import clap
+
+        return clap.PinoCli().get_config()
+
+    def filename(self, config, script: str) -> str:
+        meta = config.get_metadata() or {}
+        now = datetime.now().strftime("%y-%m-%d-%H-%M")
+        return f"{now}_{meta.get('subject')}_{meta.get('condition')}.csv"
+
+
+def frontend(default: str) -> Any:
+    return load("ui", os.environ.get("CLAUDIO_UI", default))()
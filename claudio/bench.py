@@ -0,0 +1,353 @@
+import asyncio
+import json
+import os
+import tempfile
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from audio import AudioEngine
+from clock import ClockSync
+from protocol import (MODE_OUTPUT, MODE_SSINPUT_PULLUP, PULSE_EVENT, Board,
+                      EdgeStream)
+from recorder import EventWriter
+from schedule import compile_schedule
+from contingency import CONTINGENCIES
+from session import (STIMULATOR, read, respond, set_speaker, stimulate,
+                     synchronize)
+from sessionlog import SessionLog
+from stimuli import StimulusBank
+from virtual_ino import VirtualArduino
+
+LICK = 10
+US = 12
+
+
+def percentiles(x: np.ndarray) -> Dict[str, float]:
+    if len(x) == 0:
+        return {"n": 0}
+    p50, p90, p99 = np.percentile(x, [50, 90, 99])
+    return {
+        "n": len(x),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "max": float(np.max(x))
+    }
+
+
+async def pipeline(board: Board, duration: float, filename: str) -> dict:
+    # The READER/RECORDER pair without amas: reads run on a worker thread as
+    # with agent.call_async, and the queue stands in for the mailbox.
+    loop = asyncio.get_event_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    clock = ClockSync()
+    stream = EdgeStream(clock)
+    writer = EventWriter(filename)
+    consumed: List[np.ndarray] = []
+    stamped: List[np.ndarray] = []
+    end = perf_counter() + duration
+
+    async def synchronize() -> None:
+        while perf_counter() < end:
+            board.ping(clock.next_ping())
+            await asyncio.sleep(0.2)
+
+    async def read() -> None:
+        while perf_counter() < end:
+            chunk, received = await loop.run_in_executor(
+                None, board.read_chunk)
+            if chunk:
+                events = stream.feed(chunk, received)
+                if len(events):
+                    queue.put_nowait(events)
+        queue.put_nowait(None)
+
+    async def record() -> None:
+        while True:
+            events = await queue.get()
+            if events is None:
+                break
+            writer.extend(events)
+            consumed.append(np.full(len(events), perf_counter()))
+            stamped.append(events["time"])
+
+    await asyncio.gather(synchronize(), read(), record())
+    writer.close()
+    return {
+        "consumed": np.concatenate(consumed) if consumed else np.empty(0),
+        "stamped": np.concatenate(stamped) if stamped else np.empty(0),
+        "dropped": stream.decoder.dropped,
+        "synced": clock.synced,
+    }
+
+
+def bench_latency(rate: float, duration: float,
+                  baudrate: Optional[int]) -> dict:
+    ino = VirtualArduino(lick_rate=rate,
+                         lick_duration=min(0.03, 0.25 / rate),
+                         baudrate=baudrate,
+                         seed=0)
+    with ino, tempfile.TemporaryDirectory() as tmp:
+        conn = ino.connect(timeout=0.1)
+        board = Board(conn)
+        board.set_pinmode(LICK, MODE_SSINPUT_PULLUP)
+        result = asyncio.run(
+            pipeline(board, duration, os.path.join(tmp, "bench.csv")))
+        conn.close()
+    emitted = np.array([t for t, _ in ino.emitted])
+    n = min(len(emitted), len(result["consumed"]))
+    # Edges are stamped on the board once sync has settled; skip the start.
+    settled = emitted[:n] > emitted[0] + 1.0 if n else np.zeros(0, bool)
+    return {
+        "rate": rate,
+        "emitted": len(emitted),
+        "edge_rate": len(emitted) / duration,
+        "received": len(result["consumed"]),
+        "dropped": result["dropped"],
+        "latency": percentiles(result["consumed"][:n] - emitted[:n]),
+        "stamp_error": percentiles(
+            np.abs(result["stamped"][:n] - emitted[:n])[settled]),
+    }
+
+
+def bench_max_rate(rates: List[float], duration: float,
+                   baudrate: Optional[int], limit: float) -> dict:
+    best = 0.
+    runs = []
+    for rate in rates:
+        run = bench_latency(rate, duration, baudrate)
+        runs.append(run)
+        lost = run["emitted"] - run["received"]
+        if lost > 0.01 * run["emitted"] or run["dropped"] or \
+                run["latency"].get("p99", np.inf) > limit:
+            break
+        best = max(best, run["edge_rate"])
+    return {"sustained": best, "runs": runs}
+
+
+class BenchAgent(object):
+    def __init__(self) -> None:
+        self.sent: List[tuple] = []
+
+    def working(self) -> bool:
+        return True
+
+    async def sleep(self, t: float) -> None:
+        await asyncio.sleep(t)
+
+    def send_to(self, to: str, mess) -> None:
+        self.sent.append((to, mess))
+
+
+def load_timing(filename: str) -> np.ndarray:
+    with open(filename) as f:
+        columns = len(f.readline().split(","))
+    records = np.loadtxt(filename, delimiter=",", skiprows=1, ndmin=2)
+    return records.reshape(-1, columns)
+
+
+def bench_stimulator(schedule: str, var: dict) -> dict:
+    table = compile_schedule(var, schedule)
+    engine = AudioEngine("fake")
+    beep = None
+    if table["cs"].any():
+        tone = StimulusBank(None).tone(6000, var["cs-duration"])
+        beep = set_speaker(engine.open(None, 48000), tone)
+    with VirtualArduino(baudrate=None) as ino, \
+            tempfile.TemporaryDirectory() as tmp:
+        conn = ino.connect()
+        board = Board(conn)
+        board.set_pinmode(US, MODE_OUTPUT)
+        timing = os.path.join(tmp, "bench_timing.csv")
+        log = SessionLog(None, console=False)
+        asyncio.run(
+            stimulate(BenchAgent(),
+                      board,
+                      beep=beep,
+                      table=table,
+                      var=var,
+                      timing=timing,
+                      log=log))
+        log.close()
+        conn.close()
+        records = load_timing(timing)
+    engine.close()
+    lateness = records[:, 3]
+    audio = records[~np.isnan(records[:, 4])]
+    us_off = records[records[:, 0] == var["us"], 1]
+    lows = np.array([t for t, pin, level in ino.writes if not level])
+    n = min(len(us_off), len(lows))
+    drift = records[-1, 3] - records[0, 3] if len(records) else 0.
+    return {
+        "schedule": var.get("schedule", schedule),
+        "trials": len(table),
+        "events": len(records),
+        "lateness": percentiles(lateness),
+        "wire_lateness": percentiles(lows[:n] - us_off[:n]),
+        "audio_onset_error": percentiles(np.abs(audio[:, 4] - audio[:, 1])),
+        "drift": float(drift),
+    }
+
+
+class MailAgent(BenchAgent):
+    # Enough of an amas agent to run the reader, clock sync and closed-loop
+    # stimulator together: sends to the stimulator land in its inbox.
+    def __init__(self, end: float) -> None:
+        super().__init__()
+        self.end = end
+        self.inbox: asyncio.Queue = asyncio.Queue()
+
+    def working(self) -> bool:
+        return perf_counter() < self.end
+
+    async def call_async(self, f, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, f, *args)
+
+    def send_to(self, to: str, mess) -> None:
+        if to == STIMULATOR:
+            self.inbox.put_nowait(mess)
+        else:
+            super().send_to(to, mess)
+
+    async def recv(self, t: float):
+        try:
+            mess = await asyncio.wait_for(self.inbox.get(), t)
+        except asyncio.TimeoutError:
+            return None, None
+        return None, mess
+
+
+def bench_contingent(schedule: str, var: dict, rate: float,
+                     duration: float) -> dict:
+    # Lick -> US latency of a closed-loop schedule: from the lick as the
+    # virtual board emitted it to the US pin going high.
+    var = dict(var, us=US, schedule=schedule)
+    var["session-duration"] = duration
+    contingency = CONTINGENCIES[schedule](np.random.default_rng(0), var)
+    ino = VirtualArduino(lick_rate=rate,
+                         lick_duration=min(0.03, 0.25 / rate),
+                         seed=0)
+    with ino, tempfile.TemporaryDirectory() as tmp:
+        conn = ino.connect(timeout=0.1)
+        board = Board(conn)
+        board.set_pinmode(LICK, MODE_SSINPUT_PULLUP)
+        board.set_pinmode(US, MODE_OUTPUT)
+        timing = os.path.join(tmp, "bench_timing.csv")
+        log = SessionLog(None, console=False)
+        agent = MailAgent(perf_counter() + duration + 0.5)
+        clock = ClockSync()
+
+        async def run() -> None:
+            await asyncio.gather(
+                read(agent, board, clock, forward=LICK),
+                synchronize(agent, board, clock, var),
+                respond(agent, board, None, contingency, var, timing, log))
+
+        asyncio.run(run())
+        log.close()
+        conn.close()
+        records = load_timing(timing)
+    pulses = records[records[:, 0] == PULSE_EVENT + US]
+    licks = np.array([t for t, key in ino.emitted if key == LICK])
+    highs = np.array([t for t, pin, level in ino.writes
+                      if pin == US and level])
+    # Each reinforced lick is the emitted onset nearest its planned time.
+    n = min(len(pulses), len(highs))
+    nearest = np.abs(licks[:, None] - pulses[:n, 1]).argmin(axis=0) \
+        if len(licks) else np.zeros(0, int)
+    return {
+        "schedule": schedule,
+        "rate": rate,
+        "responses": contingency.responses,
+        "reinforcers": len(pulses),
+        "host_latency": percentiles(pulses[:, 3]),
+        "lick_to_us": percentiles(highs[:n] - licks[nearest]),
+    }
+
+
+def stimulator_configs(scale: float, trials: int) -> Dict[str, tuple]:
+    from pino.config import Config
+
+    base = Config("./config/base.yml").get_experimental()
+    base.update({
+        "us": US,
+        "mean-iti": base["mean-iti"] * scale,
+        "range-iti": base["range-iti"] * scale,
+        "cs-duration": base["cs-duration"] * scale,
+        "trial": trials,
+    })
+    ft = Config("./config/gui/FT.yml").get_experimental()
+    ft.update({"us": US, "interval": ft["interval"] * scale, "trial": trials})
+    # PEAK probe gaps are drawn in whole seconds over a fixed 20 s spread, so
+    # the interval is not scaled and the session is kept short.
+    peak = Config("./config/gui/PEAK.yml").get_experimental()
+    peak.update({"us": US, "interval": 1, "trial": 20})
+    return {
+        "CS-US": ("CS-US", base),
+        "extinction": ("extinction", dict(base, trial=2 * trials)),
+        "FT": ("FT", ft),
+        "PEAK": ("PEAK", peak),
+    }
+
+
+def show(title: str, result: dict) -> None:
+    print(f"== {title}")
+    for key, value in result.items():
+        if isinstance(value, dict):
+            cells = ", ".join(f"{k}={v * 1e3:.3f}ms" if k != "n" else f"n={v}"
+                              for k, v in value.items())
+            print(f"  {key}: {cells}")
+        elif key != "runs":
+            print(f"  {key}: {value}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="claudio pipeline benchmarks on a virtual Arduino")
+    parser.add_argument("--rate", type=float, default=50.)
+    parser.add_argument("--duration", type=float, default=5.)
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--rates",
+                        default="50,100,200,500,1000,2000,4000",
+                        help="lick rates tried when searching the max rate")
+    parser.add_argument("--limit",
+                        type=float,
+                        default=0.05,
+                        help="p99 latency (s) still counted as sustained")
+    parser.add_argument("--schedules", default="CS-US,extinction,FT,PEAK")
+    parser.add_argument("--scale", type=float, default=0.02)
+    parser.add_argument("--trials", type=int, default=50)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--contingencies", default="FR,VI,DRL")
+    args = parser.parse_args()
+
+    results = {}
+    results["latency"] = bench_latency(args.rate, args.duration,
+                                       args.baudrate)
+    show(f"read -> record at {args.rate:g} licks/s", results["latency"])
+    results["max_rate"] = bench_max_rate(
+        [float(r) for r in args.rates.split(",")], args.duration,
+        args.baudrate, args.limit)
+    print("== sustained edge rate: "
+          f"{results['max_rate']['sustained']:.0f} edges/s")
+
+    configs = stimulator_configs(args.scale, args.trials)
+    for name in args.schedules.split(","):
+        schedule, var = configs[name]
+        results[name] = bench_stimulator(schedule, var)
+        show(f"stimulator {name}", results[name])
+
+    for name in args.contingencies.split(","):
+        # DRL needs pauses that a fast licker still makes now and then.
+        var = {"ratio": 5,
+               "interval": 2. / args.rate if name == "DRL" else 0.5}
+        results[name] = bench_contingent(name, var, args.rate, args.duration)
+        show(f"closed loop {name} at {args.rate:g} licks/s", results[name])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
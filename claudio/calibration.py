@@ -0,0 +1,148 @@
+import json
+import os
+from time import perf_counter
+from typing import List, Optional
+
+import numpy as np
+
+from audit import stats
+from clock import ClockSync
+from protocol import MODE_OUTPUT, MODE_SSINPUT_PULLUP, Board, EdgeStream
+
+# Calibration wires the US output back to an input (`loopback` in the
+# config) and times each digital_write three ways: issued on the host, seen
+# on the input by the board, and reported back to the host.
+
+
+class Compensation(object):
+    # Median one-way latencies of a rig, in seconds: `write` from issuing a
+    # command to the pin changing, `report` from an input edge to its frame
+    # reaching the host.
+    def __init__(self, write: float = 0., report: float = 0.) -> None:
+        self.write = write
+        self.report = report
+
+    @classmethod
+    def load(cls, path: str) -> "Compensation":
+        with open(path) as f:
+            table = json.load(f)["compensation"]
+        return cls(table["write"], table["report"])
+
+
+def load_compensation(var: dict) -> Compensation:
+    # No compensation unless `latency-table` names a table written by
+    # calibrate_rig.
+    path = var.get("latency-table")
+    if path is None:
+        return Compensation()
+    return Compensation.load(path)
+
+
+def exchange(board: Board, stream: EdgeStream, until: float,
+             pin: Optional[int] = None) -> Optional[tuple]:
+    # Feeds the stream until `until`, or until an edge on `pin` arrives;
+    # returns that edge's (estimated time, arrival). The port is polled
+    # rather than read with its timeout, so that arrivals are stamped
+    # closely.
+    while perf_counter() < until:
+        waiting = board.conn.in_waiting
+        if not waiting:
+            continue
+        received = perf_counter()
+        events = stream.feed(board.conn.read(waiting), received)
+        if pin is not None:
+            hit = events["time"][np.abs(events["event"]) == pin]
+            if len(hit):
+                return float(hit[0]), received
+    return None
+
+
+def calibrate(board: Board,
+              out_pin: int,
+              in_pin: int,
+              trials: int = 500,
+              interval: float = 0.02,
+              timeout: float = 0.5) -> dict:
+    # Round trips are host-timed and exact; the split into write and report
+    # rests on the clock sync, which takes each ping's delay as half its
+    # round trip.
+    clock = ClockSync()
+    stream = EdgeStream(clock)
+    board.set_pinmode(in_pin, MODE_SSINPUT_PULLUP)
+    board.set_debounce(0.)
+    board.set_bin(0.)
+    board.set_pinmode(out_pin, MODE_OUTPUT)
+    board.digital_write(out_pin, 0)
+    for _ in range(16):
+        board.ping(clock.next_ping())
+        exchange(board, stream, perf_counter() + 0.02)
+    times: List[tuple] = []
+    missed = 0
+    for trial in range(trials):
+        # A ping per trial keeps the fit fresh; its pong is read on the way.
+        board.ping(clock.next_ping())
+        exchange(board, stream, perf_counter() + interval / 2)
+        sent = perf_counter()
+        board.digital_write(out_pin, (trial + 1) % 2)
+        hit = exchange(board, stream, sent + timeout, in_pin)
+        if hit is None:
+            missed += 1
+            continue
+        times.append((sent, *hit))
+    board.digital_write(out_pin, 0)
+    if missed == trials:
+        raise ValueError(f"no edge on pin {in_pin} after writing pin "
+                         f"{out_pin}; is the loopback wired?")
+    sent, edge, arrival = np.array(times).T
+    write = stats(edge - sent)
+    report = stats(arrival - edge)
+    return {
+        "out": out_pin,
+        "in": in_pin,
+        "trials": trials,
+        "missed": missed,
+        "sync_error": clock.error,
+        "round_trip": stats(arrival - sent),
+        "write": write,
+        "report": report,
+        "compensation": {"write": write["p50"], "report": report["p50"]},
+    }
+
+
+def calibrate_rig(config, path: Optional[str] = None) -> dict:
+    from backends import open_hardware
+
+    expvars = config.get_experimental()
+    in_pin = expvars.get("loopback")
+    if in_pin is None:
+        raise ValueError("set `loopback` to the input wired to the US pin")
+    path = path or expvars.get("calibration-table")
+    if path is None:
+        raise ValueError("set `calibration-table` to where the table goes")
+    hardware = open_hardware(config)
+    try:
+        table = calibrate(Board(hardware.com), expvars.get("us", 12), in_pin,
+                          expvars.get("calibration-trials", 500),
+                          expvars.get("calibration-interval", 0.02))
+    finally:
+        hardware.close()
+    table["port"] = hardware.port
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(table, f, indent=1)
+    return table
+
+
+if __name__ == '__main__':
+    import sys
+
+    from pino.config import Config
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "./config/calibration.yml"
+    table = calibrate_rig(Config(path))
+    for key in ("round_trip", "write", "report"):
+        entry = table[key]
+        print(f"{key}: p50 {entry['p50'] * 1e3:.3f} ms, "
+              f"p99 {entry['p99'] * 1e3:.3f} ms, "
+              f"max {entry['max'] * 1e3:.3f} ms")
+    print(f"missed {table['missed']} of {table['trials']}")
@@ -0,0 +1,77 @@
+from collections import deque
+from time import perf_counter
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+WRAP = 1 << 32  # micros() is an unsigned long on AVR
+
+
+class DeviceClock(object):
+    def __init__(self) -> None:
+        self._last: Optional[int] = None
+        self._wraps = 0
+
+    def seconds(self, micros: np.ndarray) -> np.ndarray:
+        # Device stamps reach the host in order, so any big backwards step
+        # means micros() has rolled over (about every 71.6 minutes).
+        if len(micros) == 0:
+            return np.empty(0)
+        stamps = micros.astype(np.int64)
+        prev = np.empty_like(stamps)
+        prev[0] = stamps[0] if self._last is None else self._last
+        prev[1:] = stamps[:-1]
+        wraps = self._wraps + np.cumsum(stamps < prev - WRAP // 2)
+        self._wraps = int(wraps[-1])
+        self._last = int(stamps[-1])
+        return (wraps * WRAP + stamps) * 1e-6
+
+
+class ClockSync(object):
+    def __init__(self, window: int = 32) -> None:
+        self.device = DeviceClock()
+        self.offset = 0.
+        self.drift = 0.
+        self.error = float("nan")
+        self.synced = False
+        self._samples: Deque[Tuple[float, float, float]] = deque(maxlen=window)
+        self._sent: Dict[int, float] = {}
+        self._seq = 0
+
+    def next_ping(self) -> int:
+        seq = self._seq
+        self._seq = (self._seq + 1) & 0xFF
+        self._sent[seq] = perf_counter()
+        return seq
+
+    def pong(self, seq: int, device: float, received: float) -> None:
+        sent = self._sent.pop(seq, None)
+        if sent is None or received < sent:
+            return None
+        half_rtt = (received - sent) / 2
+        self._samples.append((device, sent + half_rtt, half_rtt))
+        self._fit()
+        return None
+
+    def _fit(self) -> None:
+        samples = np.array(self._samples)
+        # Round trips delayed by USB or the OS only blur the estimate, so fit
+        # through the faster half of the exchanges.
+        keep = samples[:, 2] <= np.median(samples[:, 2])
+        device, host, half_rtt = samples[keep].T
+        if len(device) > 2 and np.ptp(device) > 0.:
+            slope, intercept = np.polyfit(device, host, 1)
+            self.drift = slope - 1.
+            self.offset = intercept
+        else:
+            self.drift = 0.
+            self.offset = float(np.mean(host - device))
+        residual = host - (self.offset + (1. + self.drift) * device)
+        self.error = float(half_rtt.min() + np.abs(residual).max())
+        self.synced = True
+
+    def to_host(self, device: np.ndarray,
+                received: float) -> Tuple[np.ndarray, float]:
+        if not self.synced:
+            return np.full(len(device), received), float("nan")
+        return self.offset + (1. + self.drift) * device, self.error
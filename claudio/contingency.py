@@ -0,0 +1,133 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from schedule import TRIAL_DTYPE, compile_schedule
+
+
+class Contingency(ABC):
+    # Decides, one response at a time, whether it is reinforced. Times are
+    # seconds from the session start. With `cue`, the reinforcer is a whole
+    # CS-US trial rather than the US alone.
+    cue = False
+
+    def __init__(self, rng: np.random.Generator) -> None:
+        self.rng = rng
+        self.responses = 0
+
+    def start(self, t: float) -> None:
+        self.deliver(t)
+
+    @abstractmethod
+    def respond(self, t: float) -> bool:
+        ...
+
+    def deliver(self, t: float) -> None:
+        return None
+
+
+class FixedRatio(Contingency):
+    def __init__(self, rng: np.random.Generator, ratio: int) -> None:
+        if ratio < 1:
+            raise ValueError(f"ratio must be at least 1: {ratio}")
+        super().__init__(rng)
+        self.ratio = ratio
+        self.count = 0
+
+    def respond(self, t: float) -> bool:
+        self.responses += 1
+        self.count += 1
+        return self.count >= self.ratio
+
+    def deliver(self, t: float) -> None:
+        self.count = 0
+
+
+class VariableInterval(Contingency):
+    # The first response once an exponentially drawn interval has passed
+    # since the last reinforcer.
+    def __init__(self, rng: np.random.Generator, interval: float) -> None:
+        if interval <= 0.:
+            raise ValueError(f"interval must be positive: {interval}")
+        super().__init__(rng)
+        self.interval = interval
+        self.armed = 0.
+
+    def respond(self, t: float) -> bool:
+        self.responses += 1
+        return t >= self.armed
+
+    def deliver(self, t: float) -> None:
+        self.armed = t + self.rng.exponential(self.interval)
+
+
+class DRL(Contingency):
+    # Differential reinforcement of low rates: a response is reinforced
+    # when at least `interval` has passed since the previous one.
+    def __init__(self, rng: np.random.Generator, interval: float) -> None:
+        if interval <= 0.:
+            raise ValueError(f"interval must be positive: {interval}")
+        super().__init__(rng)
+        self.interval = interval
+        self.last = 0.
+
+    def start(self, t: float) -> None:
+        self.last = t
+
+    def respond(self, t: float) -> bool:
+        self.responses += 1
+        irt, self.last = t - self.last, t
+        return irt >= self.interval
+
+
+class LickTriggered(Contingency):
+    # After an inter-trial interval (mean-iti +- range-iti), the next lick
+    # starts a CS-US trial.
+    cue = True
+
+    def __init__(self, rng: np.random.Generator, mean: float,
+                 spread: float) -> None:
+        super().__init__(rng)
+        self.mean = mean
+        self.spread = spread
+        self.ready = 0.
+
+    def respond(self, t: float) -> bool:
+        self.responses += 1
+        return t >= self.ready
+
+    def deliver(self, t: float) -> None:
+        self.ready = t + self.rng.uniform(self.mean - self.spread,
+                                          self.mean + self.spread)
+
+
+CONTINGENCIES: Dict[str, Callable[[np.random.Generator, dict],
+                                  Contingency]] = {
+    "FR": lambda rng, var: FixedRatio(rng, int(var.get("ratio", 5))),
+    "VI": lambda rng, var: VariableInterval(rng, var.get("interval", 10.)),
+    "DRL": lambda rng, var: DRL(rng, var.get("interval", 10.)),
+    "lick-CS-US": lambda rng, var: LickTriggered(
+        rng, var.get("mean-iti", 30.), var.get("range-iti", 0.)),
+}
+
+
+def open_contingency(var: dict,
+                     default: Optional[str] = None) -> Optional[Contingency]:
+    # None for the open-loop (table) schedules.
+    schedule = var.get("schedule", default)
+    if schedule not in CONTINGENCIES:
+        return None
+    rng = np.random.default_rng(var.get("schedule-seed"))
+    return CONTINGENCIES[schedule](rng, var)
+
+
+def compile_session(var: dict, default: Optional[str] = None
+                    ) -> Tuple[np.ndarray, Optional[Contingency]]:
+    # The trial table and contingency of a session: an empty table and a
+    # contingency for the closed-loop schedules, a compiled table and None
+    # for the rest.
+    contingency = open_contingency(var, default)
+    if contingency is None:
+        return compile_schedule(var, default), None
+    return np.zeros(0, TRIAL_DTYPE), contingency
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import os
+import socket
+import stat
+import traceback
+from time import perf_counter
+from typing import Optional
+
+# Only `serve` imports the session machinery, so that submitting a job from
+# the command line stays quick.
+
+
+def socket_dir() -> str:
+    # Anyone who can connect can run a session on the rig, so the socket
+    # lives where only its user can reach it.
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return runtime
+    path = os.path.join("/tmp", f"claudio-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() \
+            or stat.S_IMODE(info.st_mode) & 0o077:
+        raise ValueError(f"{path} is not a private directory")
+    return path
+
+
+def socket_path(rig: str) -> str:
+    return os.path.join(socket_dir(), f"claudio-{rig}.sock")
+
+
+class Rig(object):
+    # What a daemon keeps open from one session to the next: the board, the
+    # audio engine with its streams, and the synthesized stimuli.
+    def __init__(self, name: str, config) -> None:
+        from audio import AudioEngine
+
+        self.name = name
+        self.config = config
+        expvars = config.get_experimental()
+        self.engine = AudioEngine(expvars.get("audio-backend", "sounddevice"))
+        self.executor = self.open_executor()
+        self.banks: dict = {}
+        self.hardware = None
+        self.open()
+        if expvars.get("speaker") is not None:
+            self.engine.open(expvars.get("speaker"),
+                             expvars.get("samplerate", 48000))
+            self.bank(expvars).from_config(expvars)
+
+    def open(self):
+        from backends import open_hardware
+
+        if self.hardware is None:
+            self.hardware = open_hardware(self.config)
+        return self.hardware
+
+    def open_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        # One blocking serial read, plus headroom for short calls.
+        return ThreadPoolExecutor(max_workers=4, thread_name_prefix=self.name)
+
+    def bank(self, expvars: dict):
+        from stimuli import stimulus_bank
+
+        bank = stimulus_bank(expvars)
+        key = (bank.cache_dir, bank.samplerate)
+        return self.banks.setdefault(key, bank)
+
+    def drain(self) -> None:
+        # Edges and acknowledgements that arrived between sessions.
+        com = self.hardware.com
+        waiting = com.in_waiting
+        if waiting:
+            com.read(waiting)
+        return None
+
+    def release(self, expvars: dict) -> None:
+        # However the session ended, its outputs end LOW; a port that fails
+        # here is reopened for the next job.
+        from backends import release_outputs
+
+        # A session ends with its reader still blocked in a read (up to the
+        # port timeout); it is joined so that it cannot take the next job's
+        # bytes, or race the drain below.
+        self.executor.shutdown(wait=True)
+        self.executor = self.open_executor()
+        if self.hardware is None:
+            return None
+        try:
+            try:
+                release_outputs(self.hardware, expvars)
+            finally:
+                self.drain()
+        except Exception:
+            traceback.print_exc()
+            try:
+                self.hardware.close()
+            except Exception:
+                traceback.print_exc()
+            self.hardware = None
+        return None
+
+    def run(self, job: dict) -> dict:
+        from pino.config import Config
+
+        from contingency import compile_session
+        from multibox import Chamber
+
+        received = perf_counter()
+        config = Config(job["config"])
+        config["Experimental"].update(job.get("experimental", {}))
+        config["Metadata"] = dict(config.get_metadata() or {},
+                                  **job.get("metadata", {}))
+        config["chamber"] = self.name
+        expvars = config.get_experimental()
+        schedule = expvars.get("schedule", job.get("schedule", "CS-US"))
+        table, contingency = compile_session(expvars, schedule)
+        hardware = self.open()
+        self.drain()
+        chamber = None
+        try:
+            chamber = Chamber(self.name, config, table, self.engine,
+                              self.executor, job.get("outdir", "."),
+                              hardware, self.bank(expvars),
+                              job.get("filename"), contingency, schedule)
+            startup = perf_counter() - received
+            chamber.log.log("startup", total=startup, daemon=True)
+            asyncio.run(chamber.hub.run())
+        finally:
+            self.release(expvars)
+            if chamber is not None:
+                chamber.close(hardware=False)
+        return {
+            "ok": True,
+            "filename": chamber.filename,
+            "startup": startup,
+            "report": chamber.report(),
+        }
+
+    def close(self) -> None:
+        if self.hardware is not None:
+            self.hardware.close()
+        self.engine.close()
+        self.executor.shutdown(wait=False)
+        return None
+
+
+def serve(name: str, config_path: str, path: Optional[str] = None) -> None:
+    # Jobs run one at a time, in the order they connect; a failed one is
+    # reported to its client and the daemon carries on.
+    from pino.config import Config
+
+    path = path or socket_path(name)
+    if os.path.lexists(path):
+        # A socket left by a daemon that did not exit cleanly; anything else
+        # at the path is not ours to remove.
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise ValueError(f"{path} exists and is not a socket")
+        os.remove(path)
+    rig = Rig(name, Config(config_path))
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Restrictive from the start: no moment where others may connect.
+    umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    os.chmod(path, 0o600)
+    server.listen()
+    print(f"{name}: ready on {path}")
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("rw") as f:
+                request = json.loads(f.readline() or "{}")
+                if request.get("command") == "stop":
+                    f.write(json.dumps({"ok": True}) + "\n")
+                    break
+                try:
+                    reply = rig.run(request)
+                except Exception as e:
+                    traceback.print_exc()
+                    reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                f.write(json.dumps(reply) + "\n")
+    finally:
+        server.close()
+        os.remove(path)
+        rig.close()
+    return None
+
+
+def submit(name: str, request: dict, path: Optional[str] = None) -> dict:
+    # Blocks until the daemon has run the job (and any queued before it).
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path or socket_path(name))
+    with client, client.makefile("rw") as f:
+        f.write(json.dumps(request) + "\n")
+        f.flush()
+        return json.loads(f.readline())
+
+
+def parse_pairs(pairs: list) -> dict:
+    # key=value, with the value read as JSON where it is valid JSON.
+    parsed = {}
+    for pair in pairs:
+        key, value = pair.split("=", 1)
+        try:
+            parsed[key] = json.loads(value)
+        except ValueError:
+            parsed[key] = value
+    return parsed
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="a resident session runner for one rig")
+    commands = parser.add_subparsers(dest="command", required=True)
+    daemon = commands.add_parser("serve", help="open the rig and wait")
+    daemon.add_argument("rig")
+    daemon.add_argument("config", help="Comport and audio of the rig")
+    job = commands.add_parser("submit", help="run a session on the rig")
+    job.add_argument("rig")
+    job.add_argument("config", help="the session's config file")
+    job.add_argument("--schedule", default="CS-US")
+    job.add_argument("--filename")
+    job.add_argument("--outdir", default=os.getcwd())
+    job.add_argument("--set", nargs="*", default=[],
+                     help="experimental overrides, key=value")
+    job.add_argument("--meta", nargs="*", default=[],
+                     help="metadata, key=value")
+    stop = commands.add_parser("stop", help="close the rig and exit")
+    stop.add_argument("rig")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.rig, args.config)
+    elif args.command == "stop":
+        print(submit(args.rig, {"command": "stop"}))
+    else:
+        reply = submit(args.rig, {
+            "config": os.path.abspath(args.config),
+            "schedule": args.schedule,
+            "filename": args.filename,
+            "outdir": args.outdir,
+            "experimental": parse_pairs(args.set),
+            "metadata": parse_pairs(args.meta),
+        })
+        if reply["ok"]:
+            print(f"{reply['report']} (start-up {reply['startup']:.3f} s)")
+        else:
+            print(reply["error"])
+            sys.exit(1)
@@ -0,0 +1,246 @@
+import asyncio
+import os
+import selectors
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from amas.agent import NotWorkingError
+
+from audio import Cue
+from events import EVENT_DTYPE
+from online import peak_analyzer
+from runtime import Hub, LocalAgent, observer
+from schedule import compile_schedule
+from scheduler import timing_filename
+from session import RECORDER, STIMULATOR, observe, record, stimulate, watch
+from sessionlog import SessionLog
+
+
+class VirtualSelector(selectors.SelectSelector):
+    # Never blocks: a select() that would wait for `timeout` seconds moves
+    # the virtual clock forward by that much instead.
+    def __init__(self) -> None:
+        super().__init__()
+        self.now = 0.
+
+    def select(self, timeout: Optional[float] = None):
+        if timeout is None:
+            raise RuntimeError("dry run stalled: no task is waiting on time")
+        if timeout > 0:
+            # Overshoot by a nanosecond so a timer never lands one float ulp
+            # short of the deadline it was set for.
+            self.now += timeout + 1e-9
+        return super().select(0)
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self) -> None:
+        self.selector = VirtualSelector()
+        super().__init__(self.selector)
+
+    def time(self) -> float:
+        return self.selector.now
+
+
+class SimulatedBoard(object):
+    # Stands in for pino's Arduino: pin writes are logged in virtual time.
+    def __init__(self, loop: VirtualLoop) -> None:
+        self.loop = loop
+        self.modes = {}
+        self.writes: List[Tuple[float, int, int]] = []
+        self.origin: Optional[float] = None
+
+    def set_pinmode(self, pin: int, mode) -> None:
+        self.modes[pin] = mode
+
+    def digital_write(self, pin: int, level) -> None:
+        level = getattr(level, "value", level)
+        self.writes.append((self.loop.time(), pin, int(level)))
+
+    def pulse(self, pin: int, duration: float) -> None:
+        now = self.loop.time()
+        self.writes.append((now, pin, 1))
+        self.writes.append((now + duration, pin, 0))
+
+    def write_pins(self, levels: Dict[int, int]) -> None:
+        for pin, level in levels.items():
+            self.digital_write(pin, level)
+
+    def load_steps(self, pins, at, length) -> None:
+        # The first steps arrive just before start_sequence(), in the same
+        # virtual instant.
+        origin = self.loop.time() if self.origin is None else self.origin
+        for pin, t, duration in zip(pins, at, length):
+            self.writes.append((origin + t, int(pin), 1))
+            self.writes.append((origin + t + duration, int(pin), 0))
+
+    def start_sequence(self) -> None:
+        self.origin = self.loop.time()
+
+    def stop_sequence(self) -> None:
+        return None
+
+
+def virtual_speaker(at: Optional[float] = None) -> Cue:
+    # The CS starts exactly when it was asked to.
+    cue = Cue("cs", at)
+    cue.onset = at
+    return cue
+
+
+def lick_times(rate: float, duration: float, end: float,
+               rng: np.random.Generator) -> np.ndarray:
+    # Poisson licks, each followed by `duration` of contact.
+    if rate <= 0.:
+        return np.zeros(0)
+    n = int(rate * end * 1.5) + 16
+    onsets = np.cumsum(duration + rng.exponential(1. / rate, n))
+    return onsets[onsets < end]
+
+
+def lick_batches(onsets: np.ndarray, pin: int, duration: float,
+                 bounds: np.ndarray, tick: float) -> List[np.ndarray]:
+    # Lick onsets and offsets as events, in one batch per `tick` of virtual
+    # time. A batch never spans a stimulus time in `bounds`, so that sent
+    # at its last offset it still reaches the recorder ahead of the
+    # stimulus, as single licks did.
+    offsets = onsets + duration
+    events = np.zeros(2 * len(onsets), EVENT_DTYPE)
+    events["time"][0::2] = onsets
+    events["time"][1::2] = offsets
+    events["event"][0::2] = pin
+    events["event"][1::2] = -pin
+    segment = np.searchsorted(bounds, offsets, side="right")
+    window = np.floor(offsets / tick)
+    cut = np.flatnonzero((np.diff(segment) != 0) | (np.diff(window) != 0))
+    return np.split(events, 2 * (cut + 1)) if len(onsets) else []
+
+
+async def lick(agent: LocalAgent, batches: List[np.ndarray],
+               clock) -> None:
+    try:
+        for events in batches:
+            remaining = events["time"][-1] - clock()
+            if remaining > 0:
+                await agent.sleep(remaining)
+            agent.send_to(RECORDER, events)
+    except NotWorkingError:
+        pass
+    return None
+
+
+def dry_run(var: dict,
+            filename: str,
+            schedule: Optional[str] = "CS-US",
+            lick_rate: float = 0.,
+            lick_duration: float = 0.03,
+            lick_tick: float = 5.0,
+            seed: Optional[int] = None) -> dict:
+    begin = perf_counter()
+    if seed is not None:
+        var = dict(var, **{"schedule-seed": seed})
+    table = compile_schedule(var, schedule)
+    # The virtual clock lands exactly on each deadline, so there is nothing
+    # to spin for; a spin would never end as virtual time does not pass.
+    var = dict(var, **{"spin-window": 0.})
+    loop = VirtualLoop()
+    board = SimulatedBoard(loop)
+    beep = virtual_speaker if table["cs"].any() else None
+    log = SessionLog(None, console=False)
+    onsets = lick_times(lick_rate, lick_duration, table["us_offset"][-1],
+                        np.random.default_rng(seed))
+
+    stimulator = LocalAgent(STIMULATOR) \
+        .assign_task(stimulate,
+                     ino=board,
+                     beep=beep,
+                     table=table,
+                     var=var,
+                     timing=timing_filename(filename),
+                     log=log,
+                     clock=loop.time) \
+        .assign_task(watch)
+    # The simulated Arduino: licks go straight to the recorder as decoded,
+    # clock-synchronized events, a batch at a time like serial reads.
+    bounds = np.unique(table[["cs_onset", "us_onset", "us_offset"]].tolist())
+    licker = LocalAgent("LICKER") \
+        .assign_task(lick,
+                     batches=lick_batches(onsets, var.get("lick", 7),
+                                          lick_duration, bounds, lick_tick),
+                     clock=loop.time) \
+        .assign_task(watch)
+    analyzer = peak_analyzer(table, var)
+    recorder = LocalAgent(RECORDER) \
+        .assign_task(record,
+                     filename=filename,
+                     var=var,
+                     log=log,
+                     analyzer=analyzer) \
+        .assign_task(watch)
+    watcher = observer().assign_task(observe)
+    hub = Hub([stimulator, licker, recorder, watcher])
+    try:
+        loop.run_until_complete(hub.run())
+    finally:
+        loop.close()
+        log.close()
+    return {
+        "filename": filename,
+        "trials": len(table),
+        "licks": len(onsets),
+        "us": sum(1 for _, pin, level in board.writes if level),
+        "virtual": loop.selector.now,
+        "peak": analyzer and {
+            k: v
+            for k, v in analyzer.snapshot().items() if k != "rates"
+        },
+        "wall": perf_counter() - begin,
+    }
+
+
+def sweep(jobs: List[dict], processes: Optional[int] = None) -> List[dict]:
+    # Each job holds dry_run() keyword arguments.
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(dry_run, **job) for job in jobs]
+        return [f.result() for f in futures]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from pino.config import Config
+
+    parser = argparse.ArgumentParser(
+        description="run a session on a virtual clock and board")
+    parser.add_argument("config", nargs="+")
+    parser.add_argument("--outdir", default="./dryrun")
+    parser.add_argument("--schedule", default="CS-US",
+                        help="preset used when the config has no schedule")
+    parser.add_argument("--lick-rate", type=float, default=0.)
+    parser.add_argument("--seeds", type=int, default=1)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    os.makedirs(args.outdir, exist_ok=True)
+    jobs = []
+    for path in args.config:
+        var = Config(path).get_experimental()
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for seed in range(args.seeds):
+            jobs.append({
+                "var": var,
+                "filename": os.path.join(args.outdir,
+                                         f"{stem}_seed{seed}.csv"),
+                "schedule": args.schedule,
+                "lick_rate": args.lick_rate,
+                "seed": seed,
+            })
+    if len(jobs) == 1:
+        results = [dry_run(**jobs[0])]
+    else:
+        results = sweep(jobs, args.processes)
+    for r in results:
+        print(f"{r['filename']}: {r['trials']} trials, {r['licks']} licks, "
+              f"{r['virtual']:.1f} s virtual in {r['wall'] * 1e3:.1f} ms")
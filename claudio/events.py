@@ -0,0 +1,191 @@
+import os
+import struct
+from typing import Any, Union
+
+import numpy as np
+
+# Version 1 files predate device timestamps and carry no error bound.
+DTYPES = {
+    1: np.dtype([("time", "<f8"), ("event", "<i2")]),
+    2: np.dtype([("time", "<f8"), ("event", "<i2"), ("error", "<f4")]),
+}
+
+MAGIC = b"CLAUDIO\x00"
+VERSION = 2
+EVENT_DTYPE = DTYPES[VERSION]
+CSV_HEADER = "time, event, error\n"
+HEADER = struct.Struct("<8sHH4x")
+HEADER_SIZE = HEADER.size
+
+
+def encode_event(event: Union[int, str, bytes]) -> int:
+    return int(event)
+
+
+class EventBuffer(object):
+    def __init__(self, capacity: int = 1024) -> None:
+        self._records = np.empty(max(capacity, 1), dtype=EVENT_DTYPE)
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def nbytes(self) -> int:
+        return self._records.nbytes
+
+    @property
+    def records(self) -> np.ndarray:
+        return self._records[:self._n]
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._records["time"][:self._n]
+
+    @property
+    def events(self) -> np.ndarray:
+        return self._records["event"][:self._n]
+
+    @property
+    def errors(self) -> np.ndarray:
+        return self._records["error"][:self._n]
+
+    def _reserve(self, n: int) -> None:
+        if n <= len(self._records):
+            return None
+        size = len(self._records)
+        while size < n:
+            size *= 2
+        records = np.empty(size, dtype=EVENT_DTYPE)
+        records[:self._n] = self._records[:self._n]
+        self._records = records
+        return None
+
+    def append(self, t: float, event: Any, error: float = 0.) -> None:
+        if self._n == len(self._records):
+            self._reserve(self._n + 1)
+        self._records[self._n] = (t, encode_event(event), error)
+        self._n += 1
+
+    def extend(self, records: np.ndarray) -> None:
+        n = self._n + len(records)
+        self._reserve(n)
+        self._records[self._n:n] = records
+        self._n = n
+
+    def take(self) -> np.ndarray:
+        records = self._records[:self._n].copy()
+        self._n = 0
+        return records
+
+    def clear(self) -> None:
+        self._n = 0
+
+
+def binary_header() -> bytes:
+    return HEADER.pack(MAGIC, VERSION, EVENT_DTYPE.itemsize)
+
+
+def is_binary(filename: str) -> bool:
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(filename: str) -> np.dtype:
+    with open(filename, "rb") as f:
+        data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f"{filename} is too short for an event file")
+    magic, version, itemsize = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(f"{filename} is not a binary event file")
+    dtype = DTYPES.get(version)
+    if dtype is None or itemsize != dtype.itemsize:
+        raise ValueError(
+            f"unsupported event file: version {version}, itemsize {itemsize}")
+    return dtype
+
+
+def load_binary(filename: str) -> np.ndarray:
+    dtype = read_header(filename)
+    # A torn trailing record (crash mid-write) is ignored, not an error.
+    n = (os.path.getsize(filename) - HEADER_SIZE) // dtype.itemsize
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filename,
+                     dtype=dtype,
+                     mode="r",
+                     offset=HEADER_SIZE,
+                     shape=(n, ))
+
+
+def as_events(records: np.ndarray) -> np.ndarray:
+    if records.dtype == EVENT_DTYPE:
+        return records
+    events = np.zeros(len(records), dtype=EVENT_DTYPE)
+    for name in records.dtype.names:
+        events[name] = records[name]
+    return events
+
+
+def write_binary(filename: str, records: np.ndarray) -> None:
+    with open(filename, "wb") as f:
+        f.write(binary_header())
+        f.write(np.ascontiguousarray(as_events(records)).tobytes())
+    return None
+
+
+def format_rows(records: np.ndarray) -> str:
+    return "".join([
+        f"{t}, {e}, {err:.6g}\n" for t, e, err in zip(
+            records["time"].tolist(), records["event"].tolist(),
+            records["error"].tolist())
+    ])
+
+
+def load_csv(filename: str) -> np.ndarray:
+    with open(filename) as f:
+        columns = len(f.readline().split(","))
+    # "time, event" files written before device timestamps have no error.
+    dtype = DTYPES[1] if columns < 3 else EVENT_DTYPE
+    return as_events(
+        np.loadtxt(filename,
+                   delimiter=",",
+                   skiprows=1,
+                   usecols=tuple(range(len(dtype))),
+                   dtype=dtype,
+                   ndmin=1))
+
+
+def write_csv(filename: str, records: np.ndarray) -> None:
+    with open(filename, "w") as f:
+        f.write(CSV_HEADER)
+        f.write(format_rows(as_events(records)))
+    return None
+
+
+def load_events(filename: str) -> np.ndarray:
+    if is_binary(filename):
+        return load_binary(filename)
+    return load_csv(filename)
+
+
+def csv_to_binary(src: str, dst: str) -> None:
+    write_binary(dst, load_csv(src))
+
+
+def binary_to_csv(src: str, dst: str) -> None:
+    write_csv(dst, load_binary(src))
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 3:
+        print("usage: events.py SRC DST  (converts between .csv and .bin)")
+        sys.exit(1)
+    src, dst = sys.argv[1:]
+    if is_binary(src):
+        binary_to_csv(src, dst)
+    else:
+        csv_to_binary(src, dst)
@@ -0,0 +1,95 @@
+import glob
+import hashlib
+import os
+from time import perf_counter, sleep
+from typing import Optional
+
+from protocol import VERSION, Board, FrameDecoder
+
+# Written next to the sketch before every upload; proto.ino reports the hash
+# in it when asked with HELLO.
+HEADER = "build_hash.h"
+SOURCES = ("*.ino", "*.h", "*.c", "*.cpp")
+
+
+def build_hash(dotino: str) -> int:
+    # Of every source in the sketch's folder, so that a change to edges.h
+    # counts too. 0 is what an unstamped build reports.
+    folder = os.path.dirname(os.path.abspath(dotino))
+    paths = sorted(path for pattern in SOURCES
+                   for path in glob.glob(os.path.join(folder, pattern))
+                   if os.path.basename(path) != HEADER)
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return int.from_bytes(digest.digest()[:4], "little") or 1
+
+
+def stamp_sketch(dotino: str) -> int:
+    # The header is rewritten only when the sources changed, so that an
+    # unchanged sketch is not rebuilt.
+    build = build_hash(dotino)
+    header = os.path.join(os.path.dirname(os.path.abspath(dotino)), HEADER)
+    text = f"#define BUILD_HASH 0x{build:08X}UL\n"
+    if os.path.exists(header):
+        with open(header) as f:
+            if f.read() == text:
+                return build
+    with open(header, "w") as f:
+        f.write(text)
+    return build
+
+
+def wait_ready(board: Board,
+               timeout: float = 3.0,
+               interval: float = 0.05) -> Optional[int]:
+    # HELLO until the board answers (it may still be in its bootloader
+    # after the port opened), returning the build hash it reports; None if
+    # it never does.
+    decoder = FrameDecoder()
+    end = perf_counter() + timeout
+    seq = 0
+    while perf_counter() < end:
+        board.hello(seq)
+        sleep(interval)
+        waiting = board.conn.in_waiting
+        if waiting:
+            frames = decoder.feed(board.conn.read(waiting))
+            hello = frames[(frames["type"] == VERSION)
+                           & (frames["key"] == seq)]
+            if len(hello):
+                return int(hello["micros"][0])
+        seq = (seq + 1) & 0xFF
+    return None
+
+
+def open_comport(settings: dict, timeout: float = 2.0,
+                 ready: float = 3.0):
+    # pino's Comport, uploading the sketch only when the board does not
+    # already run this build, and probed for readiness instead of sleeping
+    # for `warmup`.
+    from pino.ino import Comport
+
+    from backends import STARTUP
+
+    build = stamp_sketch(settings["dotino"])
+    settings = dict(settings, warmup=0.)
+    com = Comport() \
+        .apply_settings(settings) \
+        .set_timeout(timeout) \
+        .connect()
+    if wait_ready(Board(com), ready) == build:
+        return com
+    com.disconnect()
+    com = Comport() \
+        .apply_settings(settings) \
+        .set_timeout(timeout) \
+        .deploy() \
+        .connect()
+    if wait_ready(Board(com), ready) != build:
+        raise RuntimeError(f"the board on {settings.get('port')} does not "
+                           f"report build {build:08X} after the upload")
+    STARTUP.mark("upload")
+    return com
@@ -1,13 +1,15 @@
 if __name__ == '__main__':
-    from pino.ino import HIGH, LOW, Arduino, Comport, OUTPUT
+    from pino.ino import HIGH, LOW, Arduino, OUTPUT
     from pino.config import Config
 
+    from firmware import open_comport
+
     config = Config("./config/flush.yml")
     expvars = config.get_experimental()
 
     SOLENOID = expvars.get("solenoid")
 
-    com = Comport().apply_settings(config.get_comport()).deploy().connect()
+    com = open_comport(config.get_comport())
     ino = Arduino(com)
 
     ino.set_pinmode(SOLENOID, OUTPUT)
@@ -0,0 +1,179 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audit import Histogram
+from calibration import load_compensation
+from clock import ClockSync
+from events import EVENT_DTYPE
+from protocol import PULSE_EVENT, Board, EdgeStream
+
+# Ring header: u64 counters, padded to a cache line. Only the producer
+# writes WRITE/OVERFLOW/PEAK/DROPPED/SYNCED/DONE and only the consumer
+# writes READ/STOP, so the ring needs no lock (single producer, single
+# consumer). STOP asks the producer to finish; DONE follows its last write.
+WRITE, READ, OVERFLOW, PEAK, DROPPED, SYNCED, STOP, DONE = range(8)
+HEAD_SIZE = 64
+
+
+class SharedRing(object):
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int,
+                 owner: bool) -> None:
+        self.shm = shm
+        self.capacity = capacity
+        self.owner = owner
+        self.head = np.ndarray(HEAD_SIZE // 8, np.uint64, shm.buf)
+        self.records = np.ndarray(capacity, EVENT_DTYPE, shm.buf, HEAD_SIZE)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, capacity: int = 1 << 16) -> "SharedRing":
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=HEAD_SIZE +
+                                         capacity * EVENT_DTYPE.itemsize)
+        ring = cls(shm, capacity, True)
+        ring.head[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, capacity: int) -> "SharedRing":
+        return cls(shared_memory.SharedMemory(name=name), capacity, False)
+
+    def write(self, events: np.ndarray) -> int:
+        w, r = int(self.head[WRITE]), int(self.head[READ])
+        free = self.capacity - (w - r)
+        n = len(events)
+        if n > free:
+            # Never block the serial side: count what does not fit.
+            self.head[OVERFLOW] += n - free
+            n = free
+        i = w % self.capacity
+        first = min(n, self.capacity - i)
+        self.records[i:i + first] = events[:first]
+        self.records[:n - first] = events[first:n]
+        self.head[WRITE] = w + n
+        self.head[PEAK] = max(int(self.head[PEAK]), w + n - r)
+        return n
+
+    def peek(self) -> List[np.ndarray]:
+        # Views straight into shared memory; valid until advance().
+        w, r = int(self.head[WRITE]), int(self.head[READ])
+        if w == r:
+            return []
+        i, j = r % self.capacity, w % self.capacity
+        if i < j:
+            return [self.records[i:j]]
+        return [self.records[i:], self.records[:j]]
+
+    def advance(self, n: int) -> None:
+        self.head[READ] += n
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            "written": int(self.head[WRITE]),
+            "read": int(self.head[READ]),
+            "overflow": int(self.head[OVERFLOW]),
+            "peak": int(self.head[PEAK]),
+            "dropped_frames": int(self.head[DROPPED]),
+            "synced": int(self.head[SYNCED]),
+        }
+
+    def close(self) -> None:
+        del self.head, self.records
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def drain(ring: SharedRing,
+          writer,
+          lick: Optional[int] = None,
+          analyzer=None) -> Tuple[int, int]:
+    n, licks = 0, 0
+    for view in ring.peek():
+        writer.extend(view)
+        n += len(view)
+        if lick is not None:
+            licks += int(np.count_nonzero(view["event"] == lick))
+        if analyzer is not None:
+            analyzer.feed(view["time"], view["event"])
+    ring.advance(n)
+    return n, licks
+
+
+def run_ingest(path: str,
+               name: str,
+               capacity: int,
+               var: dict,
+               stop,
+               latency: Optional[str] = None) -> None:
+    from ttyport import TtyPort
+
+    ring = SharedRing.attach(name, capacity)
+    port = TtyPort(path, timeout=0.05)
+    board = Board(port)
+    clock = ClockSync()
+    stream = EdgeStream(clock, var.get("edge-bin", 0.),
+                        load_compensation(var).report)
+    arrival = Histogram()
+    interval = var.get("sync-interval", 1.0)
+    burst = var.get("sync-burst", 8)
+    next_ping = perf_counter()
+    try:
+        while not stop.is_set() and not ring.head[STOP]:
+            now = perf_counter()
+            if now >= next_ping:
+                board.ping(clock.next_ping())
+                burst -= 1
+                next_ping = now + (0.05 if burst > 0 else interval)
+            chunk, received = board.read_chunk()
+            if chunk:
+                events = stream.feed(chunk, received)
+                if len(events):
+                    ring.write(events)
+                    if clock.synced:
+                        edges = np.abs(events["event"]) < PULSE_EVENT
+                        arrival.add(received - events["time"][edges])
+                ring.head[DROPPED] = stream.decoder.dropped
+                ring.head[SYNCED] = int(clock.synced)
+    finally:
+        port.close()
+        ring.head[DONE] = 1
+        ring.close()
+        if latency is not None:
+            arrival.save(latency)
+
+
+class IngestProcess(object):
+    def __init__(self,
+                 path: str,
+                 var: dict,
+                 capacity: Optional[int] = None,
+                 latency: Optional[str] = None) -> None:
+        self.capacity = capacity or var.get("ingest-capacity", 1 << 16)
+        self.ring = SharedRing.create(self.capacity)
+        self._stop = mp.Event()
+        self._process = mp.Process(target=run_ingest,
+                                   args=(path, self.ring.name, self.capacity,
+                                         var, self._stop, latency),
+                                   name="claudio-ingest",
+                                   daemon=True)
+
+    def start(self) -> "IngestProcess":
+        self._process.start()
+        return self
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        self._process.join(timeout=2.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        counters = self.ring.counters()
+        self.ring.close()
+        return counters
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from archive import open_archive
+from audio import AudioEngine
+from audit import latency_filename, write_audit
+from backends import open_hardware, release_outputs
+from calibration import load_compensation
+from clock import ClockSync
+from contingency import Contingency, compile_session
+from protocol import Board
+from recorder import record_filename
+from online import peak_analyzer
+from runtime import Hub, LocalAgent, observer
+from scheduler import timing_filename
+from session import (READER, RECORDER, STIMULATOR, observe, read, record,
+                     respond, set_speaker, stimulate, synchronize, watch)
+from sessionlog import SessionLog, log_filename
+from stimuli import StimulusBank, stimulus_bank
+
+BOX2PORT = "./config/gui/box2port.yml"
+
+
+class Chamber(object):
+    def __init__(self, box: str, config, table: np.ndarray,
+                 engine: AudioEngine, executor: ThreadPoolExecutor,
+                 outdir: str, hardware=None,
+                 bank: Optional[StimulusBank] = None,
+                 filename: Optional[str] = None,
+                 contingency: Optional[Contingency] = None,
+                 schedule: Optional[str] = None) -> None:
+        # `hardware` and `bank` are passed in when they outlive the session
+        # (daemon.py); otherwise the chamber opens its own. With a
+        # contingency, `table` is empty and the stimulator responds to the
+        # licks forwarded by the reader.
+        self.box = box
+        self.config = config
+        self.expvars = config.get_experimental()
+        meta = config.get_metadata() or {}
+
+        now = datetime.now().strftime("%y-%m-%d-%H-%M")
+        sub = meta.get("subject")
+        cond = meta.get("condition")
+        self.filename = os.path.join(
+            outdir, filename or f"{now}_{box}_{sub}_{cond}.csv")
+
+        self.hardware = open_hardware(config) if hardware is None \
+            else hardware
+        self.hardware.setup(self.expvars.get("us"), self.expvars.get("lick"),
+                            self.expvars.get("edge-debounce", 0.),
+                            self.expvars.get("edge-bin", 0.),
+                            self.expvars.get("cs-pin"))
+
+        beep = None
+        cued = contingency is not None and contingency.cue \
+            and self.expvars.get("cs-pin") is None
+        if table["cs"].any() or cued:
+            stream = engine.open(self.expvars.get("speaker"),
+                                 self.expvars.get("samplerate", 48000))
+            bank = bank or stimulus_bank(self.expvars)
+            beep = set_speaker(stream, bank.from_config(self.expvars),
+                               f"cs-{box}")
+
+        board = Board(self.hardware.com)
+        clock = ClockSync()
+        self.log = SessionLog(log_filename(self.filename), console=False)
+        self.analyzer = peak_analyzer(table, self.expvars)
+        self.table = table
+        self.archive = open_archive(self.expvars)
+        if self.archive is not None:
+            self.entry = self.archive.register(
+                record_filename(self.filename, self.expvars), self.expvars,
+                meta, box, schedule)
+        stimulator = LocalAgent(STIMULATOR)
+        if contingency is None:
+            stimulator.assign_task(stimulate,
+                                   ino=self.hardware,
+                                   beep=beep,
+                                   table=table,
+                                   var=self.expvars,
+                                   timing=timing_filename(self.filename),
+                                   log=self.log)
+        else:
+            stimulator.assign_task(respond,
+                                   ino=self.hardware,
+                                   beep=beep,
+                                   contingency=contingency,
+                                   var=self.expvars,
+                                   timing=timing_filename(self.filename),
+                                   log=self.log)
+        stimulator.assign_task(watch)
+        forward = None if contingency is None else self.expvars.get("lick")
+        reader = LocalAgent(READER) \
+            .assign_task(read,
+                         board=board,
+                         clock=clock,
+                         bin_width=self.expvars.get("edge-bin", 0.),
+                         latency=latency_filename(self.filename),
+                         forward=forward,
+                         report=load_compensation(self.expvars).report) \
+            .assign_task(synchronize,
+                         board=board,
+                         clock=clock,
+                         var=self.expvars) \
+            .assign_task(watch)
+        recorder = LocalAgent(RECORDER) \
+            .assign_task(record,
+                         filename=self.filename,
+                         var=self.expvars,
+                         log=self.log,
+                         analyzer=self.analyzer) \
+            .assign_task(watch)
+        watcher = observer().assign_task(observe)
+        self.hub = Hub([stimulator, reader, recorder, watcher], executor)
+
+    def audit(self) -> None:
+        if self.expvars.get("timing-audit", True):
+            write_audit(self.filename, self.expvars,
+                        record_filename(self.filename, self.expvars))
+        return None
+
+    def archive_session(self) -> None:
+        if self.archive is not None:
+            self.archive.complete(self.entry,
+                                  record_filename(self.filename,
+                                                  self.expvars), self.table,
+                                  self.expvars.get("lick"),
+                                  self.expvars.get("us"))
+            self.archive.close()
+        return None
+
+    def close(self, hardware: bool = True) -> None:
+        # Every step is tried, and a failing one printed rather than raised,
+        # so that it cannot mask the error that ended the session. With
+        # `hardware` False the board is the caller's to release and close.
+        steps = [self.log.close, self.audit, self.archive_session]
+        if hardware:
+            steps = [lambda: release_outputs(self.hardware, self.expvars),
+                     self.hardware.close] + steps
+        for step in steps:
+            try:
+                step()
+            except Exception:
+                traceback.print_exc()
+        return None
+
+    def report(self) -> str:
+        timing = np.loadtxt(timing_filename(self.filename),
+                            delimiter=",",
+                            skiprows=1,
+                            ndmin=2)
+        if len(timing) == 0:
+            return f"{self.box}: no stimuli delivered"
+        late = timing[:, 3] * 1e3
+        p50, p99 = np.percentile(late, [50, 99])
+        report = (f"{self.box}: {len(late)} stimuli, lateness p50 "
+                  f"{p50:.3f} ms, p99 {p99:.3f} ms, max {late.max():.3f} ms")
+        if self.analyzer is not None:
+            peak = self.analyzer.snapshot()
+            report += (f", peak {peak['peak_time']:g} s at "
+                       f"{peak['peak_rate']:.2f} licks/s")
+        return report
+
+
+def load_chamber_config(box: str, path: str):
+    from pino.config import Config
+
+    ports = Config(BOX2PORT).get_metadata()
+    if box not in ports:
+        raise ValueError(f"{box} is not listed in {BOX2PORT}")
+    config = Config(path)
+    config["Comport"]["port"] = ports[box]
+    config["chamber"] = box
+    return config
+
+
+def run_chambers(pairs: List[Tuple[str, str]], outdir: str = ".") -> None:
+    configs = [(box, load_chamber_config(box, path)) for box, path in pairs]
+    # Compile every schedule before any serial port is opened. Configs with
+    # a `schedule` key are FT/PEAK or closed-loop, the rest are CS-US.
+    schedules = {
+        box: config.get_experimental().get("schedule", "CS-US")
+        for box, config in configs
+    }
+    plans = {
+        box: compile_session(config.get_experimental(), schedules[box])
+        for box, config in configs
+    }
+    backend = configs[0][1].get_experimental().get("audio-backend",
+                                                   "sounddevice")
+    engine = AudioEngine(backend)
+    # One blocking serial read per chamber, plus headroom for short calls.
+    executor = ThreadPoolExecutor(max_workers=2 * len(pairs) + 2,
+                                  thread_name_prefix="chamber")
+    chambers: Dict[str, Chamber] = {}
+    try:
+        for box, config in configs:
+            table, contingency = plans[box]
+            chambers[box] = Chamber(box, config, table, engine, executor,
+                                    outdir, contingency=contingency,
+                                    schedule=schedules[box])
+
+        async def run_all() -> None:
+            await asyncio.gather(*[c.hub.run() for c in chambers.values()])
+
+        asyncio.run(run_all())
+    finally:
+        try:
+            for chamber in chambers.values():
+                chamber.close()
+        finally:
+            engine.close()
+            executor.shutdown(wait=False)
+    for chamber in chambers.values():
+        print(chamber.report())
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2:
+        print("usage: multibox.py BOX=CONFIG [BOX=CONFIG ...]")
+        print("  e.g. multibox.py Box_1=config/gui/FT.yml "
+              "Box_2=config/gui/PEAK.yml")
+        sys.exit(1)
+    run_chambers([tuple(arg.split("=", 1)) for arg in sys.argv[1:]])
@@ -0,0 +1,139 @@
+from typing import Iterable, Optional
+
+import numpy as np
+
+from schedule import CS
+
+
+class PeakAnalyzer(object):
+    # Lick-rate histograms aligned to the start of each trial, kept apart
+    # for probe and ordinary trials. A lick costs one bin increment; the
+    # per-bin work happens once per trial, when the trial closes.
+    def __init__(self,
+                 lick: int,
+                 marks: Iterable[int],
+                 probes: Optional[np.ndarray] = None,
+                 bin_width: float = 1.0,
+                 span: float = 60.0,
+                 debounce: float = 0.02) -> None:
+        self.lick = lick
+        self.marks = frozenset(marks)
+        self.probes = probes
+        self.bin_width = bin_width
+        self.nbins = int(np.ceil(span / bin_width))
+        self.debounce = debounce
+        # Counts of the trial in progress, then totals and exposure (number
+        # of trials that lasted into each bin) per kind of trial.
+        self._current = np.zeros(self.nbins, dtype=np.int64)
+        self.counts = np.zeros((2, self.nbins), dtype=np.int64)
+        self.exposure = np.zeros((2, self.nbins), dtype=np.int64)
+        self.trials = 0
+        self.probe_trials = 0
+        self.licks = 0
+        self.bounced = 0
+        self.outside = 0
+        self._start: Optional[float] = None
+        self._last_lick = -np.inf
+        self._snapshot = self._summarize()
+
+    @classmethod
+    def from_table(cls, table: np.ndarray, var: dict) -> "PeakAnalyzer":
+        us = var.get("us", 12)
+        # Trials start at the session start (event 0), after each US and
+        # after each omitted US; with peak-align: cs, at the CS instead.
+        marks = [CS] if var.get("peak-align") == "cs" else [0, us, -us]
+        # Licks the board already debounced (or binned, several to a
+        # timestamp) are taken as they come.
+        on_board = var.get("edge-debounce", 0.) or var.get("edge-bin", 0.)
+        return cls(var.get("lick"),
+                   marks,
+                   table["probe"],
+                   var.get("peak-bin", 1.0),
+                   var.get("peak-span", 60.0),
+                   var.get("lick-debounce", 0. if on_board else 0.02))
+
+    def push(self, t: float, event: int) -> bool:
+        # True when a trial was closed and the snapshot changed.
+        if event == self.lick:
+            if t - self._last_lick < self.debounce:
+                self.bounced += 1
+                return False
+            self._last_lick = t
+            if self._start is None:
+                return False
+            i = int((t - self._start) / self.bin_width)
+            if 0 <= i < self.nbins:
+                self._current[i] += 1
+                self.licks += 1
+            else:
+                # Beyond the span, or stamped just before the mark that
+                # arrived ahead of it.
+                self.outside += 1
+            return False
+        if event in self.marks:
+            closed = self._start is not None
+            if closed:
+                self._close(t)
+            self._start = t
+            return closed
+        return False
+
+    def feed(self, times: np.ndarray, events: np.ndarray) -> bool:
+        closed = False
+        for t, event in zip(times.tolist(), events.tolist()):
+            closed |= self.push(t, event)
+        return closed
+
+    def _close(self, t: float) -> None:
+        probe = 0
+        if self.probes is not None and self.trials < len(self.probes):
+            probe = int(self.probes[self.trials])
+        covered = min(int(np.ceil((t - self._start) / self.bin_width)),
+                      self.nbins)
+        self.counts[probe] += self._current
+        self.exposure[probe, :covered] += 1
+        self._current[:] = 0
+        self.trials += 1
+        self.probe_trials += probe
+        self._snapshot = self._summarize()
+
+    def rates(self) -> np.ndarray:
+        # Licks/s per bin, NaN where no trial lasted that long.
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.exposure > 0,
+                            self.counts / (self.exposure * self.bin_width),
+                            np.nan)
+
+    def _summarize(self) -> dict:
+        rates = self.rates()
+        peak = rates[1] if self.probe_trials else rates[0]
+        if np.isnan(peak).all():
+            peak_time, peak_rate = np.nan, np.nan
+        else:
+            # A three-bin moving average keeps one noisy bin from winning.
+            smooth = np.convolve(np.nan_to_num(peak), np.ones(3) / 3, "same")
+            i = int(np.argmax(smooth))
+            peak_time = (i + 0.5) * self.bin_width
+            peak_rate = float(smooth[i])
+        return {
+            "trials": self.trials,
+            "probe_trials": self.probe_trials,
+            "licks": self.licks,
+            "bounced": self.bounced,
+            "outside": self.outside,
+            "peak_time": peak_time,
+            "peak_rate": peak_rate,
+            "rates": rates,
+        }
+
+    def snapshot(self) -> dict:
+        # Rebuilt once per trial; polling it costs nothing.
+        return self._snapshot
+
+
+def peak_analyzer(table: np.ndarray, var: dict) -> Optional[PeakAnalyzer]:
+    # Only PEAK-like schedules, with probe trials, are analysed online
+    # unless asked for.
+    if not (table["probe"].any() or var.get("online-peak", False)):
+        return None
+    return PeakAnalyzer.from_table(table, var)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from backends import STARTUP, frontend
+from contingency import CONTINGENCIES, open_contingency
+from schedule import TRIAL_DTYPE
+from session import run_session
+
+# FR, VI, DRL or lick-CS-US, taken from the `schedule` key of the config.
+SCHEDULE = None
+
+if __name__ == '__main__':
+    STARTUP.mark("import")
+    ui = frontend("gui")
+    config = ui.config('./config/operant/*.yml')
+    expvars = config.get_experimental()
+    contingency = open_contingency(expvars, SCHEDULE)
+    if contingency is None:
+        raise ValueError(f"not a closed-loop schedule: "
+                         f"{expvars.get('schedule', SCHEDULE)} "
+                         f"(one of {', '.join(CONTINGENCIES)})")
+    STARTUP.mark("config")
+    filename = ui.filename(config, __file__)
+    STARTUP.mark("filename")
+
+    run_session(config, filename, np.zeros(0, TRIAL_DTYPE),
+                expvars.get("schedule", SCHEDULE), contingency)
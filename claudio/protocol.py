@@ -0,0 +1,291 @@
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from clock import ClockSync
+from events import EVENT_DTYPE
+
+# Command bytes understood by ino/proto.ino. Every command is followed by a
+# pin byte; some take a further argument.
+MODE_INPUT = 0x00
+MODE_INPUT_PULLUP = 0x01
+MODE_OUTPUT = 0x02
+MODE_SERVO = 0x03
+MODE_SSINPUT = 0x04
+MODE_SSINPUT_PULLUP = 0x05
+WRITE_LOW = 0x10
+WRITE_HIGH = 0x11
+ANALOG_WRITE = 0x12
+SERVO_WRITE = 0x13
+PULSE = 0x14  # pin, then the duration in micros (uint32 LE)
+WRITE_MASK = 0x15  # port, then mask and value bytes
+SEQ_STEP = 0x40  # pin, then start and length in micros (uint32 LE each)
+SEQ_START = 0x41
+SEQ_STOP = 0x42
+SET_DEBOUNCE = 0x50  # 0, then micros (uint32 LE) an input must hold
+SET_BIN = 0x51  # 0, then the bin width in micros; 0 reports every edge
+DIGITAL_READ = 0x20
+ANALOG_READ = 0x21
+PING = 0x30
+HELLO = 0x31  # answered with a VERSION frame
+
+ARGUMENTS = {
+    ANALOG_WRITE: 1,
+    SERVO_WRITE: 1,
+    PULSE: 4,
+    WRITE_MASK: 2,
+    SEQ_STEP: 8,
+    SET_DEBOUNCE: 4,
+    SET_BIN: 4,
+}
+STEP_DTYPE = np.dtype([("command", "u1"), ("pin", "u1"), ("at", "<u4"),
+                       ("length", "<u4")])
+SEQUENCE_SLOTS = 32  # SEQ_MAX in proto.ino
+
+# Output ports of the ATmega328: pins 0-7 are PORTD, 8-13 PORTB.
+PORT_D = 0
+PORT_B = 1
+
+# Frames sent by the board: SYNC, type, count, count records, XOR checksum of
+# everything after SYNC.
+SYNC = 0xA5
+EDGE = 0x01
+PONG = 0x02
+PULSE_ACK = 0x03
+MASK_ACK = 0x04
+SEQUENCE_ACK = 0x05
+COUNT = 0x06
+VERSION = 0x07  # key echoes HELLO's byte, the stamp is the build hash
+KINDS = (EDGE, PONG, PULSE_ACK, MASK_ACK, SEQUENCE_ACK, COUNT, VERSION)
+FRAME_HEAD = 3
+RECORD_DTYPE = np.dtype([("key", "i1"), ("micros", "<u4")])
+RECORD_SIZE = RECORD_DTYPE.itemsize
+MAX_RECORDS = 12
+FRAME_DTYPE = np.dtype([("type", "u1"), ("key", "i2"), ("micros", "<u4")])
+# Indexed by frame type, then by record count.
+KNOWN_KIND = np.isin(np.arange(256), KINDS)
+KNOWN_COUNT = (np.arange(256) > 0) & (np.arange(256) <= MAX_RECORDS)
+
+# Acknowledged outputs, as recorded events: a pulse on `pin` starts at
+# PULSE_EVENT + pin and ends at -(PULSE_EVENT + pin); a mask write is
+# MASK_EVENT + port. A sequence reports SEQUENCE_EVENT when it starts, + 1
+# when it stops and - 1 for each step that found the buffer full.
+PULSE_EVENT = 200
+MASK_EVENT = 300
+SEQUENCE_EVENT = 400
+
+
+def to_micros(seconds: float) -> bytes:
+    micros = min(max(int(round(seconds * 1e6)), 0), 0xFFFFFFFF)
+    return micros.to_bytes(4, "little")
+
+
+def port_of(pin: int) -> Tuple[int, int]:
+    if 0 <= pin < 8:
+        return PORT_D, pin
+    if 8 <= pin < 14:
+        return PORT_B, pin - 8
+    raise ValueError(f"pin {pin} is on no output port")
+
+
+class Board(object):
+    def __init__(self, conn) -> None:
+        self.conn = conn
+
+    def send(self, command: int, pin: int, *args: int) -> None:
+        self.conn.write(bytes([command, pin, *args]))
+
+    def set_pinmode(self, pin: int, mode: int) -> None:
+        self.send(mode, pin)
+
+    def digital_write(self, pin: int, level) -> None:
+        # Accepts pino's HIGH/LOW as well as plain 0/1.
+        level = getattr(level, "value", level)
+        self.send(WRITE_HIGH if level else WRITE_LOW, pin)
+
+    def pulse(self, pin: int, duration: float) -> None:
+        # HIGH now, LOW after `duration` seconds, timed by the board.
+        self.send(PULSE, pin, *to_micros(duration))
+
+    def write_mask(self, port: int, mask: int, value: int) -> None:
+        self.send(WRITE_MASK, port, mask & 0xFF, value & 0xFF)
+
+    def write_pins(self, levels: Dict[int, int]) -> None:
+        # Pins sharing a port change in the same instant.
+        masks: Dict[int, List[int]] = {}
+        for pin, level in levels.items():
+            port, bit = port_of(pin)
+            mask, value = masks.setdefault(port, [0, 0])
+            masks[port] = [mask | 1 << bit, value | bool(level) << bit]
+        for port, (mask, value) in sorted(masks.items()):
+            self.write_mask(port, mask, value)
+
+    def load_steps(self, pins: np.ndarray, at: np.ndarray,
+                   length: np.ndarray) -> None:
+        # Pulses of `length` seconds, `at` seconds after start_sequence(),
+        # in one write.
+        steps = np.empty(len(pins), STEP_DTYPE)
+        steps["command"] = SEQ_STEP
+        steps["pin"] = pins
+        steps["at"] = np.round(np.asarray(at) * 1e6).astype(np.int64) \
+            & 0xFFFFFFFF
+        steps["length"] = np.round(np.asarray(length) * 1e6)
+        self.conn.write(steps.tobytes())
+
+    def start_sequence(self) -> None:
+        self.send(SEQ_START, 0)
+
+    def stop_sequence(self) -> None:
+        self.send(SEQ_STOP, 0)
+
+    def set_debounce(self, seconds: float) -> None:
+        self.send(SET_DEBOUNCE, 0, *to_micros(seconds))
+
+    def set_bin(self, seconds: float) -> None:
+        self.send(SET_BIN, 0, *to_micros(seconds))
+
+    def ping(self, seq: int) -> None:
+        self.send(PING, seq & 0xFF)
+
+    def hello(self, seq: int) -> None:
+        self.send(HELLO, seq & 0xFF)
+
+    def read_chunk(self) -> Tuple[bytes, float]:
+        # Block (up to the port timeout) for the first byte, then take
+        # whatever else has already arrived.
+        head = self.conn.read(1)
+        received = perf_counter()
+        waiting = self.conn.in_waiting
+        if waiting:
+            return head + self.conn.read(waiting), perf_counter()
+        return head, received
+
+
+def encode_frame(kind: int, records: List[Tuple[int, int]]) -> bytes:
+    payload = np.array(records, dtype=RECORD_DTYPE).tobytes()
+    body = bytes([kind, len(records)]) + payload
+    checksum = 0
+    for b in body:
+        checksum ^= b
+    return bytes([SYNC]) + body + bytes([checksum])
+
+
+class FrameDecoder(object):
+    def __init__(self) -> None:
+        self._rest = b""
+        self.dropped = 0
+
+    def feed(self, chunk: bytes) -> np.ndarray:
+        data = np.frombuffer(self._rest + chunk, np.uint8)
+        n = len(data)
+        # Every SYNC is a candidate frame, all read at once. A frame's
+        # bytes after SYNC, checksum included, XOR to zero, so it is intact
+        # when the running XOR is the same at its SYNC and at its end.
+        start = np.flatnonzero(data == SYNC)
+        kind = data[np.minimum(start + 1, n - 1)]
+        count = data[np.minimum(start + 2, n - 1)].astype(np.intp)
+        end = start + FRAME_HEAD + count * RECORD_SIZE + 1
+        headed = n - start >= FRAME_HEAD
+        valid = headed & KNOWN_KIND[kind] & KNOWN_COUNT[count]
+        # Cut short by the end of the chunk: kept for the next one.
+        pending = ~headed | (valid & (end > n))
+        xor = np.bitwise_xor.accumulate(data)
+        ok = valid & ~pending & (xor[np.minimum(end, n) - 1] == xor[start])
+        accepted = ok
+        if np.any(start[ok][1:] < end[ok][:-1]):
+            # A SYNC inside one good frame opens another: only the first
+            # counts, as in a byte-by-byte read.
+            accepted = self._walk(start, end, ok, pending)
+        # Candidates inside an accepted frame are payload, not frames.
+        reach = np.maximum.accumulate(np.where(accepted, end, 0))
+        covered = np.zeros(len(start), bool)
+        covered[1:] = reach[:-1] > start[1:]
+        stops = np.flatnonzero(pending & ~covered)
+        stop = stops[0] if len(stops) else len(start)
+        self._rest = data[start[stop]:].tobytes() if len(stops) else b""
+        # Line noise or a lost byte costs the frame it hit; decoding
+        # resumes at the next SYNC.
+        self.dropped += int(np.count_nonzero(~(ok | covered)[:stop]))
+        accepted = np.flatnonzero(accepted[:stop])
+        payload = np.zeros(n + 1, np.int8)
+        payload[start[accepted] + FRAME_HEAD] = 1
+        payload[end[accepted] - 1] = -1
+        records = data[np.cumsum(payload[:-1]).astype(bool)] \
+            .view(RECORD_DTYPE)
+        frames = np.empty(len(records), FRAME_DTYPE)
+        frames["type"] = np.repeat(kind[accepted], count[accepted])
+        frames["key"] = records["key"]
+        frames["micros"] = records["micros"]
+        echo = (frames["type"] == PONG) | (frames["type"] == VERSION)
+        frames["key"][echo] &= 0xFF
+        return frames
+
+    @staticmethod
+    def _walk(start: np.ndarray, end: np.ndarray, ok: np.ndarray,
+              pending: np.ndarray) -> np.ndarray:
+        accepted = np.zeros(len(start), bool)
+        i = 0
+        for k, (at, good, cut) in enumerate(
+                zip(start.tolist(), ok.tolist(), pending.tolist())):
+            if at < i:
+                continue
+            if cut:
+                break
+            if good:
+                accepted[k] = True
+                i = end[k]
+        return accepted
+
+
+class EdgeStream(object):
+    def __init__(self, clock: ClockSync, bin_width: float = 0.,
+                 report: float = 0.) -> None:
+        self.clock = clock
+        self.decoder = FrameDecoder()
+        # SET_BIN as sent to the board, for placing binned onsets.
+        self.bin_width = bin_width
+        # A rig's calibrated edge-to-host delay, taken off arrival times
+        # while they stand in for the unsynced device clock.
+        self.report = report
+
+    def feed(self, chunk: bytes, received: float) -> np.ndarray:
+        frames = self.decoder.feed(chunk)
+        # A late answer to HELLO carries a build hash, not a time.
+        frames = frames[frames["type"] != VERSION]
+        micros = frames["micros"]
+        binned = frames["type"] == COUNT
+        if binned.any():
+            # A count frame opens with (0, end of the bin); the records after
+            # it carry onset counts where the times would be.
+            head = binned & (frames["key"] == 0)
+            opened = np.maximum.accumulate(
+                np.where(head, np.arange(len(frames)), 0))
+            micros = np.where(binned, micros[opened], micros)
+        seconds = self.clock.device.seconds(micros)
+        pong = frames["type"] == PONG
+        if pong.any():
+            for seq, device in zip(frames["key"][pong].tolist(),
+                                   seconds[pong].tolist()):
+                self.clock.pong(seq, device, received)
+            frames, seconds = frames[~pong], seconds[~pong]
+        repeat = None
+        if binned.any():
+            # Each onset becomes one event in the middle of its bin, with
+            # half a bin added to its error.
+            binned = frames["type"] == COUNT
+            repeat = np.where(binned, frames["micros"], 1)
+            repeat[binned & (frames["key"] == 0)] = 0
+            seconds = seconds - binned * (self.bin_width / 2)
+        events = np.empty(len(frames), EVENT_DTYPE)
+        events["time"], events["error"] = self.clock.to_host(
+            seconds, received - self.report)
+        key = frames["key"]
+        events["event"] = key \
+            + np.sign(key) * PULSE_EVENT * (frames["type"] == PULSE_ACK) \
+            + MASK_EVENT * (frames["type"] == MASK_ACK) \
+            + SEQUENCE_EVENT * (frames["type"] == SEQUENCE_ACK)
+        if repeat is not None:
+            events = np.repeat(events, repeat)
+            events["error"] += np.repeat(binned, repeat) * (self.bin_width / 2)
+        return events
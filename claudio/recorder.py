@@ -0,0 +1,218 @@
+import os
+from threading import Condition, Thread
+from time import perf_counter
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+from events import (CSV_HEADER, HEADER_SIZE, MAGIC, EventBuffer,
+                    binary_header, format_rows, is_binary, read_header)
+
+
+class EventWriter(object):
+    def __init__(self,
+                 filename: str,
+                 batch_size: int = 256,
+                 flush_interval: float = 1.0,
+                 capacity: int = 65536,
+                 fsync: bool = False,
+                 append: bool = False) -> None:
+        if batch_size < 1 or capacity < batch_size:
+            raise ValueError(
+                f"invalid buffer size: batch={batch_size}, cap={capacity}")
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.fsync = fsync
+        self.pushed = 0
+        self.written = 0
+        self.stalls = 0
+        self._pending = EventBuffer(min(capacity, 4 * batch_size))
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._last_flush = perf_counter()
+        self._cond = Condition()
+        self._file = self._open(append)
+        self._thread = Thread(target=self._run,
+                              name=f"writer:{os.path.basename(filename)}",
+                              daemon=True)
+        self._thread.start()
+
+    def _open(self, append: bool):
+        if append and os.path.exists(self.filename):
+            recover(self.filename, self.header())
+            return open(self.filename, "ab")
+        f = open(self.filename, "wb")
+        f.write(self.header())
+        f.flush()
+        return f
+
+    def header(self) -> bytes:
+        return CSV_HEADER.encode("utf-8")
+
+    def format(self, records: np.ndarray) -> bytes:
+        return format_rows(records).encode("utf-8")
+
+    def push(self, pack: Tuple[Any, ...]) -> None:
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise ValueError(f"writer for {self.filename} is closed")
+            # Only blocks when the disk falls `capacity` events behind.
+            if len(self._pending) >= self.capacity:
+                self.stalls += 1
+                while len(self._pending) >= self.capacity \
+                        and self._error is None:
+                    self._cond.wait()
+            self._pending.append(*pack)
+            self.pushed += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def extend(self, records: np.ndarray) -> None:
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise ValueError(f"writer for {self.filename} is closed")
+            if len(self._pending) + len(records) > self.capacity:
+                self.stalls += 1
+                while len(self._pending) + len(records) > self.capacity \
+                        and len(self._pending) and self._error is None:
+                    self._cond.wait()
+            self._pending.extend(records)
+            self.pushed += len(records)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self) -> None:
+        with self._cond:
+            target = self.pushed
+            self._last_flush = 0.
+            self._cond.notify_all()
+            while self.written < target and self._error is None:
+                self._cond.wait()
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return None
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return None
+
+    def _take(self) -> Tuple[np.ndarray, bool]:
+        with self._cond:
+            while not self._closed:
+                due = self._last_flush + self.flush_interval - perf_counter()
+                n = len(self._pending)
+                if n >= self.batch_size or (n and due <= 0.):
+                    break
+                self._cond.wait(
+                    timeout=max(due, 0.) if n else self.flush_interval)
+            batch = self._pending.take()
+            self._last_flush = perf_counter()
+            self._cond.notify_all()
+            return batch, self._closed
+
+    def _write(self, batch: np.ndarray) -> None:
+        self._file.write(self.format(batch))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.written += len(batch)
+
+    def _run(self) -> None:
+        try:
+            while True:
+                batch, closed = self._take()
+                if len(batch):
+                    self._write(batch)
+                with self._cond:
+                    self._cond.notify_all()
+                if closed:
+                    break
+        except BaseException as e:
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+        finally:
+            self._file.close()
+
+    def __enter__(self) -> "EventWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class BinaryEventWriter(EventWriter):
+    def header(self) -> bytes:
+        return binary_header()
+
+    def format(self, records: np.ndarray) -> bytes:
+        return records.tobytes()
+
+
+def record_filename(filename: str, var: dict) -> str:
+    # The file open_writer() actually writes to.
+    if var.get("record-format", "csv") == "bin":
+        return os.path.splitext(filename)[0] + ".bin"
+    return filename
+
+
+def open_writer(filename: str, var: dict) -> EventWriter:
+    kwargs = dict(batch_size=var.get("flush-size", 256),
+                  flush_interval=var.get("flush-interval", 1.0),
+                  fsync=var.get("fsync", False))
+    if var.get("record-format", "csv") == "bin":
+        return BinaryEventWriter(record_filename(filename, var), **kwargs)
+    return EventWriter(filename, **kwargs)
+
+
+def recover_binary(filename: str) -> int:
+    size = os.path.getsize(filename)
+    if size < HEADER_SIZE:
+        with open(filename, "wb") as f:
+            f.write(binary_header())
+        return 0
+    itemsize = read_header(filename).itemsize
+    n = (size - HEADER_SIZE) // itemsize
+    end = HEADER_SIZE + n * itemsize
+    if end < size:
+        with open(filename, "rb+") as f:
+            f.truncate(end)
+    return n
+
+
+def recover(filename: str, header: bytes = CSV_HEADER.encode("utf-8")) -> int:
+    # Drop a torn trailing row left by a crash and return the intact rows.
+    if header.startswith(MAGIC) or is_binary(filename):
+        return recover_binary(filename)
+    with open(filename, "rb+") as f:
+        data = f.read()
+        if not data.startswith(header):
+            if header.startswith(data):
+                f.seek(0)
+                f.write(header)
+                f.truncate()
+                return 0
+            raise ValueError(f"{filename} is not an event file")
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+        return data.count(b"\n", len(header), end)
+
+
+if __name__ == '__main__':
+    import sys
+
+    for filename in sys.argv[1:]:
+        print(f"{filename}: {recover(filename)} events")
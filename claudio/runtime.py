@@ -0,0 +1,106 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from amas.agent import OBSERVER, NotWorkingError
+
+_STOP = object()
+
+
+class LocalAgent(object):
+    # The subset of amas' Agent/Observer the claudio tasks use, backed by
+    # asyncio queues so that several chambers can share one event loop.
+    def __init__(self, addr: str) -> None:
+        self.addr = addr
+        self.hub: Optional["Hub"] = None
+        self.executor: Optional[Executor] = None
+        self.tasks: List[Tuple[Callable, dict]] = []
+        self._working = True
+        self._inbox: Optional[asyncio.Queue] = None
+        self._observed: Optional[asyncio.Queue] = None
+
+    def assign_task(self, task: Callable, **kwargs) -> "LocalAgent":
+        self.tasks.append((task, kwargs))
+        return self
+
+    def working(self) -> bool:
+        return self._working
+
+    def finish(self) -> None:
+        if self._working:
+            self._working = False
+            self._inbox.put_nowait((_STOP, None))
+            self._observed.put_nowait((_STOP, None))
+
+    async def sleep(self, t: float) -> None:
+        if not self._working:
+            raise NotWorkingError
+        await asyncio.sleep(t)
+        if not self._working:
+            raise NotWorkingError
+
+    async def call_async(self, func: Callable, *args) -> Any:
+        if not self._working:
+            raise NotWorkingError
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(self.executor, func, *args)
+        if not self._working:
+            raise NotWorkingError
+        return result
+
+    def send_to(self, addr: str, mess: Any) -> None:
+        self.hub.post(addr, self.addr, mess)
+
+    def send_all(self, mess: Any) -> None:
+        self.hub.broadcast(self.addr, mess)
+
+    async def _get(self, queue: asyncio.Queue,
+                   t: Optional[float]) -> Tuple[Any, Any]:
+        if not self._working:
+            raise NotWorkingError
+        try:
+            sender, mess = await asyncio.wait_for(queue.get(), t)
+        except asyncio.TimeoutError:
+            return None, None
+        if sender is _STOP:
+            raise NotWorkingError
+        return sender, mess
+
+    async def recv(self, t: Optional[float] = None) -> Tuple[Any, Any]:
+        return await self._get(self._inbox, t)
+
+    async def recv_from_observer(self,
+                                 t: Optional[float] = None) -> Tuple[Any, Any]:
+        return await self._get(self._observed, t)
+
+
+class Hub(object):
+    def __init__(self, agents: List[LocalAgent],
+                 executor: Optional[Executor] = None) -> None:
+        self.agents: Dict[str, LocalAgent] = {a.addr: a for a in agents}
+        for agent in agents:
+            agent.hub = self
+            agent.executor = executor
+
+    def post(self, addr: str, sender: str, mess: Any) -> None:
+        agent = self.agents.get(addr)
+        if agent is not None and agent.working():
+            agent._inbox.put_nowait((sender, mess))
+
+    def broadcast(self, sender: str, mess: Any) -> None:
+        for agent in self.agents.values():
+            if agent.addr != sender and agent.working():
+                agent._observed.put_nowait((sender, mess))
+
+    async def run(self) -> None:
+        for agent in self.agents.values():
+            agent._inbox = asyncio.Queue()
+            agent._observed = asyncio.Queue()
+        await asyncio.gather(*[
+            task(agent, **kwargs) for agent in self.agents.values()
+            for task, kwargs in agent.tasks
+        ])
+
+
+def observer() -> LocalAgent:
+    return LocalAgent(OBSERVER)
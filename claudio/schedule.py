@@ -0,0 +1,211 @@
+from math import ceil, floor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# Event code recorded at CS onset.
+CS = 100
+
+# One row per trial, with all times in seconds from the session origin.
+# Trials without a CS have cs_onset == us_onset; trials whose US is
+# omitted still carry us_onset/us_offset, the offset being where the
+# omission is marked.
+TRIAL_DTYPE = np.dtype([
+    ("phase", "<i2"),
+    ("cs", "?"),
+    ("us", "?"),
+    ("probe", "?"),
+    ("cs_onset", "<f8"),
+    ("us_onset", "<f8"),
+    ("us_offset", "<f8"),
+])
+
+# Layout of the legacy PEAK schedule: three plain trials first, five
+# probes and five plain trials on top of the ratio, and two plain trials
+# after every probe.
+PEAK_LEAD = 3
+PEAK_EXTRA = 5
+PEAK_TAIL = 2
+
+
+def grid_itis(mean: float, _range: float, n: int,
+              rng: np.random.Generator) -> np.ndarray:
+    # Evenly spaced over [mean - range, mean + range], shuffled.
+    step = 2 * _range / n
+    itis = mean - _range + step * np.arange(n) + _range / n
+    rng.shuffle(itis)
+    return itis
+
+
+def peak_probes(trials: int, ratio: float,
+                rng: np.random.Generator) -> np.ndarray:
+    n_probe = int(trials * ratio)
+    n_free = trials - n_probe * (PEAK_TAIL + 1) + PEAK_TAIL - PEAK_EXTRA
+    if n_free < 0:
+        raise ValueError(f"{trials} trials are too few for a probe ratio of "
+                         f"{ratio} ({n_free} free trials)")
+    draws = np.zeros(n_free + n_probe + 2 * PEAK_EXTRA, dtype=bool)
+    draws[n_free + PEAK_EXTRA:] = True
+    rng.shuffle(draws)
+    probes = [False] * PEAK_LEAD
+    for probe in draws.tolist():
+        probes.append(probe)
+        if probe:
+            probes.extend([False] * PEAK_TAIL)
+    return np.array(probes, dtype=bool)
+
+
+def check_phase(phase: dict, var: dict) -> None:
+    name = phase.get("name", "phase")
+    trials = phase.get("trials", 0)
+    if trials < 1:
+        raise ValueError(f"{name}: needs at least one trial, got {trials}")
+    mean, _range = phase.get("mean-iti"), phase.get("range-iti", 0.)
+    if mean is None:
+        raise ValueError(f"{name}: mean-iti is not set")
+    if mean < _range or _range < 0:
+        raise ValueError(f"{name}: range-iti ({_range}) must be within "
+                         f"[0, mean-iti ({mean})]")
+    if phase.get("cs", True) and var.get("cs-duration") is None:
+        raise ValueError(f"{name}: a CS phase needs cs-duration")
+    if phase.get("probe-ratio", 0.) > 0.:
+        lo, hi = phase.get("probe-min"), phase.get("probe-max")
+        if lo is None or hi is None or floor(hi) < ceil(lo) or lo < 0:
+            raise ValueError(f"{name}: probe-min/probe-max ({lo}, {hi}) "
+                             "must hold a whole second")
+    return None
+
+
+def compile_phases(phases: List[dict],
+                   var: dict,
+                   seed: Optional[int] = None) -> np.ndarray:
+    us_duration = var.get("us-duration")
+    if us_duration is None or us_duration < 0:
+        raise ValueError(f"us-duration must be set, got {us_duration}")
+    cs_duration = var.get("cs-duration") or 0.
+    rng = np.random.default_rng(seed)
+    for phase in phases:
+        check_phase(phase, var)
+
+    parts = []
+    for i, phase in enumerate(phases):
+        ratio = phase.get("probe-ratio", 0.)
+        if ratio > 0.:
+            probe = peak_probes(phase["trials"], ratio, rng)
+        else:
+            probe = np.zeros(phase["trials"], dtype=bool)
+        part = np.zeros(len(probe), dtype=TRIAL_DTYPE)
+        part["phase"] = i
+        part["cs"] = phase.get("cs", True)
+        part["us"] = phase.get("us", True)
+        part["probe"] = probe
+        # Gap from the end of the previous trial to the start of this one.
+        gap = grid_itis(phase["mean-iti"], phase.get("range-iti", 0.),
+                        len(part), rng)
+        if probe.any():
+            # Probe gaps are whole seconds, as the original PEAK task drew
+            # them with randint.
+            gap[probe] = rng.integers(ceil(phase["probe-min"]),
+                                      floor(phase["probe-max"]) + 1,
+                                      int(probe.sum()))
+        part["cs_onset"] = gap
+        part["us_onset"] = np.where(part["cs"], cs_duration, 0.)
+        part["us_offset"] = us_duration
+        parts.append(part)
+
+    table = np.concatenate(parts)
+    # Each trial lasts gap + cs + us; accumulate to absolute times.
+    span = table["cs_onset"] + table["us_onset"] + table["us_offset"]
+    start = np.concatenate([[0.], np.cumsum(span)[:-1]])
+    table["cs_onset"] += start
+    table["us_onset"] += table["cs_onset"]
+    table["us_offset"] += table["us_onset"]
+    return table
+
+
+def cs_us_phases(var: dict) -> List[dict]:
+    return [{
+        "name": "acquisition",
+        "trials": var.get("trial", 0),
+        "mean-iti": var.get("mean-iti"),
+        "range-iti": var.get("range-iti", 0.),
+    }]
+
+
+def extinction_phases(var: dict) -> List[dict]:
+    trials = int(var.get("trial", 0) / 2)
+    phase = {
+        "trials": trials,
+        "mean-iti": var.get("mean-iti"),
+        "range-iti": var.get("range-iti", 0.),
+    }
+    return [
+        dict(phase, name="acquisition"),
+        dict(phase, name="extinction", us=False),
+        dict(phase, name="reacquisition"),
+    ]
+
+
+def ft_phases(var: dict) -> List[dict]:
+    # `interval` is US onset to US onset.
+    interval = var.get("interval", 10.)
+    return [{
+        "name": "FT",
+        "trials": var.get("trial", 0),
+        "cs": False,
+        "mean-iti": interval - var.get("us-duration", 0.),
+    }]
+
+
+def peak_phases(var: dict) -> List[dict]:
+    interval = var.get("interval", 10.)
+    us_duration = var.get("us-duration", 0.)
+    return [dict(ft_phases(var)[0],
+                 name="PEAK",
+                 **{
+                     "probe-ratio": var.get("peak-ratio", 0.15),
+                     "probe-min": interval * 3,
+                     "probe-max": interval * 3 + 20 - us_duration,
+                 })]
+
+
+PRESETS: Dict[str, Callable[[dict], List[dict]]] = {
+    "CS-US": cs_us_phases,
+    "extinction": extinction_phases,
+    "FT": ft_phases,
+    "PEAK": peak_phases,
+}
+
+
+def compile_schedule(var: dict, default: Optional[str] = None) -> np.ndarray:
+    # An explicit `phases` list wins over the named presets, which rebuild
+    # the schedules of the original scripts from their flat keys.
+    phases = var.get("phases")
+    if phases is None:
+        schedule = var.get("schedule", default)
+        if schedule not in PRESETS:
+            raise ValueError(f"undefined schedule: {schedule}")
+        phases = PRESETS[schedule](var)
+    return compile_phases(phases, var, var.get("schedule-seed"))
+
+
+def phase_names(var: dict, default: Optional[str] = None) -> List[str]:
+    phases = var.get("phases")
+    if phases is None:
+        phases = PRESETS[var.get("schedule", default)](var)
+    return [p.get("name", f"phase{i}") for i, p in enumerate(phases)]
+
+
+if __name__ == '__main__':
+    import sys
+    from time import perf_counter
+
+    from pino.config import Config
+
+    for path in sys.argv[1:]:
+        begin = perf_counter()
+        var = Config(path).get_experimental()
+        table = compile_schedule(var, "CS-US")
+        elapsed = (perf_counter() - begin) * 1e3
+        print(f"{path}: {len(table)} trials, {table['probe'].sum()} probes, "
+              f"{table['us_offset'][-1]:.1f} s, compiled in {elapsed:.2f} ms")
@@ -0,0 +1,73 @@
+import asyncio
+import os
+from time import perf_counter
+from typing import Any, Callable, List, Optional, Tuple
+
+from amas.agent import Agent
+
+
+class DeadlineScheduler(object):
+    def __init__(self,
+                 spin: float = 0.002,
+                 clock: Callable[[], float] = perf_counter) -> None:
+        self.spin = spin
+        self.clock = clock
+        self.origin = 0.
+        self.records: List[List[Any]] = []
+        # When the latest wait_until() returned, for telling a late wakeup
+        # from a slow command.
+        self.woke = float("nan")
+
+    def start(self, origin: Optional[float] = None) -> float:
+        self.origin = self.clock() if origin is None else origin
+        self.records.clear()
+        return self.origin
+
+    def deadline(self, offset: float) -> float:
+        return self.origin + offset
+
+    async def wait_until(self, agent: Agent, offset: float) -> float:
+        # Sleep coarsely to just before the deadline, then spin the rest so
+        # that timer slack never accumulates from one event to the next.
+        deadline = self.origin + offset
+        remaining = deadline - self.clock()
+        if remaining > self.spin:
+            await agent.sleep(remaining - self.spin)
+        now = self.clock()
+        while now < deadline:
+            await asyncio.sleep(0)
+            now = self.clock()
+        self.woke = now
+        return now
+
+    def stamp(self, event: Any, offset: float) -> Tuple[float, Any]:
+        now = self.clock()
+        self.records.append(
+            [event, self.origin + offset, now,
+             float("nan"), self.woke])
+        return (now, event)
+
+    def confirm(self, event: Any, t: Optional[float]) -> None:
+        # Attach a device- or audio-confirmed time to the latest `event`.
+        if t is None:
+            return None
+        for record in reversed(self.records):
+            if record[0] == event:
+                record[3] = t
+                break
+        return None
+
+    def lateness(self) -> List[float]:
+        return [actual - planned for _, planned, actual, *_ in self.records]
+
+    def dump(self, filename: str) -> None:
+        with open(filename, "w") as f:
+            f.write("event, planned, actual, lateness, confirmed, woke\n")
+            for event, planned, actual, confirmed, woke in self.records:
+                f.write(f"{event}, {planned}, {actual}, {actual - planned}, "
+                        f"{confirmed}, {woke}\n")
+        return None
+
+
+def timing_filename(filename: str) -> str:
+    return os.path.splitext(filename)[0] + "_timing.csv"
@@ -0,0 +1,74 @@
+from typing import Optional
+
+import numpy as np
+
+from protocol import SEQUENCE_SLOTS
+
+
+class SequenceFeeder(object):
+    # The session's pulses, uploaded to the board a little ahead of time and
+    # played from its own clock; the host only keeps the buffer topped up.
+    def __init__(self,
+                 pins: np.ndarray,
+                 at: np.ndarray,
+                 length: np.ndarray,
+                 horizon: float = 2.0,
+                 margin: float = 0.05,
+                 slots: int = SEQUENCE_SLOTS) -> None:
+        order = np.argsort(at, kind="stable")
+        self.pins = np.asarray(pins)[order]
+        self.at = np.asarray(at, dtype=np.float64)[order]
+        self.length = np.asarray(length, dtype=np.float64)[order]
+        self.horizon = horizon
+        self.margin = margin
+        self.slots = slots
+        self.sent = 0
+
+    @classmethod
+    def from_table(cls, table: np.ndarray, var: dict) -> "SequenceFeeder":
+        # The US of every reinforced trial and, given a `cs-pin` (a TTL line
+        # to the tone generator), a trigger pulse for every CS.
+        us = table[table["us"]]
+        pins = [np.full(len(us), var.get("us", 12))]
+        at = [us["us_onset"]]
+        length = [us["us_offset"] - us["us_onset"]]
+        cs_pin = var.get("cs-pin")
+        if cs_pin is not None:
+            cs = table[table["cs"]]
+            pins.append(np.full(len(cs), cs_pin))
+            at.append(cs["cs_onset"])
+            length.append(np.full(len(cs), var.get("cs-duration", 0.)))
+        return cls(np.concatenate(pins), np.concatenate(at),
+                   np.concatenate(length), var.get("sequence-horizon", 2.0))
+
+    def __len__(self) -> int:
+        return len(self.at)
+
+    def start(self, ino) -> None:
+        self.feed(ino, 0., 0.)
+        ino.start_sequence()
+
+    def feed(self, ino, elapsed: float, upto: float) -> int:
+        # Everything due by `upto` is sent now; beyond that, steps within
+        # the horizon as far as the board has room for. Steps more than
+        # `margin` in the past are taken as played.
+        played = int(np.searchsorted(self.at, elapsed - self.margin))
+        room = self.slots - (self.sent - played)
+        end = max(int(np.searchsorted(self.at, upto, "right")),
+                  min(int(np.searchsorted(self.at, elapsed + self.horizon,
+                                          "right")), self.sent + room))
+        if end <= self.sent:
+            return 0
+        first, self.sent = self.sent, end
+        ino.load_steps(self.pins[first:end], self.at[first:end],
+                       self.length[first:end])
+        return end - first
+
+    def stop(self, ino) -> None:
+        ino.stop_sequence()
+
+
+def open_sequence(table: np.ndarray, var: dict) -> Optional[SequenceFeeder]:
+    if not var.get("sequence", False):
+        return None
+    return SequenceFeeder.from_table(table, var)
@@ -0,0 +1,458 @@
+import asyncio
+import traceback
+from time import perf_counter
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+from amas.agent import OBSERVER, Agent, NotWorkingError, Observer
+
+from archive import open_archive
+from audit import Histogram, audit_line, latency_filename, write_audit
+from audio import AudioEngine, AudioStream, Cue
+from backends import STARTUP, open_hardware, release_outputs
+from calibration import load_compensation
+from clock import ClockSync
+from contingency import Contingency
+from ingest import DONE, STOP, IngestProcess, SharedRing, drain
+from protocol import PULSE_EVENT, Board, EdgeStream
+from online import PeakAnalyzer, peak_analyzer
+from recorder import open_writer, record_filename
+from schedule import CS
+from scheduler import DeadlineScheduler, timing_filename
+from sequence import open_sequence
+from sessionlog import SessionLog, log_filename
+from stimuli import stimulus_bank
+
+STIMULATOR = "STIMULATOR"
+READER = "READER"
+RECORDER = "RECORDER"
+
+HIGH = 1
+LOW = 0
+
+
+def packing(event: int) -> Tuple[float, int]:
+    return (perf_counter(), event)
+
+
+def set_speaker(stream: AudioStream, tone: np.ndarray,
+                name: str = "cs") -> Callable:
+    # Chambers on one device share its stream, so each loads its tone under
+    # its own name.
+    stream.load(name, tone)
+
+    def sound(at: Optional[float] = None) -> Cue:
+        return stream.trigger(name, at)
+
+    return sound
+
+
+async def stimulate(agent: Agent,
+                    ino,
+                    beep: Optional[Callable],
+                    table: np.ndarray,
+                    var: dict,
+                    timing: str,
+                    log: SessionLog,
+                    clock: Callable[[], float] = perf_counter) -> None:
+    us = var.get("us", 12)
+    lead = var.get("audio-lead", 0.02)
+    # With `sequence: true` the board plays every pulse from its own clock
+    # and the host only stamps, beeps and keeps the board's buffer filled.
+    # Otherwise the board times each US pulse unless `us-pulse: false`.
+    feeder = open_sequence(table, var)
+    pulse = feeder is None and var.get("us-pulse", True)
+    manual = feeder is None and not pulse
+    cs_pin = feeder is not None and var.get("cs-pin") is not None
+    # Board outputs change `shift` after their command is issued (see
+    # calibration.py): what the stimulator times itself is issued that much
+    # early, and the recorder gets the estimated time of the change. A
+    # sequence issues no command per output; the board plays it on its own
+    # clock and acknowledges its start, so its stamps stay as planned.
+    shift = load_compensation(var).write if feeder is None else 0.
+    if beep is None and table["cs"].any() and not cs_pin:
+        raise ValueError("the schedule has CS trials but no speaker is set")
+    # Plain tuples are much cheaper to unpack per trial than numpy rows.
+    trials = table[["cs", "us", "cs_onset", "us_onset", "us_offset"]].tolist()
+    sched = DeadlineScheduler(var.get("spin-window", 0.002), clock)
+    log.log("start", trials=len(trials))
+    agent.send_to(RECORDER, (sched.start(), 0))
+    if feeder is not None:
+        feeder.start(ino)
+    try:
+        for count, (cs, reinforced, cs_onset, us_onset,
+                    us_offset) in enumerate(trials, 1):
+            cue = None
+            if feeder is not None:
+                feeder.feed(ino, clock() - sched.origin, us_offset)
+            if cs:
+                await sched.wait_until(agent, cs_onset - lead)
+                if not cs_pin:
+                    cue = beep(sched.deadline(cs_onset))
+                await sched.wait_until(agent, cs_onset)
+                now, _ = sched.stamp(CS, cs_onset)
+                agent.send_to(RECORDER, (now, CS))
+            if reinforced:
+                await sched.wait_until(agent, us_onset - shift)
+                if pulse:
+                    ino.pulse(us, us_offset - us_onset)
+                elif manual:
+                    ino.digital_write(us, HIGH)
+                # Kept for the timing audit only; the board acknowledges
+                # the onset under the same code.
+                sched.stamp(PULSE_EVENT + us, us_onset)
+                await sched.wait_until(agent, us_offset - shift)
+                if manual:
+                    ino.digital_write(us, LOW)
+                now, _ = sched.stamp(us, us_offset)
+                agent.send_to(RECORDER, (now + shift, us))
+            else:
+                await sched.wait_until(agent, us_offset)
+                agent.send_to(RECORDER, sched.stamp(-1 * us, us_offset))
+            if cue is not None:
+                sched.confirm(CS, cue.onset)
+            log.log("trial", trial=count)
+        agent.send_to(RECORDER, (clock(), 1))
+    except NotWorkingError:
+        if feeder is not None:
+            feeder.stop(ino)
+        agent.send_to(RECORDER, (clock(), -1))
+    sched.dump(timing)
+    agent.send_to(OBSERVER, "done")
+    return None
+
+
+async def respond(agent: Agent,
+                  ino,
+                  beep: Optional[Callable],
+                  contingency: Contingency,
+                  var: dict,
+                  timing: str,
+                  log: SessionLog,
+                  clock: Callable[[], float] = perf_counter) -> None:
+    # Closed-loop schedules: each lick onset forwarded by the reader is put
+    # to the contingency, and a reinforced one is answered at once with a
+    # board-timed US (or a CS-US trial).
+    us = var.get("us", 12)
+    duration = var.get("us-duration", 0.05)
+    trials = var.get("trial", 100)
+    limit = var.get("session-duration", float("inf"))
+    cs_pin = var.get("cs-pin")
+    cs_duration = var.get("cs-duration", 0.)
+    delay = cs_duration + var.get("trace-interval", 0.)
+    shift = load_compensation(var).write
+    if contingency.cue and beep is None and cs_pin is None:
+        raise ValueError("the schedule has CS trials but no speaker is set")
+    sched = DeadlineScheduler(var.get("spin-window", 0.002), clock)
+    log.log("start", trials=trials)
+    origin = sched.start()
+    agent.send_to(RECORDER, (origin, 0))
+    contingency.start(0.)
+    delivered = 0
+    try:
+        while delivered < trials and clock() - origin < limit:
+            _, mess = await agent.recv(t=0.5)
+            if mess is None:
+                continue
+            received, onsets = mess
+            for t in onsets.tolist():
+                if delivered == trials or \
+                        not contingency.respond(t - origin):
+                    continue
+                # In the timing file a reinforcer is planned at the response
+                # (plus the CS when cued), so its lateness is the reaction
+                # latency; `woke` is when the response reached this agent.
+                sched.woke = received
+                at = t - origin
+                if contingency.cue:
+                    now, _ = sched.stamp(CS, at)
+                    if cs_pin is not None:
+                        ino.pulse(cs_pin, cs_duration)
+                        now += shift
+                    else:
+                        beep()
+                    agent.send_to(RECORDER, (now, CS))
+                    at += delay
+                    await sched.wait_until(agent, at)
+                ino.pulse(us, duration)
+                now, _ = sched.stamp(PULSE_EVENT + us, at)
+                agent.send_to(RECORDER, (now + shift, us))
+                delivered += 1
+                log.log("trial",
+                        trial=delivered,
+                        responses=contingency.responses,
+                        latency=now - t - (delay if contingency.cue else 0.),
+                        host=now - received)
+                contingency.deliver(clock() - origin)
+        agent.send_to(RECORDER, (clock(), 1))
+    except NotWorkingError:
+        agent.send_to(RECORDER, (clock(), -1))
+    sched.dump(timing)
+    agent.send_to(OBSERVER, "done")
+    return None
+
+
+async def read(agent: Agent,
+               board: Board,
+               clock: ClockSync,
+               bin_width: float = 0.,
+               latency: Optional[str] = None,
+               forward: Optional[int] = None,
+               report: float = 0.) -> None:
+    # With `forward` (the lick pin), onsets also go straight to the
+    # stimulator, ahead of the recorder, for closed-loop schedules.
+    stream = EdgeStream(clock, bin_width, report)
+    # How long after its device stamp each input edge reached the host.
+    arrival = Histogram()
+    try:
+        while agent.working():
+            chunk, received = await agent.call_async(board.read_chunk)
+            if not chunk:
+                continue
+            events = stream.feed(chunk, received)
+            if len(events):
+                if forward is not None:
+                    onsets = events["time"][events["event"] == forward]
+                    if len(onsets):
+                        agent.send_to(STIMULATOR, (received, onsets))
+                agent.send_to(RECORDER, events)
+                if clock.synced:
+                    edges = np.abs(events["event"]) < PULSE_EVENT
+                    arrival.add(received - events["time"][edges])
+    except NotWorkingError:
+        pass
+    if latency is not None:
+        arrival.save(latency)
+    return None
+
+
+async def synchronize(agent: Agent, board: Board, clock: ClockSync,
+                      var: dict) -> None:
+    interval = var.get("sync-interval", 1.0)
+    try:
+        for _ in range(var.get("sync-burst", 8)):
+            board.ping(clock.next_ping())
+            await agent.sleep(0.05)
+        while agent.working():
+            board.ping(clock.next_ping())
+            await agent.sleep(interval)
+    except NotWorkingError:
+        pass
+    return None
+
+
+async def record(agent: Agent,
+                 filename: str,
+                 var: dict,
+                 log: SessionLog,
+                 ring: Optional[str] = None,
+                 analyzer: Optional[PeakAnalyzer] = None) -> None:
+    writer = open_writer(filename, var)
+    lick = var.get("lick")
+    shared = None
+    poll = None
+    if ring is not None:
+        shared = SharedRing.attach(ring, var.get("ingest-capacity", 1 << 16))
+        poll = var.get("ingest-poll", 0.005)
+    closed = 0
+    try:
+        while agent.working():
+            _, mess = await agent.recv(t=poll)
+            if shared is not None:
+                n, licks = drain(shared, writer, lick, analyzer)
+                if n:
+                    log.log("events", n=n, licks=licks)
+            if mess is not None:
+                if isinstance(mess, np.ndarray):
+                    writer.extend(mess)
+                    licks = int(np.count_nonzero(mess["event"] == lick))
+                    log.log("events", n=len(mess), licks=licks)
+                    if analyzer is not None:
+                        analyzer.feed(mess["time"], mess["event"])
+                else:
+                    writer.push(mess)
+                    log.log("event", time=mess[0], event=mess[1])
+                    if analyzer is not None:
+                        analyzer.push(mess[0], mess[1])
+            if analyzer is not None and analyzer.trials != closed:
+                closed = analyzer.trials
+                peak = analyzer.snapshot()
+                log.log("peak",
+                        trials=peak["trials"],
+                        probe_trials=peak["probe_trials"],
+                        peak_time=peak["peak_time"],
+                        peak_rate=peak["peak_rate"])
+    except NotWorkingError or KeyboardInterrupt:
+        pass
+    if shared is not None:
+        # The ingest process may still be parsing: stop it, and drain once
+        # its last events are in the ring.
+        shared.head[STOP] = 1
+        end = perf_counter() + var.get("ingest-stop-timeout", 1.0)
+        while not shared.head[DONE] and perf_counter() < end:
+            await asyncio.sleep(poll)
+        drain(shared, writer)
+        shared.close()
+    writer.close()
+    return None
+
+
+async def observe(agent: Observer) -> None:
+    while agent.working():
+        _, mess = await agent.recv(t=2.0)
+        if mess == "done":
+            agent.send_all(mess)
+            agent.finish()
+            break
+    return None
+
+
+async def watch(agent: Agent) -> None:
+    while agent.working():
+        _, mess = await agent.recv_from_observer()
+        if mess == "done":
+            agent.finish()
+            break
+    return None
+
+
+def run_session(config,
+                filename: str,
+                table: np.ndarray,
+                schedule: Optional[str] = None,
+                contingency: Optional[Contingency] = None) -> None:
+    # With a contingency, `table` is empty and the stimulator responds to
+    # the licks forwarded by the reader instead of following a timeline.
+    from amas.connection import Register
+    from amas.env import Environment
+
+    expvars = config.get_experimental()
+    us = expvars.get("us")
+    lick = expvars.get("lick")
+    if contingency is not None and expvars.get("ingest-process", False):
+        raise ValueError("closed-loop schedules need the reader agent; "
+                         "set ingest-process: false")
+
+    engine = None
+    hardware = None
+    log = None
+    ingest = None
+    try:
+        sound = None
+        cued = contingency is not None and contingency.cue \
+            and expvars.get("cs-pin") is None
+        if table["cs"].any() or cued:
+            # Only schedules with a CS load an audio backend at all.
+            cs = stimulus_bank(expvars).from_config(expvars)
+            engine = AudioEngine(expvars.get("audio-backend", "sounddevice"))
+            stream = engine.open(expvars.get("speaker"),
+                                 expvars.get("samplerate"))
+            sound = set_speaker(stream, cs)
+            STARTUP.mark("audio")
+
+        hardware = open_hardware(config)
+        hardware.setup(us, lick, expvars.get("edge-debounce", 0.),
+                       expvars.get("edge-bin", 0.), expvars.get("cs-pin"))
+        STARTUP.mark("connect")
+
+        log = SessionLog(log_filename(filename))
+        archive = open_archive(expvars)
+        if archive is not None:
+            entry = archive.register(record_filename(filename, expvars),
+                                     expvars, config.get_metadata(),
+                                     config.get("chamber"), schedule)
+
+        stimulator = Agent(STIMULATOR)
+        if contingency is None:
+            stimulator.assign_task(stimulate,
+                                   ino=hardware,
+                                   beep=sound,
+                                   table=table,
+                                   var=expvars,
+                                   timing=timing_filename(filename),
+                                   log=log)
+        else:
+            stimulator.assign_task(respond,
+                                   ino=hardware,
+                                   beep=sound,
+                                   contingency=contingency,
+                                   var=expvars,
+                                   timing=timing_filename(filename),
+                                   log=log)
+        stimulator.assign_task(watch)
+
+        board = Board(hardware.com)
+        clock = ClockSync()
+
+        reader = Agent(READER)
+        reader.assign_task(read,
+                           board=board,
+                           clock=clock,
+                           bin_width=expvars.get("edge-bin", 0.),
+                           latency=latency_filename(filename),
+                           forward=None if contingency is None else lick,
+                           report=load_compensation(expvars).report) \
+            .assign_task(synchronize, board=board, clock=clock, var=expvars) \
+            .assign_task(watch)
+
+        ingest = None
+        agents = [stimulator, reader]
+        if expvars.get("ingest-process", False):
+            # Serial input is read, stamped and buffered by its own process.
+            ingest = IngestProcess(hardware.port, expvars,
+                                   latency=latency_filename(filename)).start()
+            agents = [stimulator]
+
+        recorder = Agent(RECORDER)
+        recorder.assign_task(record,
+                             filename=filename,
+                             var=expvars,
+                             log=log,
+                             ring=ingest and ingest.ring.name,
+                             analyzer=peak_analyzer(table, expvars)) \
+            .assign_task(watch)
+
+        observer = Observer()
+        observer.assign_task(observe)
+
+        # Registering wires the agents' mailboxes to each other; the object
+        # itself is not needed afterwards.
+        Register(agents + [recorder, observer])
+
+        env = Environment(agents + [recorder, observer])
+        STARTUP.mark("agents")
+        log.log("startup", **STARTUP.as_dict())
+        print(STARTUP.report())
+        env.run()
+    finally:
+        # However the session ended, the outputs end LOW and the port and
+        # the audio device are given back.
+        if hardware is not None:
+            try:
+                release_outputs(hardware, expvars)
+            except Exception:
+                traceback.print_exc()
+        if ingest is not None:
+            log.log("ingest", **ingest.stop())
+        if log is not None:
+            log.close()
+        if engine is not None:
+            engine.close()
+        if hardware is not None:
+            hardware.close()
+    if archive is not None:
+        try:
+            archive.complete(entry, record_filename(filename, expvars),
+                             table, lick, us)
+        finally:
+            archive.close()
+    if expvars.get("timing-audit", True):
+        # The recording is complete by now; a failing audit only loses its
+        # report.
+        try:
+            report = write_audit(filename, expvars,
+                                 record_filename(filename, expvars))
+            print(audit_line(report))
+        except Exception:
+            traceback.print_exc()
+    return None
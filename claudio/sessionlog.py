@@ -0,0 +1,137 @@
+import json
+import os
+import sys
+from collections import deque
+from queue import Empty, SimpleQueue
+from threading import Event, Thread
+from time import perf_counter
+from typing import Any, Deque, List, Optional, Tuple
+
+
+class SessionLog(object):
+    def __init__(self,
+                 path: Optional[str] = None,
+                 interval: float = 1.0,
+                 window: float = 10.0,
+                 console: bool = True) -> None:
+        self.path = path
+        self.interval = interval
+        self.window = window
+        self.console = console
+        self.trial = 0
+        self.trials = 0
+        self.events = 0
+        self.peak: Optional[dict] = None
+        self._licks: Deque[Tuple[float, int]] = deque()
+        self._pid: Optional[int] = None
+        self._queue: SimpleQueue = SimpleQueue()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def _ensure_thread(self) -> None:
+        # The writer thread is started lazily, and again in a forked child,
+        # so the same log object works in any agent process.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._queue = SimpleQueue()
+            self._stop = Event()
+            self._thread = Thread(target=self._run,
+                                  name="session-log",
+                                  daemon=True)
+            self._thread.start()
+
+    def log(self, kind: str, **fields: Any) -> None:
+        self._ensure_thread()
+        self._queue.put((perf_counter(), kind, fields))
+
+    def warn(self, message: str, **fields: Any) -> None:
+        self.log("warning", message=message, **fields)
+
+    def close(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._pid = None
+
+    def _drain(self) -> List[Tuple[float, str, dict]]:
+        records = []
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except Empty:
+                return records
+
+    def _update(self, t: float, kind: str, fields: dict) -> None:
+        if kind == "start":
+            self.trials = fields.get("trials", self.trials)
+        elif kind == "trial":
+            self.trial = fields.get("trial", self.trial + 1)
+        elif kind == "events":
+            self.events += fields.get("n", 0)
+            licks = fields.get("licks", 0)
+            if licks:
+                self._licks.append((t, licks))
+        elif kind == "peak":
+            self.peak = fields
+
+    def summary(self, now: float) -> str:
+        while self._licks and self._licks[0][0] < now - self.window:
+            self._licks.popleft()
+        parts = []
+        if self.trial or self.trials:
+            total = f"/{self.trials}" if self.trials else ""
+            parts.append(f"trial {self.trial}{total}")
+        if self.events:
+            licks = sum(n for _, n in self._licks)
+            parts.append(f"{licks} licks in last {self.window:g} s")
+        if self.peak is not None and self.peak["peak_time"] == \
+                self.peak["peak_time"]:
+            parts.append(f"peak {self.peak['peak_time']:g} s at "
+                         f"{self.peak['peak_rate']:.2f} licks/s "
+                         f"({self.peak['probe_trials']} probes)")
+        return ", ".join(parts) or "waiting"
+
+    def _print(self, line: str) -> None:
+        if self.console:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def _run(self) -> None:
+        f = open(self.path, "a") if self.path else None
+        warned, suppressed = 0, 0
+        last = perf_counter()
+        try:
+            while True:
+                stopping = self._stop.wait(self.interval)
+                lines = []
+                for t, kind, fields in self._drain():
+                    self._update(t, kind, fields)
+                    lines.append(
+                        json.dumps(dict(t=t, kind=kind, **fields),
+                                   default=str))
+                    if kind in ("warning", "error"):
+                        # Show a few of these immediately, count the rest.
+                        if warned < 5:
+                            self._print(f"{kind}: {fields.get('message')}")
+                            warned += 1
+                        else:
+                            suppressed += 1
+                if f is not None and lines:
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+                now = perf_counter()
+                if now - last >= self.interval or stopping:
+                    if suppressed:
+                        self._print(f"({suppressed} more warnings suppressed)")
+                    self._print(self.summary(now))
+                    warned, suppressed, last = 0, 0, now
+                if stopping:
+                    break
+        finally:
+            if f is not None:
+                f.close()
+
+
+def log_filename(filename: str) -> str:
+    return os.path.splitext(filename)[0] + "_log.jsonl"
@@ -2,25 +2,28 @@ from typing import Callable
 
 import numpy as np
 
+from audio import AudioStream
+from stimuli import StimulusBank
 
-def make_pure_tone(amp: float, freq: int, samplerate: int,
-                   t: float) -> np.ndarray:
-    return amp * np.sin(
-        2.0 * np.pi * freq * np.arange(samplerate * t) / samplerate)
 
+def set_speaker(stream: AudioStream, name: str, tone: np.ndarray) -> Callable:
+    stream.load(name, tone)
 
-def set_speaker(speaker, tone: np.ndarray, rate=int) -> Callable:
     def sound():
-        speaker.play(tone, samplerate=rate)
-        return None
+        cue = stream.trigger(name)
+        cue.wait(1.0)
+        return cue
 
     return sound
 
 
 if __name__ == '__main__':
-    import soundcard as sc
+    from time import sleep
+
     from pino.config import Config
 
+    from audio import AudioEngine
+
     config = Config("./config/sound_check.yml")
     expvars = config.get_experimental()
     SAMPLERATE = expvars.get("samplerate", 48000)
@@ -29,14 +32,20 @@ if __name__ == '__main__':
     HZ_1 = expvars.get("Hz-1", 440)
     HZ_2 = expvars.get("Hz-2", 880)
     SOUND_DUARION = 1  # sec
-    speakers = list(filter(lambda d: "USB" in str(d), sc.all_speakers()))
-    sound_1 = set_speaker(
-        speakers[SPEAKER_1],
-        make_pure_tone(20.0, HZ_1, SAMPLERATE, SOUND_DUARION), SAMPLERATE)
-    sound_2 = set_speaker(
-        speakers[SPEAKER_2],
-        make_pure_tone(20.0, HZ_2, SAMPLERATE, SOUND_DUARION), SAMPLERATE)
+    bank = StimulusBank(samplerate=SAMPLERATE)
+    engine = AudioEngine(expvars.get("audio-backend", "soundcard"))
+    sound_1 = set_speaker(engine.open(SPEAKER_1, SAMPLERATE), "tone-1",
+                          bank.tone(HZ_1, SOUND_DUARION, 20.0))
+    sound_2 = set_speaker(engine.open(SPEAKER_2, SAMPLERATE), "tone-2",
+                          bank.tone(HZ_2, SOUND_DUARION, 20.0))
 
     for _ in range(5):
-        sound_1()
-        sound_2()
+        for sound in (sound_1, sound_2):
+            cue = sound()
+            if cue.onset is None:
+                print(f"{cue.name}: no onset within 1 s")
+            else:
+                late = (cue.onset - cue.requested) * 1e3
+                print(f"{cue.name}: onset {late:.2f} ms after trigger")
+            sleep(SOUND_DUARION)
+    engine.close()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "claudio",
+                         "stimuli")
+
+
+def make_pure_tone(amp: float, freq: int, samplerate: int,
+                   t: float) -> np.ndarray:
+    return make_tones(amp, [freq], samplerate, t)
+
+
+def make_tones(amp: float, freqs: Sequence[float], samplerate: int,
+               t: float) -> np.ndarray:
+    phase = 2.0 * np.pi * np.arange(int(samplerate * t)) / samplerate
+    wave = np.zeros(len(phase))
+    for freq in freqs:
+        wave += np.sin(freq * phase)
+    return (amp / len(freqs) * wave).astype(np.float32)
+
+
+def make_noise(amp: float, samplerate: int, t: float,
+               seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (amp * rng.uniform(-1., 1., int(samplerate * t))).astype(np.float32)
+
+
+def apply_ramp(wave: np.ndarray, samplerate: int, ramp: float) -> np.ndarray:
+    # Raised-cosine onset and offset, to keep the speaker from clicking.
+    n = min(int(samplerate * ramp), len(wave) // 2)
+    if n > 0:
+        edge = (0.5 - 0.5 * np.cos(np.pi * np.arange(n) / n)).astype(
+            np.float32)
+        wave[:n] *= edge
+        wave[len(wave) - n:] *= edge[::-1]
+    return wave
+
+
+def synthesize(spec: dict) -> np.ndarray:
+    kind = spec["kind"]
+    samplerate, duration = spec["samplerate"], spec["duration"]
+    if kind == "tone":
+        wave = make_tones(spec["amp"], spec["freqs"], samplerate, duration)
+    elif kind == "noise":
+        wave = make_noise(spec["amp"], samplerate, duration, spec["seed"])
+    else:
+        raise ValueError(f"undefined stimulus: {kind}")
+    return np.ascontiguousarray(
+        apply_ramp(wave, samplerate, spec.get("ramp", 0.)))
+
+
+class StimulusBank(object):
+    def __init__(self,
+                 cache_dir: Optional[str] = CACHE_DIR,
+                 samplerate: int = 48000) -> None:
+        self.cache_dir = cache_dir
+        self.samplerate = samplerate
+        self._waves: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def key(spec: dict) -> str:
+        blob = json.dumps(spec, sort_keys=True).encode("utf-8")
+        return f"{spec['kind']}-{hashlib.sha1(blob).hexdigest()[:16]}"
+
+    def get(self, spec: dict) -> np.ndarray:
+        key = self.key(spec)
+        wave = self._waves.get(key)
+        if wave is None:
+            wave = self._load(key, spec)
+            self._waves[key] = wave
+        return wave
+
+    def _load(self, key: str, spec: dict) -> np.ndarray:
+        if self.cache_dir is None:
+            return synthesize(spec)
+        path = os.path.join(self.cache_dir, key + ".npy")
+        if os.path.exists(path):
+            try:
+                return np.load(path, mmap_mode="r")
+            except ValueError:
+                pass
+        wave = synthesize(spec)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, wave)
+        os.replace(tmp, path)
+        return np.load(path, mmap_mode="r")
+
+    def tone(self,
+             freq,
+             duration: float,
+             amp: float = 1.0,
+             ramp: float = 0.) -> np.ndarray:
+        freqs = [float(f) for f in np.atleast_1d(freq)]
+        return self.get({
+            "kind": "tone",
+            "freqs": freqs,
+            "amp": float(amp),
+            "samplerate": self.samplerate,
+            "duration": float(duration),
+            "ramp": float(ramp),
+        })
+
+    def noise(self,
+              duration: float,
+              amp: float = 1.0,
+              ramp: float = 0.,
+              seed: int = 0) -> np.ndarray:
+        return self.get({
+            "kind": "noise",
+            "amp": float(amp),
+            "samplerate": self.samplerate,
+            "duration": float(duration),
+            "ramp": float(ramp),
+            "seed": int(seed),
+        })
+
+    def from_config(self, var: dict) -> np.ndarray:
+        duration = var.get("cs-duration")
+        amp = var.get("amplifer", 10.0)
+        ramp = var.get("cs-ramp", 0.)
+        if var.get("cs-type", "tone") == "noise":
+            return self.noise(duration, amp, ramp, var.get("noise-seed", 0))
+        return self.tone(var.get("Hz"), duration, amp, ramp)
+
+
+def stimulus_bank(var: dict) -> StimulusBank:
+    return StimulusBank(var.get("stimulus-cache", CACHE_DIR),
+                        var.get("samplerate", 48000))
@@ -0,0 +1,33 @@
+import fcntl
+import os
+import select
+import struct
+import termios
+import tty
+
+
+class TtyPort(object):
+    # The few pyserial calls claudio makes on a connected port, on a POSIX
+    # tty opened by path (a second handle on a board pino already opened, or
+    # the pty of a VirtualArduino).
+    def __init__(self, path: str, timeout: float = 2.0) -> None:
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(self.fd)
+        self.timeout = timeout
+
+    @property
+    def in_waiting(self) -> int:
+        buf = fcntl.ioctl(self.fd, termios.FIONREAD, b"\0\0\0\0")
+        return struct.unpack("i", buf)[0]
+
+    def read(self, size: int = 1) -> bytes:
+        ready, _, _ = select.select([self.fd], [], [], self.timeout)
+        if not ready:
+            return b""
+        return os.read(self.fd, size)
+
+    def write(self, data: bytes) -> int:
+        return os.write(self.fd, data)
+
+    def close(self) -> None:
+        os.close(self.fd)
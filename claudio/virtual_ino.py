@@ -0,0 +1,290 @@
+import os
+import pty
+import random
+import select
+import tty
+from bisect import insort
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep
+from typing import Dict, List, Optional, Tuple
+
+from protocol import (ARGUMENTS, COUNT, EDGE, HELLO, MASK_ACK, MAX_RECORDS,
+                      MODE_INPUT, MODE_INPUT_PULLUP, MODE_OUTPUT, MODE_SERVO,
+                      MODE_SSINPUT, MODE_SSINPUT_PULLUP, PING, PONG, PORT_D,
+                      PULSE, PULSE_ACK, SEQ_START, SEQ_STEP, SEQ_STOP,
+                      SEQUENCE_ACK, SEQUENCE_SLOTS, SET_BIN, SET_DEBOUNCE,
+                      VERSION, WRITE_HIGH, WRITE_LOW, WRITE_MASK,
+                      encode_frame)
+from ttyport import TtyPort
+
+EDGE_FLUSH = 500e-6  # EDGE_FLUSH_US in proto.ino
+
+
+class VirtualArduino(object):
+    def __init__(self,
+                 lick_rate: float = 0.,
+                 lick_duration: float = 0.03,
+                 baudrate: Optional[int] = 115200,
+                 seed: Optional[int] = None,
+                 build: int = 0,
+                 command_latency: float = 0.,
+                 report_latency: float = 0.,
+                 loopback: Optional[Dict[int, int]] = None) -> None:
+        self.lick_rate = lick_rate
+        self.lick_duration = lick_duration
+        self.baudrate = baudrate
+        # Reported to HELLO, as BUILD_HASH is by proto.ino.
+        self.build = build
+        # Host-to-board and board-to-host delays of the link, on top of the
+        # byte times, and output pins wired back to inputs (output -> input).
+        self.command_latency = command_latency
+        self.report_latency = report_latency
+        self.loopback = loopback or {}
+        self.modes: Dict[int, int] = {}
+        self.levels: Dict[int, int] = {}
+        # Host perf_counter() times, for measuring the pipeline end to end.
+        self.emitted: List[Tuple[float, int]] = []
+        self.writes: List[Tuple[float, int, int]] = []
+        self._rng = random.Random(seed)
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._origin = perf_counter()
+        self._edges: List[Tuple[int, int]] = []
+        self._first = 0.
+        self._licks: List[Tuple[float, int]] = []
+        self._pulses: Dict[int, float] = {}
+        self._steps: List[Tuple[float, int, float]] = []
+        self._sequence: Optional[float] = None
+        # Simulated licks never bounce, so the debounce is only kept.
+        self.debounce = 0.
+        self.bin = 0.
+        self._bin_start = 0.
+        self._counts: Dict[int, int] = {}
+        self._inbox: List[Tuple[float, bytes]] = []
+        self._outbox: List[Tuple[float, bytes]] = []
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="virtual-ino",
+                              daemon=True)
+
+    def micros(self, t: Optional[float] = None) -> int:
+        t = perf_counter() if t is None else t
+        return int((t - self._origin) * 1e6) & 0xFFFFFFFF
+
+    def connect(self, timeout: float = 2.0) -> TtyPort:
+        return TtyPort(self.port, timeout)
+
+    def start(self) -> "VirtualArduino":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def __enter__(self) -> "VirtualArduino":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def lick_pins(self) -> List[int]:
+        return [
+            pin for pin, mode in self.modes.items()
+            if mode in (MODE_SSINPUT, MODE_SSINPUT_PULLUP)
+        ]
+
+    def inject(self, pin: int, level: int) -> None:
+        with self._lock:
+            insort(self._licks, (perf_counter(), pin if not level else -pin))
+
+    def _send(self, data: bytes) -> None:
+        if self.report_latency > 0.:
+            self._outbox.append((perf_counter() + self.report_latency, data))
+        else:
+            os.write(self._master, data)
+        if self.baudrate:
+            # 8N1 framing: ten bit times per byte on the real link.
+            sleep(len(data) * 10 / self.baudrate)
+
+    def _report(self, key: int, t: float) -> None:
+        self.emitted.append((t, key))
+        if self.bin:
+            if key > 0:
+                self._counts[key] = self._counts.get(key, 0) + 1
+            return None
+        if not self._edges:
+            self._first = t
+        self._edges.append((key, self.micros(t)))
+        if len(self._edges) == MAX_RECORDS:
+            self._flush()
+
+    def _send_counts(self, now: float) -> None:
+        self._flush()
+        counts = sorted(self._counts.items())
+        self._counts = {}
+        for i in range(0, max(len(counts), 1), MAX_RECORDS - 1):
+            self._send(
+                encode_frame(COUNT, [(0, self.micros(now))] +
+                             counts[i:i + MAX_RECORDS - 1]))
+        self._bin_start += self.bin
+        if now - self._bin_start >= self.bin:
+            self._bin_start = now
+
+    def _flush(self) -> None:
+        if self._edges:
+            self._send(encode_frame(EDGE, self._edges))
+            self._edges = []
+
+    def _ack(self, kind: int, key: int, t: float) -> None:
+        self._flush()
+        self._send(encode_frame(kind, [(key, self.micros(t))]))
+
+    def _drive(self, pin: int, level: int, now: float) -> None:
+        self.levels[pin] = level
+        self.writes.append((now, pin, level))
+        wired = self.loopback.get(pin)
+        if wired is not None and wired in self.lick_pins() \
+                and self.levels.get(wired) != level:
+            # A HIGH output reads as the pulled-up input released.
+            self.levels[wired] = level
+            self._report(-wired if level else wired, now)
+
+    def _start_pulse(self, pin: int, length: float, now: float) -> None:
+        self._drive(pin, 1, now)
+        self._pulses[pin] = now + length
+        self._ack(PULSE_ACK, pin, now)
+
+    def _run_steps(self, now: float) -> None:
+        while self._sequence is not None and self._steps \
+                and self._sequence + self._steps[0][0] <= now:
+            _, pin, length = self._steps.pop(0)
+            self._start_pulse(pin, length, now)
+
+    def _end_pulses(self, now: float) -> None:
+        for pin, end in list(self._pulses.items()):
+            if end <= now:
+                del self._pulses[pin]
+                self._drive(pin, 0, now)
+                self._ack(PULSE_ACK, -pin, now)
+
+    def _command(self, command: int, pin: int, args: bytes) -> None:
+        now = perf_counter()
+        if command in (MODE_INPUT, MODE_INPUT_PULLUP, MODE_OUTPUT, MODE_SERVO,
+                       MODE_SSINPUT, MODE_SSINPUT_PULLUP):
+            self.modes[pin] = command
+            if command in (MODE_INPUT_PULLUP, MODE_SSINPUT_PULLUP):
+                self.levels[pin] = 1
+        elif command in (WRITE_LOW, WRITE_HIGH):
+            self._drive(pin, int(command == WRITE_HIGH), now)
+        elif command == PULSE:
+            self._start_pulse(pin,
+                              int.from_bytes(args, "little") * 1e-6, now)
+        elif command == WRITE_MASK:
+            mask, value = args
+            if pin == PORT_D:
+                mask &= 0xFC  # the serial line
+            for bit in range(8):
+                if mask >> bit & 1:
+                    self._drive(pin * 8 + bit, value >> bit & 1, now)
+            self._ack(MASK_ACK, pin, now)
+        elif command == SEQ_STEP:
+            if len(self._steps) == SEQUENCE_SLOTS:
+                self._ack(SEQUENCE_ACK, -1, now)
+            else:
+                self._steps.append(
+                    (int.from_bytes(args[:4], "little") * 1e-6, pin,
+                     int.from_bytes(args[4:], "little") * 1e-6))
+        elif command == SEQ_START:
+            self._sequence = now
+            self._ack(SEQUENCE_ACK, 0, now)
+        elif command == SEQ_STOP:
+            self._sequence = None
+            self._steps = []
+            for output in self._pulses:
+                self._pulses[output] = now
+            self._end_pulses(now)
+            self._ack(SEQUENCE_ACK, 1, now)
+        elif command == SET_DEBOUNCE:
+            self.debounce = int.from_bytes(args, "little") * 1e-6
+        elif command == SET_BIN:
+            self.bin = int.from_bytes(args, "little") * 1e-6
+            self._bin_start = now
+            self._counts = {}
+        elif command == PING:
+            self._flush()
+            self._send(encode_frame(PONG, [(pin - 256 if pin > 127 else pin,
+                                            self.micros(now))]))
+        elif command == HELLO:
+            self._flush()
+            self._send(encode_frame(VERSION, [(pin - 256 if pin > 127 else pin,
+                                               self.build)]))
+
+    def _schedule_licks(self, now: float) -> float:
+        if self.lick_rate > 0. and self.lick_pins() and not self._licks:
+            onset = now + self._rng.expovariate(self.lick_rate)
+            pin = self._rng.choice(self.lick_pins())
+            insort(self._licks, (onset, pin))
+            insort(self._licks, (onset + self.lick_duration, -pin))
+        return self._licks[0][0] if self._licks else now + 0.01
+
+    def _run(self) -> None:
+        pending = b""
+        while not self._stop.is_set():
+            now = perf_counter()
+            while self._inbox and self._inbox[0][0] <= now:
+                pending = self._execute(pending + self._inbox.pop(0)[1])
+            while self._outbox and self._outbox[0][0] <= now:
+                os.write(self._master, self._outbox.pop(0)[1])
+            with self._lock:
+                due = self._schedule_licks(now)
+                while self._licks and self._licks[0][0] <= now:
+                    _, key = self._licks.pop(0)
+                    self._report(key, now)
+            self._run_steps(now)
+            self._end_pulses(now)
+            if self.bin and now - self._bin_start >= self.bin:
+                self._send_counts(now)
+            if self.bin:
+                due = min(due, self._bin_start + self.bin)
+            if self._edges and now - self._first >= EDGE_FLUSH:
+                self._flush()
+            if self._edges:
+                due = min(due, self._first + EDGE_FLUSH)
+            if self._pulses:
+                due = min(due, min(self._pulses.values()))
+            if self._sequence is not None and self._steps:
+                due = min(due, self._sequence + self._steps[0][0])
+            if self._inbox:
+                due = min(due, self._inbox[0][0])
+            if self._outbox:
+                due = min(due, self._outbox[0][0])
+            ready, _, _ = select.select([self._master], [], [],
+                                        max(due - perf_counter(), 0.))
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                break
+            if self.command_latency > 0.:
+                self._inbox.append((perf_counter() + self.command_latency,
+                                    data))
+            else:
+                pending = self._execute(pending + data)
+        return None
+
+    def _execute(self, pending: bytes) -> bytes:
+        # Runs every whole command in `pending`, returning the rest.
+        while len(pending) >= 2:
+            command, pin = pending[0], pending[1]
+            size = 2 + ARGUMENTS.get(command, 0)
+            if len(pending) < size:
+                break
+            self._command(command, pin, pending[2:size])
+            pending = pending[size:]
+        return pending
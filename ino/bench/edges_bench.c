@@ -0,0 +1,102 @@
+// Native check and benchmark of ../edges.h, against a lick sensor that
+// chatters around every transition:
+//
+//   cc -O2 -I.. -o edges_bench edges_bench.c && ./edges_bench
+#include <assert.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#include "edges.h"
+
+#define LICK_PIN 10         // PINB bit 2
+#define SAMPLE_US 8         // one pass of the firmware's idle loop
+#define LICK_PERIOD_US 100000
+#define LICK_CONTACT_US 30000
+#define BOUNCE_US 1000
+
+static long onsets = 0;
+static long offsets = 0;
+
+static void count(int key, unsigned long stamp) {
+  (void)stamp;
+  if (key > 0) {
+    onsets++;
+  } else {
+    offsets++;
+  }
+}
+
+// Level of the (pulled-up) sensor at `t`: LOW while in contact, toggling
+// pseudo-randomly through the first BOUNCE_US of each transition.
+static int level(uint32_t t) {
+  uint32_t phase = t % LICK_PERIOD_US;
+  uint32_t from_edge = phase < LICK_CONTACT_US ? phase
+                                               : phase - LICK_CONTACT_US;
+  int contact = phase < LICK_CONTACT_US;
+  if (from_edge < BOUNCE_US && ((t / 64) * 2654435761u >> 28) & 1) {
+    contact = !contact;
+  }
+  return !contact;
+}
+
+static double run(EdgeDetector *d, long samples, int chatter) {
+  struct timespec a, b;
+  uint32_t t = 0;
+  clock_gettime(CLOCK_MONOTONIC, &a);
+  for (long i=0; i<samples; i++) {
+    uint8_t pinb = (chatter ? level(t) : 1) << (LICK_PIN - 8);
+    edgesSample(d, 0, 0xFF, t, count);
+    edgesSample(d, 1, pinb, t, count);
+    t += SAMPLE_US;
+  }
+  clock_gettime(CLOCK_MONOTONIC, &b);
+  return ((b.tv_sec - a.tv_sec) * 1e9 + (b.tv_nsec - a.tv_nsec)) / samples;
+}
+
+int main(void) {
+  EdgeDetector d;
+  long samples = 10 * 1000 * 1000;
+  long licks = samples * SAMPLE_US / LICK_PERIOD_US;
+
+  edgesInit(&d);
+  edgesWatch(&d, LICK_PIN, 1);
+  double quiet = run(&d, samples, 0);
+  assert(onsets == 0 && offsets == 0);
+
+  edgesInit(&d);
+  edgesWatch(&d, LICK_PIN, 1);
+  run(&d, samples, 1);
+  printf("no debounce: %ld onsets for %ld licks\n", onsets, licks);
+  assert(onsets > licks);
+
+  onsets = offsets = 0;
+  edgesInit(&d);
+  d.debounce = 2000;
+  edgesWatch(&d, LICK_PIN, 1);
+  double chatter = run(&d, samples, 1);
+  printf("2 ms debounce: %ld onsets, %ld offsets\n", onsets, offsets);
+  assert(labs(onsets - licks) <= 1 && labs(offsets - licks) <= 1);
+
+  int8_t keys[EDGE_PORTS * 8];
+  uint16_t counts[EDGE_PORTS * 8];
+  long binned = 0;
+  onsets = offsets = 0;
+  edgesInit(&d);
+  d.debounce = 2000;
+  edgesSetBin(&d, 1000000, 0);
+  edgesWatch(&d, LICK_PIN, 1);
+  for (uint32_t t=0; t<(uint32_t)samples * SAMPLE_US; t+=SAMPLE_US) {
+    edgesSample(&d, 1, level(t) << (LICK_PIN - 8), t, count);
+    int n = edgesTakeCounts(&d, t, keys, counts);
+    for (int i=0; i<n; i++) {
+      assert(keys[i] == LICK_PIN);
+      binned += counts[i];
+    }
+  }
+  printf("1 s bins: %ld onsets counted\n", binned);
+  assert(onsets == 0 && labs(binned - licks) <= 10);
+
+  printf("%.1f ns per sample quiet, %.1f ns chattering\n", quiet, chatter);
+  return 0;
+}
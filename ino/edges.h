@@ -0,0 +1,129 @@
+// Edge detection over whole input ports, with debouncing and optional
+// binned onset counts. Plain C with no Arduino calls, so that
+// bench/edges_bench.c can build and time it natively.
+#ifndef EDGES_H
+#define EDGES_H
+
+#include <stdint.h>
+
+#define EDGE_PORTS 2  // 0: PIND (pins 0-7), 1: PINB (pins 8-13)
+
+typedef void (*EdgeSink)(int key, unsigned long stamp);
+
+typedef struct {
+  uint8_t mask;        // watched pins
+  uint8_t raw;         // last sample
+  uint8_t stable;      // debounced level
+  uint32_t since[8];   // when each pin last changed
+  uint16_t counts[8];  // onsets in the current bin
+} EdgePort;
+
+typedef struct {
+  EdgePort ports[EDGE_PORTS];
+  uint32_t debounce;   // micros a level must hold before it is reported
+  uint32_t bin;        // 0 reports every edge, else onsets per bin
+  uint32_t binStart;
+} EdgeDetector;
+
+static inline void edgesInit(EdgeDetector *d) {
+  for (int p=0; p<EDGE_PORTS; p++) {
+    d->ports[p].mask = 0;
+    d->ports[p].raw = 0;
+    d->ports[p].stable = 0;
+    for (int b=0; b<8; b++) {
+      d->ports[p].since[b] = 0;
+      d->ports[p].counts[b] = 0;
+    }
+  }
+  d->debounce = 0;
+  d->bin = 0;
+  d->binStart = 0;
+}
+
+// `level` is the pin's present level, so that watching it reports nothing.
+static inline void edgesWatch(EdgeDetector *d, int pin, int level) {
+  EdgePort *port = &d->ports[pin >> 3];
+  uint8_t bit = 1 << (pin & 7);
+  port->mask |= bit;
+  if (level) {
+    port->raw |= bit;
+    port->stable |= bit;
+  } else {
+    port->raw &= ~bit;
+    port->stable &= ~bit;
+  }
+  port->counts[pin & 7] = 0;
+}
+
+static inline void edgesUnwatch(EdgeDetector *d, int pin) {
+  d->ports[pin >> 3].mask &= ~(1 << (pin & 7));
+}
+
+// One sample of a whole port. A pin is reported once its new level has
+// held for `debounce` micros, stamped with its last change (the end of any
+// bouncing); a falling edge (contact, with the pull-up) is +pin, a rising
+// one -pin.
+static inline void edgesSample(EdgeDetector *d, int p, uint8_t raw,
+                               uint32_t now, EdgeSink sink) {
+  EdgePort *port = &d->ports[p];
+  raw &= port->mask;
+  uint8_t changed = raw ^ port->raw;
+  uint8_t pending = raw ^ port->stable;
+  port->raw = raw;
+  if (!(changed | pending)) {
+    return;
+  }
+  for (int b=0; b<8; b++) {
+    uint8_t bit = 1 << b;
+    if (changed & bit) {
+      port->since[b] = now;
+    }
+    if ((pending & bit) && now - port->since[b] >= d->debounce) {
+      int key = (p << 3) | b;
+      port->stable ^= bit;
+      if (d->bin) {
+        port->counts[b] += !(raw & bit);
+      } else {
+        sink((raw & bit) ? -key : key, port->since[b]);
+      }
+    }
+  }
+}
+
+// Once the current bin is over: the pins with onsets in it and their
+// counts, returning how many (the counts are then cleared); -1 before that.
+static inline int edgesTakeCounts(EdgeDetector *d, uint32_t now,
+                                  int8_t *keys, uint16_t *counts) {
+  if (!d->bin || now - d->binStart < d->bin) {
+    return -1;
+  }
+  int n = 0;
+  for (int p=0; p<EDGE_PORTS; p++) {
+    for (int b=0; b<8; b++) {
+      if (d->ports[p].counts[b]) {
+        keys[n] = (p << 3) | b;
+        counts[n] = d->ports[p].counts[b];
+        d->ports[p].counts[b] = 0;
+        n++;
+      }
+    }
+  }
+  // Bins stay on a fixed grid unless the loop fell a whole bin behind.
+  d->binStart += d->bin;
+  if (now - d->binStart >= d->bin) {
+    d->binStart = now;
+  }
+  return n;
+}
+
+static inline void edgesSetBin(EdgeDetector *d, uint32_t bin, uint32_t now) {
+  d->bin = bin;
+  d->binStart = now;
+  for (int p=0; p<EDGE_PORTS; p++) {
+    for (int b=0; b<8; b++) {
+      d->ports[p].counts[b] = 0;
+    }
+  }
+}
+
+#endif
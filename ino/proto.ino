@@ -1,12 +1,15 @@
 #include <Servo.h>
 
+#include "edges.h"
 
-struct StateTransitionPin {
-  int pins[13];
-  int currState[13];
-  int prevState[13];
-  int pinNum;
-};
+// Written by the host (claudio/firmware.py) before each upload, so that it
+// can tell whether the board already runs these sources.
+#if __has_include("build_hash.h")
+#include "build_hash.h"
+#endif
+#ifndef BUILD_HASH
+#define BUILD_HASH 0UL
+#endif
 
 
 typedef void (*ptrDigitalWrite)(void);
@@ -53,82 +56,280 @@ ptrDigitalWrite digiLOW[14] = {
   digiLOW8, digiLOW9, digiLOW10, digiLOW11, digiLOW12, digiLOW13
 };
 
-typedef int (*ptrDigiRead)(void);
-
-int digiRead0() { return PIND & _BV(0); }
-int digiRead1() { return PIND & _BV(1); }
-int digiRead2() { return PIND & _BV(2); }
-int digiRead3() { return PIND & _BV(3); }
-int digiRead4() { return PIND & _BV(4); }
-int digiRead5() { return PIND & _BV(5); }
-int digiRead6() { return PIND & _BV(6); }
-int digiRead7() { return PIND & _BV(7); }
-int digiRead8() { return PINB & _BV(0); }
-int digiRead9() { return PINB & _BV(1); }
-int digiRead10() { return PINB & _BV(2); }
-int digiRead11() { return PINB & _BV(3); }
-int digiRead12() { return PINB & _BV(4); }
-int digiRead13() { return PINB & _BV(5); }
-
-ptrDigiRead digiRead[14] = {
-  digiRead0, digiRead1, digiRead2, digiRead3, digiRead4, digiRead5, digiRead6, digiRead7,
-  digiRead8, digiRead9, digiRead10, digiRead11, digiRead12, digiRead13
+// Input pins are sampled a port at a time; see edges.h.
+EdgeDetector detector;
+
+void watchPin(int pin, int mode) {
+  pinMode(pin, mode);
+  edgesWatch(&detector, pin, digitalRead(pin));
+}
+
+void unwatchPin(int pin) {
+  edgesUnwatch(&detector, pin);
+}
+
+// Frames: 0xA5, type, count, count * 5-byte records, XOR of type..records.
+// A record is a signed key byte (pin, or ping sequence) and micros() LE.
+#define FRAME_SYNC 0xA5
+#define FRAME_EDGE 0x01
+#define FRAME_PONG 0x02
+#define FRAME_PULSE 0x03     // key +pin when a pulse starts, -pin when it ends
+#define FRAME_MASK 0x04      // key is the port written
+#define FRAME_SEQUENCE 0x05  // key 0 started, 1 stopped, -1 step dropped
+#define FRAME_COUNT 0x06     // onsets per pin over a bin, in place of edges
+#define FRAME_VERSION 0x07   // key echoes HELLO, the stamp is BUILD_HASH
+#define RECORD_SIZE 5
+#define EDGE_MAX 12          // 3 + 12 * 5 + 1 bytes fits the 64-byte TX ring
+#define EDGE_FLUSH_US 500UL
+
+
+struct EdgeBuffer {
+  byte data[EDGE_MAX * RECORD_SIZE];
+  byte count;
+  unsigned long first;
 };
 
-StateTransitionPin initSSPin() {
-  StateTransitionPin sspin;
-  for(int i=0; i<13; i++) {
-    sspin.pins[i] = 0;
-    sspin.currState[i] = 0;
-    sspin.prevState[i] = 0;
-  };
-  sspin.pinNum = 0;
-  return sspin;
+EdgeBuffer edges = { {0}, 0, 0 };
+
+
+void packRecord(byte *dst, int key, unsigned long stamp) {
+  dst[0] = (byte)(signed char)key;
+  dst[1] = stamp & 0xFF;
+  dst[2] = (stamp >> 8) & 0xFF;
+  dst[3] = (stamp >> 16) & 0xFF;
+  dst[4] = (stamp >> 24) & 0xFF;
 }
 
-void setPinModeSS(StateTransitionPin *sspin, int pin, int mode) {
-  pinMode(pin, mode);
-  sspin->pins[sspin->pinNum] = pin;
-  sspin->pinNum++;
-}
-
-void resetPinModeSS(StateTransitionPin *sspin, int pin) {
-  if (sspin->pinNum > 0) {
-    for (int i=0; i<sspin->pinNum; i++) {
-      if (sspin->pins[i] == pin) {
-        sspin->pinNum--;
-        for (int j=i; j<13; j++) {
-          if (j < 13) {
-            sspin->pins[j] = sspin->pins[j+1];
-          } else {
-            sspin->pins[j] = 0;
-          }
-        }
-      }
+void sendFrame(byte type, const byte *payload, byte count) {
+  byte head[3] = { FRAME_SYNC, type, count };
+  byte sum = type ^ count;
+  for (int i=0; i<count * RECORD_SIZE; i++) {
+    sum ^= payload[i];
+  }
+  Serial.write(head, 3);
+  Serial.write(payload, count * RECORD_SIZE);
+  Serial.write(sum);
+}
+
+void flushEdges() {
+  if (edges.count > 0) {
+    sendFrame(FRAME_EDGE, edges.data, edges.count);
+    edges.count = 0;
+  }
+}
+
+void reportEdge(int pin, unsigned long stamp) {
+  if (edges.count == 0) {
+    edges.first = stamp;
+  }
+  packRecord(&edges.data[edges.count * RECORD_SIZE], pin, stamp);
+  edges.count++;
+  if (edges.count == EDGE_MAX) {
+    flushEdges();
+  }
+}
+
+void sendCounts(unsigned long stamp, const int8_t *keys,
+                const uint16_t *counts, int n) {
+  // (0, end of the bin), then (pin, onsets) for each pin that had any.
+  byte data[EDGE_MAX * RECORD_SIZE];
+  int i = 0;
+  flushEdges();
+  do {
+    byte count = 1;
+    packRecord(data, 0, stamp);
+    while (i < n && count < EDGE_MAX) {
+      packRecord(&data[count * RECORD_SIZE], keys[i], counts[i]);
+      count++;
+      i++;
+    }
+    sendFrame(FRAME_COUNT, data, count);
+  } while (i < n);
+}
+
+void sampleInputs() {
+  unsigned long stamp = micros();
+  edgesSample(&detector, 0, PIND, stamp, reportEdge);
+  edgesSample(&detector, 1, PINB, stamp, reportEdge);
+  if (detector.bin) {
+    int8_t keys[EDGE_PORTS * 8];
+    uint16_t counts[EDGE_PORTS * 8];
+    int n = edgesTakeCounts(&detector, stamp, keys, counts);
+    if (n >= 0) {
+      sendCounts(stamp, keys, counts, n);
     }
   }
+  if (edges.count > 0 && stamp - edges.first >= EDGE_FLUSH_US) {
+    flushEdges();
+  }
 }
 
-void checkPinState(StateTransitionPin *sspin) {
-  for(int i=0; i<sspin->pinNum; i++) {
-    int pin = sspin->pins[i];
-    // sspin->currState[i] = digitalRead(pin);
-    sspin->currState[i] = digiRead[pin]();
-    if (sspin->prevState[i] && !sspin->currState[i]) {
-      Serial.println(pin);
+void sendAck(byte type, int key, unsigned long stamp) {
+  byte ack[RECORD_SIZE];
+  flushEdges();
+  packRecord(ack, key, stamp);
+  sendFrame(type, ack, 1);
+}
+
+
+// Pulses are timed here, not by the host: the pin goes HIGH on the command
+// and LOW once `length` micros have passed, both edges acknowledged.
+#define PULSE_MAX 4
+
+struct Pulse {
+  int pin;
+  unsigned long start;
+  unsigned long length;
+};
+
+Pulse pulses[PULSE_MAX];
+byte pulseCount = 0;
+
+void endPulse(byte i) {
+  int pin = pulses[i].pin;
+  digiLOW[pin]();
+  unsigned long stamp = micros();
+  pulses[i] = pulses[--pulseCount];
+  sendAck(FRAME_PULSE, -pin, stamp);
+}
+
+void startPulse(int pin, unsigned long length) {
+  byte i = 0;
+  // A pin already pulsing is restarted; with every slot taken, the oldest
+  // pulse is cut short.
+  while (i < pulseCount && pulses[i].pin != pin) {
+    i++;
+  }
+  if (i == PULSE_MAX) {
+    endPulse(0);
+    i = pulseCount;
+  }
+  digiHIGH[pin]();
+  unsigned long stamp = micros();
+  pulses[i].pin = pin;
+  pulses[i].start = stamp;
+  pulses[i].length = length;
+  if (i == pulseCount) {
+    pulseCount++;
+  }
+  sendAck(FRAME_PULSE, pin, stamp);
+}
+
+void servicePulses() {
+  unsigned long now = micros();
+  byte i = 0;
+  while (i < pulseCount) {
+    if (now - pulses[i].start >= pulses[i].length) {
+      endPulse(i);
+    } else {
+      i++;
     }
-    if (!sspin->prevState[i] && sspin->currState[i]) {
-      Serial.println(-pin);
+  }
+}
+
+// One store per port, so every pin in `mask` changes together. Pins 0 and 1
+// carry the serial line and are left alone.
+void writeMask(int port, byte mask, byte value) {
+  if (port == 0) {
+    mask &= 0xFC;
+    PORTD = (PORTD & ~mask) | (value & mask);
+  } else {
+    mask &= 0x3F;
+    PORTB = (PORTB & ~mask) | (value & mask);
+  }
+  sendAck(FRAME_MASK, port, micros());
+}
+
+
+// A timeline of pulses uploaded ahead of time, `at` micros after the
+// sequence starts. The host keeps the ring topped up; each step is
+// acknowledged like any other pulse.
+#define SEQ_MAX 32
+
+struct Step {
+  int pin;
+  unsigned long at;
+  unsigned long length;
+};
+
+struct Sequence {
+  Step steps[SEQ_MAX];
+  byte head;
+  byte count;
+  bool running;
+  unsigned long origin;
+};
+
+Sequence seq = { {}, 0, 0, false, 0 };
+
+void queueStep(int pin, unsigned long at, unsigned long length) {
+  if (seq.count == SEQ_MAX) {
+    sendAck(FRAME_SEQUENCE, -1, micros());
+    return;
+  }
+  Step *step = &seq.steps[(seq.head + seq.count) % SEQ_MAX];
+  step->pin = pin;
+  step->at = at;
+  step->length = length;
+  seq.count++;
+}
+
+void startSequence() {
+  seq.origin = micros();
+  seq.running = true;
+  sendAck(FRAME_SEQUENCE, 0, seq.origin);
+}
+
+void stopSequence() {
+  seq.running = false;
+  seq.count = 0;
+  while (pulseCount > 0) {
+    endPulse(0);
+  }
+  sendAck(FRAME_SEQUENCE, 1, micros());
+}
+
+void serviceSequence() {
+  unsigned long now = micros();
+  while (seq.running && seq.count > 0) {
+    Step *step = &seq.steps[seq.head];
+    // Signed difference, so that a session may outlast the micros() wrap.
+    if ((long)(now - (seq.origin + step->at)) < 0) {
+      break;
     }
-    sspin->prevState[i] = sspin->currState[i];
+    startPulse(step->pin, step->length);
+    seq.head = (seq.head + 1) % SEQ_MAX;
+    seq.count--;
   }
 }
 
 
 Servo servos[14];
-StateTransitionPin sspin = initSSPin();
+
+void idle() {
+  serviceSequence();
+  servicePulses();
+  sampleInputs();
+}
+
+int waitByte() {
+  int v;
+  while ((v = Serial.read()) == -1) {
+    idle();
+  }
+  return v;
+}
+
+unsigned long waitLong() {
+  unsigned long v = 0;
+  for (int i=0; i<4; i++) {
+    v |= (unsigned long)waitByte() << (8 * i);
+  }
+  return v;
+}
 
 void setup() {
+  edgesInit(&detector);
   Serial.begin(115200);
 }
 
@@ -137,47 +338,42 @@ void loop() {
   int command;
 
   while (1) {
-    while ((command = Serial.read()) == -1) {
-      checkPinState(&sspin);
-    };
-
-    while ((pin = Serial.read() ) == -1) {
-      checkPinState(&sspin);
-    };
+    command = waitByte();
+    pin = waitByte();
 
     switch (command) {
       // pinMode: '\x00' - '\x09'
       case '\x00': {
         pinMode(pin, INPUT);
-        resetPinModeSS(&sspin, pin);
+        unwatchPin(pin);
         break;
       }
 
       case '\x01': {
         pinMode(pin, INPUT_PULLUP);
-        resetPinModeSS(&sspin, pin);
+        unwatchPin(pin);
         break;
       }
 
       case '\x02': {
         pinMode(pin, OUTPUT);
-        resetPinModeSS(&sspin, pin);
+        unwatchPin(pin);
         break;
       }
 
       case '\x03': {
         servos[pin].attach(pin);
-        resetPinModeSS(&sspin, pin);
+        unwatchPin(pin);
         break;
       }
 
       case '\x04': {
-        setPinModeSS(&sspin, pin, INPUT);
+        watchPin(pin, INPUT);
         break;
       }
 
       case '\x05': {
-        setPinModeSS(&sspin, pin, INPUT_PULLUP);
+        watchPin(pin, INPUT_PULLUP);
         break;
       }
 
@@ -193,26 +389,30 @@ void loop() {
       }
 
       case '\x12': {
-        int v;
-        while ( (v = Serial.read()) == -1) {
-          checkPinState(&sspin);
-        };
-        analogWrite(pin, v);
+        analogWrite(pin, waitByte());
         break;
       }
 
       case '\x13': {
-        int angle;
-        while ( (angle = Serial.read()) == -1) {
-          checkPinState(&sspin);
-        };
-        servos[pin].write(angle);
+        servos[pin].write(waitByte());
+        break;
+      }
+
+      case '\x14': {
+        startPulse(pin, waitLong());
+        break;
+      }
+
+      case '\x15': {
+        byte mask = waitByte();
+        byte value = waitByte();
+        writeMask(pin, mask, value);
         break;
       }
 
       // read: '\x20' - '\x29'
       case '\x20': {
-        int state = digiRead[pin]();
+        int state = (pin < 8 ? PIND : PINB) & _BV(pin & 7);
         Serial.write(state);
         break;
       }
@@ -223,6 +423,49 @@ void loop() {
         break;
       }
 
+      // clock: '\x30' - '\x39'
+      case '\x30': {
+        byte pong[RECORD_SIZE];
+        unsigned long stamp = micros();
+        flushEdges();
+        packRecord(pong, pin, stamp);
+        sendFrame(FRAME_PONG, pong, 1);
+        break;
+      }
+
+      case '\x31': {
+        sendAck(FRAME_VERSION, pin, BUILD_HASH);
+        break;
+      }
+
+      // sequence: '\x40' - '\x49'
+      case '\x40': {
+        unsigned long at = waitLong();
+        queueStep(pin, at, waitLong());
+        break;
+      }
+
+      case '\x41': {
+        startSequence();
+        break;
+      }
+
+      case '\x42': {
+        stopSequence();
+        break;
+      }
+
+      // inputs: '\x50' - '\x59'
+      case '\x50': {
+        detector.debounce = waitLong();
+        break;
+      }
+
+      case '\x51': {
+        edgesSetBin(&detector, waitLong(), micros());
+        break;
+      }
+
       default: {
         break;
       }
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scripts run from claudio/ and import their siblings top-level.
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "claudio"))
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pytest
+
+from analysis import (build_cache, iti_rates, load_session, load_sessions,
+                      parse_name, peak_function, peth, summarize)
+from events import EVENT_DTYPE, write_binary, write_csv
+
+LICK = 10
+US = 12
+
+
+def session(us: list, licks: list) -> np.ndarray:
+    records = np.zeros(len(us) + len(licks), EVENT_DTYPE)
+    records["time"] = us + licks
+    records["event"] = [US] * len(us) + [LICK] * len(licks)
+    return records[np.argsort(records["time"], kind="stable")]
+
+
+def test_iti_rates():
+    marks = np.array([0., 10., 15., 35.])
+    times = np.array([1., 2., 11., 12., 13., 14., 20.])
+    assert iti_rates(times, marks).tolist() == [0.2, 0.8, 0.05]
+
+
+def test_peth_matches_a_loop():
+    rng = np.random.default_rng(0)
+    times = np.sort(rng.uniform(0., 100., 500))
+    refs = np.sort(rng.uniform(5., 95., 20))
+    edges, rate = peth(times, refs, (-2., 3.), 0.5)
+    expected = np.zeros(len(edges) - 1)
+    for ref in refs:
+        expected += np.histogram(times - ref, edges)[0]
+    assert np.allclose(rate, expected / (len(refs) * 0.5))
+
+
+def test_peak_function_uses_probes_only():
+    # USs every 10 s, with the two at 40 and 50 s withheld.
+    marks = np.array([0., 10., 20., 30., 60., 70.])
+    licks = np.array([5., 15., 32.5, 33., 38., 65.])
+    edges, rate = peak_function(licks, marks, 5., 40.)
+    assert edges.tolist() == [0., 5., 10., 15., 20., 25., 30., 35., 40.]
+    assert rate[:2].tolist() == [0.4, 0.2]
+    assert rate[2:6].tolist() == [0.] * 4
+    # The probe lasted 30 s.
+    assert np.isnan(rate[6:]).all()
+    assert np.isnan(peak_function(licks, marks[:1])[1]).all()
+
+
+def test_cache_is_reused_and_rebuilt(tmp_path):
+    path = str(tmp_path / "20240101_m1_train.csv")
+    cache = str(tmp_path / "cache")
+    write_csv(path, session([10., 20.], [5., 15.]))
+    where = build_cache(path, cache)
+    column = os.path.join(where, "time.npy")
+    built = os.stat(column).st_mtime_ns
+    # A new mtime with the same content only refreshes the stamp.
+    os.utime(path, ns=(built + 10**9, built + 10**9))
+    assert build_cache(path, cache) == where
+    assert os.stat(column).st_mtime_ns == built
+    write_csv(path, session([10., 20., 30.], [5.]))
+    assert load_session(path, cache).times(US).tolist() == [10., 20., 30.]
+    assert np.array_equal(load_session(path, cache).event,
+                          load_session(path, None).event)
+
+
+def test_summarize_sessions(tmp_path):
+    paths = [str(tmp_path / f"20240101_m{i}_train.bin") for i in (1, 2)]
+    for path in paths:
+        write_binary(path, session([0., 10., 20.], [2., 4., 15.]))
+    sessions = load_sessions(paths, str(tmp_path / "cache"), processes=1)
+    row = summarize(sessions[1], LICK, US)
+    assert (row["subject"], row["licks"], row["us"]) == ("m2", 3, 3)
+    assert row["iti_rate"] == pytest.approx(0.15)
+
+
+def test_parse_name():
+    assert parse_name("a/20240101_m1_train.csv") == \
+        {"date": "20240101", "subject": "m1", "condition": "train"}
+    assert parse_name("20240101_Box_1_m1_train.csv") == \
+        {"stem": "20240101_Box_1_m1_train"}
+    assert parse_name("20240101_B1_m1_train.bin")["chamber"] == "B1"
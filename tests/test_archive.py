@@ -0,0 +1,42 @@
+import numpy as np
+
+from archive import Archive
+from events import EVENT_DTYPE, write_csv
+from schedule import compile_schedule
+
+US = 12
+LICK = 7
+
+
+def test_complete_counts(tmp_path):
+    # Extinction: 3 acquisition, 3 extinction (omitted US), 3 reacquisition.
+    var = {"trial": 6, "mean-iti": 10., "cs-duration": 1.,
+           "us-duration": 0.05, "schedule-seed": 0}
+    table = compile_schedule(var, "extinction")
+    assert len(table) == 9
+    rows = [(0., 0)]
+    for trial in table:
+        rows.append((trial["cs_onset"] - 0.5, LICK))
+        rows.append((trial["cs_onset"] - 0.45, -LICK))
+        rows.append((trial["us_offset"], US if trial["us"] else -US))
+    events = np.zeros(len(rows), EVENT_DTYPE)
+    events["time"], events["event"] = np.array(rows).T
+    path = str(tmp_path / "session.csv")
+    write_csv(path, events)
+
+    with Archive(":memory:") as archive:
+        entry = archive.register(path, var, {"subject": "sub-01"},
+                                 "Box_1", "extinction")
+        assert archive.find(status="recording")[0]["id"] == entry
+        archive.complete(entry, path, table, LICK, US)
+        row = archive.find(subject="sub-01")[0]
+        assert row["status"] == "complete"
+        assert row["schedule"] == "extinction"
+        assert row["trials"] == 9
+        assert row["licks"] == 9
+        # Omission markers (-us) are not deliveries.
+        assert row["us"] == 6
+        assert row["events"] == len(events)
+        trials = archive.trials(entry)
+        assert [t["licks"] for t in trials] == [1] * 9
+        assert [t["us"] for t in trials] == [1] * 3 + [0] * 3 + [1] * 3
@@ -0,0 +1,36 @@
+from time import sleep
+
+import numpy as np
+import pytest
+
+from audio import AudioEngine
+
+
+def test_streams_are_shared_per_device():
+    engine = AudioEngine("fake")
+    try:
+        a = engine.open(None, 8000, blocksize=64)
+        assert engine.open(None, 8000, blocksize=64) is a
+        assert engine.open("USB", 8000, blocksize=64) is not a
+    finally:
+        engine.close()
+
+
+def test_chambers_on_one_device_keep_their_tones():
+    pytest.importorskip("amas")
+    from session import set_speaker
+
+    engine = AudioEngine("fake")
+    try:
+        stream = engine.open(None, 8000, blocksize=64)
+        box_1 = set_speaker(stream, np.full(32, 0.25), "cs-Box_1")
+        box_2 = set_speaker(stream, np.full(32, 0.5), "cs-Box_2")
+        for beep, level in ((box_1, 0.25), (box_2, 0.5)):
+            assert beep().wait(1.) is not None
+            # The whole tone is a few blocks long.
+            sleep(0.05)
+            played = np.concatenate(engine.backend.blocks)
+            engine.backend.blocks.clear()
+            assert played.max() == pytest.approx(level)
+    finally:
+        engine.close()
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+# audit.py reaches amas through scheduler.py.
+pytest.importorskip("amas")
+
+from audit import audit_line, audit_session, write_audit  # noqa
+from events import CSV_HEADER  # noqa
+from scheduler import timing_filename  # noqa
+
+TIMING_HEADER = "event, planned, actual, lateness, confirmed, woke\n"
+
+
+def session(tmp_path, rows: str, events: str = "") -> str:
+    filename = str(tmp_path / "session.csv")
+    with open(filename, "w") as f:
+        f.write(CSV_HEADER + events)
+    with open(timing_filename(filename), "w") as f:
+        f.write(TIMING_HEADER + rows)
+    return filename
+
+
+def test_header_only_timing(tmp_path):
+    filename = session(tmp_path, "")
+    report = audit_session(filename, {"us": 12})
+    assert report["stimuli"] == {}
+    assert report["worst"] == []
+    assert np.isnan(report["drift"])
+    assert write_audit(filename, {"us": 12})["stimuli"] == {}
+    assert audit_line(report) == "timing: "
+
+
+def test_lateness(tmp_path):
+    rows = "".join(f"12, {t}, {t + 0.001}, 0.001, nan, {t}\n"
+                   for t in (1., 2., 3., 4.))
+    report = audit_session(session(tmp_path, rows, "0.0, 0, 0\n"),
+                           {"us": 12})
+    issue = report["stimuli"]["us"]["issue"]
+    assert issue["n"] == 4
+    assert issue["p50"] == pytest.approx(0.001)
+    assert report["worst"][0]["late"] == pytest.approx(0.001)
@@ -0,0 +1,81 @@
+from time import perf_counter
+
+import numpy as np
+import pytest
+
+from clock import ClockSync
+from protocol import (MASK_ACK, MASK_EVENT, PORT_B, PORT_D, PULSE,
+                      PULSE_ACK, PULSE_EVENT, WRITE_MASK, Board, EdgeStream,
+                      encode_frame, port_of)
+from virtual_ino import VirtualArduino
+
+US = 12
+
+
+class Conn(object):
+    def __init__(self) -> None:
+        self.written = []
+
+    def write(self, data: bytes) -> None:
+        self.written.append(data)
+
+
+def test_pulse_bytes():
+    conn = Conn()
+    Board(conn).pulse(US, 0.05)
+    assert conn.written == [bytes([PULSE, US]) + (50000).to_bytes(4, "little")]
+    # Out of range durations are clamped, not wrapped.
+    Board(conn).pulse(US, -1.)
+    assert conn.written[-1][2:] == bytes(4)
+
+
+def test_write_pins_groups_by_port():
+    conn = Conn()
+    Board(conn).write_pins({2: 1, 5: 0, 9: 1, 13: 1})
+    assert conn.written == [
+        bytes([WRITE_MASK, PORT_D, 0b100100, 0b000100]),
+        bytes([WRITE_MASK, PORT_B, 0b100010, 0b100010]),
+    ]
+    assert port_of(8) == (PORT_B, 0)
+    with pytest.raises(ValueError):
+        port_of(14)
+
+
+def test_acks_become_events():
+    stream = EdgeStream(ClockSync())
+    chunk = encode_frame(PULSE_ACK, [(US, 1000), (-US, 51000)]) \
+        + encode_frame(MASK_ACK, [(PORT_B, 52000)])
+    events = stream.feed(chunk, 3.)
+    assert events["event"].tolist() == \
+        [PULSE_EVENT + US, -(PULSE_EVENT + US), MASK_EVENT + PORT_B]
+    # Before the clock is synced every event takes the arrival time.
+    assert events["time"].tolist() == [3., 3., 3.]
+
+
+def read_events(board: Board, stream: EdgeStream, n: int,
+                timeout: float = 2.) -> np.ndarray:
+    events = []
+    end = perf_counter() + timeout
+    while sum(map(len, events)) < n and perf_counter() < end:
+        chunk, received = board.read_chunk()
+        events.append(stream.feed(chunk, received))
+    return np.concatenate(events)
+
+
+def test_board_times_the_pulse():
+    with VirtualArduino() as virtual:
+        port = virtual.connect(timeout=0.1)
+        try:
+            board = Board(port)
+            board.pulse(US, 0.02)
+            board.write_pins({US: 1, 11: 1})
+            events = read_events(board, EdgeStream(ClockSync()), 3)
+        finally:
+            port.close()
+    assert events["event"].tolist() == \
+        [PULSE_EVENT + US, MASK_EVENT + PORT_B, -(PULSE_EVENT + US)]
+    (on, _, high), (off, _, low) = virtual.writes[0], virtual.writes[-1]
+    assert (high, low) == (1, 0)
+    assert off - on == pytest.approx(0.02, abs=0.005)
+    # The mask write set both pins in the same instant.
+    assert virtual.writes[1][0] == virtual.writes[2][0]
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+# calibration.py reaches amas through audit.py and scheduler.py.
+pytest.importorskip("amas")
+
+from calibration import Compensation, calibrate, load_compensation  # noqa
+from protocol import Board  # noqa
+from virtual_ino import VirtualArduino  # noqa
+
+US = 12
+LOOPBACK = 7
+
+
+def test_calibrate_recovers_the_link_latencies():
+    with VirtualArduino(command_latency=0.004,
+                        report_latency=0.001,
+                        loopback={US: LOOPBACK}) as virtual:
+        port = virtual.connect()
+        try:
+            table = calibrate(Board(port), US, LOOPBACK, trials=60,
+                              interval=0.01)
+        finally:
+            port.close()
+    assert table["missed"] == 0
+    assert table["round_trip"]["n"] == 60
+    write, report = table["write"]["p50"], table["report"]["p50"]
+    # Byte times and polling come on top of the simulated delays. The
+    # split rests on the clock sync, which takes delays as symmetric, so
+    # only the halves' sum is checked against the round trip.
+    assert table["round_trip"]["p50"] >= 0.005
+    assert write > 0. and report > 0.
+    assert write + report == pytest.approx(table["round_trip"]["p50"],
+                                           abs=1e-3)
+    assert table["compensation"] == {"write": write, "report": report}
+
+
+def test_calibrate_without_loopback():
+    with VirtualArduino() as virtual:
+        port = virtual.connect()
+        try:
+            with pytest.raises(ValueError, match="loopback"):
+                calibrate(Board(port), US, LOOPBACK, trials=3,
+                          interval=0.01, timeout=0.05)
+        finally:
+            port.close()
+
+
+def test_load_compensation(tmp_path):
+    assert load_compensation({}).write == 0.
+    path = tmp_path / "latency.json"
+    path.write_text(json.dumps(
+        {"compensation": {"write": 0.002, "report": 0.001}}))
+    compensation = load_compensation({"latency-table": str(path)})
+    assert isinstance(compensation, Compensation)
+    assert (compensation.write, compensation.report) == (0.002, 0.001)
@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+import pytest
+
+import clock
+from clock import WRAP, ClockSync, DeviceClock
+
+
+def test_device_clock_unwraps_micros():
+    device = DeviceClock()
+    first = device.seconds(np.array([WRAP - 2_000_000, WRAP - 1_000_000]))
+    second = device.seconds(np.array([500_000, 1_500_000]))
+    assert np.allclose(np.diff(np.concatenate([first, second])),
+                       [1., 1.5, 1.])
+    assert len(device.seconds(np.array([], np.uint32))) == 0
+
+
+def test_sync_recovers_offset_and_drift(monkeypatch):
+    # The device clock runs 50 ppm fast and started 100 s after the host's.
+    offset, drift = 100., -50e-6 / (1. + 50e-6)
+    rng = np.random.default_rng(0)
+    sync = ClockSync(window=32)
+    host = 100.
+    for i in range(64):
+        host += 0.5
+        monkeypatch.setattr(clock, "perf_counter", lambda t=host: t)
+        seq = sync.next_ping()
+        # Symmetric link delays; every fourth exchange is held up by USB.
+        delay = 0.0005 + (0.02 if i % 4 == 0 else 0.) + rng.uniform(0, 1e-4)
+        reply = host + delay
+        device = (reply - offset) / (1. + drift)
+        sync.pong(seq, device, reply + delay)
+    assert sync.synced
+    assert sync.offset == pytest.approx(offset, abs=1e-3)
+    assert sync.drift == pytest.approx(drift, abs=1e-6)
+    stamps = np.array([10., 20.])
+    times, error = sync.to_host(stamps, 0.)
+    assert np.allclose(times, offset + (1. + drift) * stamps, atol=1e-3)
+    assert 0.0005 <= error < 0.002
+
+
+def test_unsynced_stamps_fall_back_to_arrival():
+    sync = ClockSync()
+    times, error = sync.to_host(np.array([1., 2.]), 42.)
+    assert times.tolist() == [42., 42.] and math.isnan(error)
+
+
+def test_unknown_and_reordered_pongs_are_ignored(monkeypatch):
+    sync = ClockSync()
+    sync.pong(5, 1., 2.)
+    monkeypatch.setattr(clock, "perf_counter", lambda: 10.)
+    seq = sync.next_ping()
+    sync.pong(seq, 1., 9.)
+    assert not sync.synced
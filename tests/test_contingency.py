@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from contingency import (DRL, Contingency, FixedRatio, LickTriggered,
+                         VariableInterval, compile_session, open_contingency)
+
+
+def rng() -> np.random.Generator:
+    return np.random.default_rng(0)
+
+
+def test_fixed_ratio():
+    fr = FixedRatio(rng(), 3)
+    fr.start(0.)
+    assert [fr.respond(t) for t in (1., 2., 3.)] == [False, False, True]
+    fr.deliver(3.)
+    assert [fr.respond(t) for t in (4., 5., 6.)] == [False, False, True]
+    assert fr.responses == 6
+
+
+def test_variable_interval():
+    vi = VariableInterval(rng(), 10.)
+    vi.start(0.)
+    armed = vi.armed
+    assert armed > 0.
+    assert not vi.respond(armed - 1e-6)
+    assert vi.respond(armed)
+    # Unreinforced, it stays armed.
+    assert vi.respond(armed + 1.)
+    intervals = []
+    for _ in range(2000):
+        vi.deliver(0.)
+        intervals.append(vi.armed)
+    assert np.mean(intervals) == pytest.approx(10., rel=0.1)
+
+
+def test_drl():
+    drl = DRL(rng(), 5.)
+    drl.start(0.)
+    # Inter-response times of 3, 6, 1 and 5 s.
+    assert [drl.respond(t) for t in (3., 9., 10., 15.)] == \
+        [False, True, False, True]
+
+
+def test_lick_triggered():
+    lick = LickTriggered(rng(), 30., 5.)
+    assert lick.cue
+    lick.start(0.)
+    assert 25. <= lick.ready <= 35.
+    assert not lick.respond(lick.ready - 1.)
+    assert lick.respond(lick.ready)
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        FixedRatio(rng(), 0)
+    with pytest.raises(ValueError):
+        VariableInterval(rng(), 0.)
+    with pytest.raises(ValueError):
+        DRL(rng(), 0.)
+    with pytest.raises(ValueError):
+        open_contingency({"schedule": "DRL", "interval": -1.})
+    with pytest.raises(TypeError):
+        Contingency(rng())
+
+
+def test_open_contingency():
+    assert open_contingency({"schedule": "CS-US"}) is None
+    assert open_contingency({}, "PEAK") is None
+    fr = open_contingency({"schedule": "FR", "ratio": 4})
+    assert isinstance(fr, FixedRatio) and fr.ratio == 4
+    assert isinstance(open_contingency({}, "DRL"), DRL)
+
+
+def test_compile_session():
+    table, contingency = compile_session({"interval": 2.}, "VI")
+    assert len(table) == 0 and isinstance(contingency, VariableInterval)
+    table, contingency = compile_session(
+        {"trial": 4, "interval": 10., "us-duration": 0.05}, "FT")
+    assert len(table) == 4 and contingency is None
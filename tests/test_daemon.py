@@ -0,0 +1,53 @@
+import os
+import stat
+from time import sleep
+
+import pytest
+
+from daemon import Rig, parse_pairs, serve, socket_dir, socket_path
+
+
+def test_socket_dir_is_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert socket_path("rig1") == str(tmp_path / "claudio-rig1.sock")
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    path = socket_dir()
+    assert path == f"/tmp/claudio-{os.getuid()}"
+    assert stat.S_IMODE(os.lstat(path).st_mode) == 0o700
+
+
+def test_socket_dir_rejects_a_shared_directory(monkeypatch):
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    path = socket_dir()
+    os.chmod(path, 0o777)
+    try:
+        with pytest.raises(ValueError, match="private"):
+            socket_dir()
+    finally:
+        os.chmod(path, 0o700)
+
+
+def test_serve_leaves_other_files_alone(tmp_path):
+    pytest.importorskip("pino")
+    path = tmp_path / "claudio-rig1.sock"
+    path.write_text("not a socket")
+    with pytest.raises(ValueError, match="not a socket"):
+        serve("rig1", str(tmp_path / "rig.yml"), str(path))
+    assert path.read_text() == "not a socket"
+
+
+def test_release_joins_the_last_reader():
+    rig = Rig.__new__(Rig)
+    rig.name, rig.hardware = "rig1", None
+    rig.executor = rig.open_executor()
+    # A read still blocked on the port when the session ended.
+    read = rig.executor.submit(sleep, 0.1)
+    previous = rig.executor
+    rig.release({})
+    assert read.done()
+    assert rig.executor is not previous
+
+
+def test_parse_pairs():
+    assert parse_pairs(["trial=5", "cs=true", "speaker=hw:1", "x=a=b"]) == \
+        {"trial": 5, "cs": True, "speaker": "hw:1", "x": "a=b"}
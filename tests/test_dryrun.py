@@ -0,0 +1,40 @@
+import json
+
+import numpy as np
+import pytest
+
+# dryrun.py drives session.py, which needs amas.
+pytest.importorskip("amas")
+
+from dryrun import dry_run  # noqa
+from events import load_events  # noqa
+from schedule import compile_schedule  # noqa
+
+VAR = {
+    "trial": 5,
+    "mean-iti": 4.,
+    "range-iti": 1.,
+    "cs-duration": 1.,
+    "us-duration": 0.05,
+    "schedule-seed": 0,
+    "us": 12,
+}
+
+
+def us_times(path: str) -> np.ndarray:
+    records = load_events(path)
+    return records["time"][records["event"] == VAR["us"]]
+
+
+@pytest.mark.parametrize("sequence", [False, True])
+def test_write_compensation(tmp_path, sequence):
+    table = tmp_path / "latency.json"
+    table.write_text(json.dumps(
+        {"compensation": {"write": 0.004, "report": 0.001}}))
+    var = dict(VAR, sequence=sequence, **{"latency-table": str(table)})
+    path = str(tmp_path / "session.csv")
+    dry_run(var, path)
+    planned = compile_schedule(VAR, "CS-US")["us_offset"]
+    # Commands go out early by the write latency and a sequence plays on
+    # the board's clock: either way the US is logged when it was planned.
+    assert us_times(path) == pytest.approx(planned, abs=1e-6)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from events import (CSV_HEADER, DTYPES, EVENT_DTYPE, HEADER, HEADER_SIZE,
+                    MAGIC, EventBuffer, binary_to_csv, csv_to_binary,
+                    is_binary, load_events, write_binary, write_csv)
+
+
+def events(n: int) -> np.ndarray:
+    records = np.zeros(n, EVENT_DTYPE)
+    records["time"] = np.arange(n) * 0.25
+    records["event"] = np.arange(n) % 5 - 2
+    records["error"] = 1e-4
+    return records
+
+
+def test_buffer_grows_and_keeps_order():
+    buffer = EventBuffer(2)
+    for t, event, error in events(5).tolist():
+        buffer.append(t, event, error)
+    buffer.extend(events(7))
+    assert len(buffer) == 12
+    assert buffer.nbytes >= 12 * EVENT_DTYPE.itemsize
+    assert np.array_equal(buffer.records,
+                          np.concatenate([events(5), events(7)]))
+    assert buffer.times[-1] == 1.5 and buffer.events[0] == -2
+
+
+def test_take_empties_the_buffer():
+    buffer = EventBuffer()
+    buffer.extend(events(3))
+    taken = buffer.take()
+    assert len(buffer) == 0
+    # The copy is the caller's; refilling the buffer leaves it alone.
+    buffer.append(9., 1)
+    assert np.array_equal(taken, events(3))
+    buffer.clear()
+    assert len(buffer.records) == 0
+
+
+def test_binary_round_trip(tmp_path):
+    path = str(tmp_path / "session.bin")
+    write_binary(path, events(10))
+    assert is_binary(path)
+    with open(path, "rb") as f:
+        assert HEADER.unpack(f.read(HEADER_SIZE)) == \
+            (MAGIC, 2, EVENT_DTYPE.itemsize)
+    assert np.array_equal(load_events(path), events(10))
+
+
+def test_version_1_files(tmp_path):
+    old = np.zeros(3, DTYPES[1])
+    old["time"], old["event"] = [0.5, 1., 1.5], [7, -7, 12]
+    path = str(tmp_path / "old.bin")
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 1, DTYPES[1].itemsize) + old.tobytes())
+    records = load_events(path)
+    assert records["event"].tolist() == [7, -7, 12]
+    # A version 1 CSV has no error column.
+    path = str(tmp_path / "old.csv")
+    with open(path, "w") as f:
+        f.write("time, event\n0.5, 7\n1.0, -7\n")
+    records = load_events(path)
+    assert records.dtype == EVENT_DTYPE
+    assert records["time"].tolist() == [0.5, 1.]
+    assert not records["error"].any()
+
+
+def test_conversion(tmp_path):
+    csv, binary = str(tmp_path / "a.csv"), str(tmp_path / "a.bin")
+    write_csv(csv, events(6))
+    with open(csv) as f:
+        assert f.readline() == CSV_HEADER
+    csv_to_binary(csv, binary)
+    assert np.array_equal(load_events(binary), load_events(csv))
+    binary_to_csv(binary, csv)
+    assert np.allclose(load_events(csv)["time"], events(6)["time"])
+
+
+def test_unsupported_version(tmp_path):
+    path = str(tmp_path / "new.bin")
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 9, 14))
+    with pytest.raises(ValueError, match="unsupported"):
+        load_events(path)
@@ -0,0 +1,92 @@
+import sys
+import types
+
+import pytest
+
+from firmware import HEADER, build_hash, open_comport, stamp_sketch, wait_ready
+from protocol import Board
+from virtual_ino import VirtualArduino
+
+
+@pytest.fixture
+def sketch(tmp_path):
+    (tmp_path / "proto.ino").write_text("void setup() {}\n")
+    (tmp_path / "edges.h").write_text("#define EDGES 1\n")
+    return str(tmp_path / "proto.ino")
+
+
+def test_build_hash_covers_the_folder(sketch, tmp_path):
+    build = build_hash(sketch)
+    assert stamp_sketch(sketch) == build
+    header = tmp_path / HEADER
+    assert header.read_text() == f"#define BUILD_HASH 0x{build:08X}UL\n"
+    # The stamped header does not change the hash, so it is not rewritten.
+    stamped = header.stat().st_mtime_ns
+    assert stamp_sketch(sketch) == build
+    assert header.stat().st_mtime_ns == stamped
+    (tmp_path / "edges.h").write_text("#define EDGES 2\n")
+    assert stamp_sketch(sketch) != build
+
+
+def test_wait_ready():
+    with VirtualArduino(build=0x1234ABCD) as virtual:
+        port = virtual.connect(timeout=0.1)
+        try:
+            assert wait_ready(Board(port), 1.) == 0x1234ABCD
+        finally:
+            port.close()
+
+
+class Silent(object):
+    # A port on a board still in its bootloader.
+    in_waiting = 0
+
+    def write(self, data: bytes) -> None:
+        return None
+
+
+def test_wait_ready_gives_up():
+    assert wait_ready(Board(Silent()), 0.1, 0.02) is None
+
+
+def fake_pino(monkeypatch, virtual: VirtualArduino, uploads: list) -> None:
+    # pino's Comport, connecting to the virtual board; an upload flashes
+    # the stamped build.
+    class Comport(object):
+        def apply_settings(self, settings: dict) -> "Comport":
+            self.settings = settings
+            return self
+
+        def set_timeout(self, timeout: float) -> "Comport":
+            self.timeout = timeout
+            return self
+
+        def deploy(self) -> "Comport":
+            uploads.append(self.settings["dotino"])
+            virtual.build = build_hash(self.settings["dotino"])
+            return self
+
+        def connect(self):
+            port = virtual.connect(self.timeout)
+            port.disconnect = port.close
+            return port
+
+    ino = types.ModuleType("pino.ino")
+    ino.Comport = Comport
+    monkeypatch.setitem(sys.modules, "pino", types.ModuleType("pino"))
+    monkeypatch.setitem(sys.modules, "pino.ino", ino)
+
+
+def test_upload_only_when_the_build_changed(sketch, monkeypatch):
+    uploads = []
+    with VirtualArduino() as virtual:
+        fake_pino(monkeypatch, virtual, uploads)
+        settings = {"dotino": sketch, "port": virtual.port}
+        open_comport(settings, 0.1, 1.).close()
+        assert len(uploads) == 1
+        open_comport(settings, 0.1, 1.).close()
+        assert len(uploads) == 1
+        with open(sketch, "a") as f:
+            f.write("void loop() {}\n")
+        open_comport(settings, 0.1, 1.).close()
+        assert len(uploads) == 2
@@ -0,0 +1,64 @@
+from time import perf_counter, sleep
+
+import numpy as np
+import pytest
+
+# ingest.py reaches amas through audit.py and scheduler.py.
+pytest.importorskip("amas")
+
+from ingest import DONE, STOP, IngestProcess, SharedRing, drain  # noqa
+from virtual_ino import VirtualArduino  # noqa
+
+LICK = 7
+
+
+class Collect(object):
+    def __init__(self) -> None:
+        self.events = []
+
+    def extend(self, records: np.ndarray) -> None:
+        self.events.append(records.copy())
+
+
+def test_ring_wraps():
+    ring = SharedRing.create(8)
+    try:
+        out = Collect()
+        for start in (0, 5, 10):
+            events = np.zeros(5, ring.records.dtype)
+            events["time"] = np.arange(start, start + 5)
+            assert ring.write(events) == 5
+            assert drain(ring, out) == (5, 0)
+        assert np.concatenate(out.events)["time"].tolist() == \
+            list(range(15))
+        # Eight fit, the rest are counted rather than waited for.
+        assert ring.write(np.zeros(10, ring.records.dtype)) == 8
+        assert ring.counters()["overflow"] == 2
+    finally:
+        ring.close()
+
+
+def test_stop_flag_ends_ingest_before_the_last_drain():
+    with VirtualArduino() as virtual:
+        ingest = IngestProcess(virtual.port, {"lick": LICK}).start()
+        try:
+            sleep(0.2)
+            for i in range(20):
+                virtual.inject(LICK, i % 2)
+                sleep(0.002)
+            sleep(0.2)
+            ring = ingest.ring
+            ring.head[STOP] = 1
+            end = perf_counter() + 1.
+            while not ring.head[DONE] and perf_counter() < end:
+                sleep(0.005)
+            assert ring.head[DONE]
+            # The process ended on the flag alone.
+            ingest._process.join(1.)
+            assert not ingest._process.is_alive()
+            out = Collect()
+            drain(ring, out)
+            events = np.concatenate(out.events)["event"]
+            assert np.count_nonzero(np.abs(events) == LICK) == 20
+        finally:
+            ingest.stop()
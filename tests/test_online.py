@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+
+from online import PeakAnalyzer, peak_analyzer
+from schedule import CS, compile_schedule
+
+LICK = 7
+US = 12
+
+
+def analyzer(probes=None, **kwargs) -> PeakAnalyzer:
+    return PeakAnalyzer(LICK, [0, US, -US], probes, **kwargs)
+
+
+def test_licks_are_binned_from_each_mark():
+    peak = analyzer(span=10.)
+    assert not peak.push(0., 0)
+    for t in (0.5, 2.5, 2.6, 2.7):
+        peak.push(t, LICK)
+    # The US closes the first trial.
+    assert peak.push(4., US)
+    for t in (10.5, 12.5):
+        peak.push(t, LICK)
+    assert peak.push(20., -US)
+    snapshot = peak.snapshot()
+    assert (snapshot["trials"], snapshot["licks"]) == (2, 6)
+    # The first trial lasted 4 s, the second all 10.
+    assert peak.exposure[0].tolist() == [2] * 4 + [1] * 6
+    assert peak.counts[0].tolist() == [1, 0, 3, 0, 0, 0, 1, 0, 1, 0]
+    assert snapshot["rates"][0, 2] == 1.5
+    # The three-bin average centres the peak on bin 1.
+    assert snapshot["peak_time"] == 1.5
+    assert math.isnan(snapshot["rates"][1, 0])
+
+
+def test_debounce_and_outside():
+    peak = analyzer(span=2., debounce=0.02)
+    peak.push(0.01, LICK)
+    peak.push(1., 0)
+    peak.push(1.5, LICK)
+    peak.push(1.51, LICK)
+    peak.push(5., LICK)
+    # Before the first mark a lick has no trial; beyond the span it is
+    # counted as outside.
+    assert peak.bounced == 1
+    assert peak.licks == 1 and peak.outside == 1
+
+
+def test_probe_trials_are_kept_apart():
+    peak = analyzer(np.array([False, True]), span=4.)
+    peak.feed(np.array([0., 1.5, 2., 2.5, 3.5, 4.]),
+              np.array([0, LICK, US, LICK, LICK, -US]))
+    snapshot = peak.snapshot()
+    assert snapshot["probe_trials"] == 1
+    assert peak.counts[0].sum() == 1 and peak.counts[1].sum() == 2
+    # With a probe trial in, the peak is read from the probes.
+    assert snapshot["peak_time"] == 0.5
+
+
+def test_snapshot_changes_once_per_trial():
+    peak = analyzer()
+    peak.push(0., 0)
+    before = peak.snapshot()
+    peak.push(1., LICK)
+    assert peak.snapshot() is before
+
+
+def test_from_table():
+    var = {
+        "trial": 100,
+        "interval": 10.,
+        "us-duration": 0.05,
+        "peak-ratio": 0.15,
+        "lick": LICK,
+        "peak-align": "cs",
+        "edge-debounce": 0.01,
+    }
+    peak = peak_analyzer(compile_schedule(var, "PEAK"), var)
+    assert peak.marks == {CS} and peak.debounce == 0.
+    table = compile_schedule({"trial": 3, "interval": 10.,
+                              "us-duration": 0.05}, "FT")
+    assert peak_analyzer(table, {}) is None
+    assert peak_analyzer(table, {"online-peak": True}) is not None
@@ -0,0 +1,99 @@
+import numpy as np
+
+from protocol import (EDGE, PONG, PULSE_ACK, SYNC, VERSION, FrameDecoder,
+                      encode_frame)
+
+FRAMES = [
+    (EDGE, [(7, 1000), (-7, 31000)]),
+    (PONG, [(-1, 52000)]),
+    (PULSE_ACK, [(12, 60000), (-12, 110000), (3, 2**32 - 1)]),
+    (VERSION, [(-128, 0xDEADBEEF)]),
+]
+STREAM = b"".join(encode_frame(kind, records) for kind, records in FRAMES)
+
+
+def expected(frames=FRAMES) -> list:
+    # PONG and VERSION keys are unsigned bytes echoed back.
+    return [(kind, key & 0xFF if kind in (PONG, VERSION) else key, micros)
+            for kind, records in frames for key, micros in records]
+
+
+def decoded(frames: np.ndarray) -> list:
+    return list(zip(frames["type"].tolist(), frames["key"].tolist(),
+                    frames["micros"].tolist()))
+
+
+def test_round_trip():
+    decoder = FrameDecoder()
+    assert decoded(decoder.feed(STREAM)) == expected()
+    assert decoder.dropped == 0
+
+
+def test_split_frames():
+    # Cut anywhere, the frames come out whole once their last byte arrives.
+    for cut in range(len(STREAM) + 1):
+        decoder = FrameDecoder()
+        frames = decoded(decoder.feed(STREAM[:cut]))
+        frames += decoded(decoder.feed(STREAM[cut:]))
+        assert frames == expected()
+        assert decoder.dropped == 0
+
+
+def test_byte_by_byte():
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(len(STREAM)):
+        frames += decoded(decoder.feed(STREAM[i:i + 1]))
+    assert frames == expected()
+
+
+def test_checksum_error_drops_the_frame():
+    data = bytearray(STREAM)
+    first = len(encode_frame(*FRAMES[0]))
+    data[first + 4] ^= 0x10
+    decoder = FrameDecoder()
+    frames = decoded(decoder.feed(bytes(data)))
+    assert frames == expected(FRAMES[:1] + FRAMES[2:])
+    assert decoder.dropped == 1
+
+
+def test_resync_after_noise():
+    noise = bytes([0x00, SYNC, 0xFF, SYNC, EDGE, 0x00, 0x42])
+    decoder = FrameDecoder()
+    frames = decoded(decoder.feed(noise + STREAM))
+    assert frames == expected()
+    # Two SYNC bytes in the noise, neither a frame.
+    assert decoder.dropped == 2
+
+
+def test_lost_byte():
+    data = bytearray(STREAM)
+    first = len(encode_frame(*FRAMES[0]))
+    del data[first + 5]
+    decoder = FrameDecoder()
+    frames = decoded(decoder.feed(bytes(data)))
+    # The damaged frame swallows the head of the next; the rest decode.
+    assert frames[:2] == expected(FRAMES[:1])
+    assert frames[-1:] == expected(FRAMES[3:])
+    assert decoder.dropped >= 1
+
+
+def test_frame_inside_a_payload():
+    # A valid frame in another frame's records is payload, not a frame.
+    inner = encode_frame(EDGE, [(3, 7)])
+    payload = bytes([1]) + inner + bytes(20 - 1 - len(inner))
+    body = bytes([EDGE, 4]) + payload
+    checksum = np.bitwise_xor.reduce(np.frombuffer(body, np.uint8))
+    outer = bytes([SYNC]) + body + bytes([checksum])
+    decoder = FrameDecoder()
+    frames = decoder.feed(outer + STREAM)
+    assert len(frames) == 4 + len(expected())
+    assert decoded(frames[4:]) == expected()
+    assert decoder.dropped == 0
+
+
+def test_incomplete_tail_is_kept():
+    decoder = FrameDecoder()
+    assert len(decoder.feed(STREAM[:-1])) == len(expected()) - 1
+    assert decoded(decoder.feed(STREAM[-1:])) == expected()[-1:]
+    assert len(decoder.feed(b"")) == 0
@@ -0,0 +1,106 @@
+import os
+from time import perf_counter, sleep
+
+import numpy as np
+import pytest
+
+from events import (CSV_HEADER, EVENT_DTYPE, HEADER_SIZE, binary_header,
+                    load_events, write_binary)
+from recorder import BinaryEventWriter, EventWriter, recover
+
+
+def events(n: int) -> np.ndarray:
+    records = np.zeros(n, EVENT_DTYPE)
+    records["time"] = np.arange(n) * 0.5
+    records["event"] = np.arange(n) % 3 + 1
+    return records
+
+
+def wait_written(writer: EventWriter, n: int, timeout: float = 2.) -> None:
+    end = perf_counter() + timeout
+    while writer.written < n and perf_counter() < end:
+        sleep(0.005)
+
+
+def test_rows_reach_disk_during_the_session(tmp_path):
+    path = str(tmp_path / "session.csv")
+    writer = EventWriter(path, batch_size=4, flush_interval=60.)
+    try:
+        for t, event in events(4)[["time", "event"]].tolist():
+            writer.push((t, event))
+        # A full batch is written without flush() or close().
+        wait_written(writer, 4)
+        assert len(load_events(path)) == 4
+        writer.extend(events(2))
+        sleep(0.05)
+        assert len(load_events(path)) == 4
+    finally:
+        writer.close()
+    assert len(load_events(path)) == 6
+
+
+def test_flush_interval_writes_a_partial_batch(tmp_path):
+    path = str(tmp_path / "session.bin")
+    writer = BinaryEventWriter(path, batch_size=256, flush_interval=0.05)
+    try:
+        writer.extend(events(3))
+        wait_written(writer, 3)
+        assert np.array_equal(load_events(path), events(3))
+    finally:
+        writer.close()
+
+
+def test_append_continues_a_torn_file(tmp_path):
+    path = str(tmp_path / "session.csv")
+    with open(path, "w") as f:
+        f.write(CSV_HEADER + "0.5, 7, 0\n1.0, -")
+    with EventWriter(path, append=True) as writer:
+        writer.push((2.0, 12))
+    assert load_events(path)["time"].tolist() == [0.5, 2.0]
+
+
+def test_recover_csv(tmp_path):
+    path = str(tmp_path / "session.csv")
+    with open(path, "w") as f:
+        f.write(CSV_HEADER + "0.5, 7, 0\n1.0, -7, 0\n1.5, 12, 0\n2.0, -1")
+    assert recover(path) == 3
+    with open(path) as f:
+        assert f.read().endswith("1.5, 12, 0\n")
+    assert len(load_events(path)) == 3
+    # An intact file is left as it is.
+    assert recover(path) == 3
+
+
+def test_recover_torn_csv_header(tmp_path):
+    path = str(tmp_path / "session.csv")
+    with open(path, "w") as f:
+        f.write(CSV_HEADER[:5])
+    assert recover(path) == 0
+    with open(path) as f:
+        assert f.read() == CSV_HEADER
+
+
+def test_recover_rejects_other_files(tmp_path):
+    path = str(tmp_path / "notes.csv")
+    with open(path, "w") as f:
+        f.write("not, an, event, file\n")
+    with pytest.raises(ValueError):
+        recover(path)
+
+
+def test_recover_binary(tmp_path):
+    path = str(tmp_path / "session.bin")
+    write_binary(path, events(4))
+    with open(path, "ab") as f:
+        f.write(events(1).tobytes()[:7])
+    assert recover(path) == 4
+    assert os.path.getsize(path) == HEADER_SIZE + 4 * EVENT_DTYPE.itemsize
+    assert np.array_equal(load_events(path), events(4))
+
+
+def test_recover_torn_binary_header(tmp_path):
+    path = str(tmp_path / "session.bin")
+    with open(path, "wb") as f:
+        f.write(binary_header()[:5])
+    assert recover(path, binary_header()) == 0
+    assert len(load_events(path)) == 0
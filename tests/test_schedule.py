@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from schedule import PEAK_LEAD, PEAK_TAIL, compile_schedule
+
+CS_US = {
+    "trial": 20,
+    "mean-iti": 10.,
+    "range-iti": 4.,
+    "cs-duration": 1.,
+    "us-duration": 0.05,
+    "schedule-seed": 0,
+}
+
+
+def gaps(table: np.ndarray) -> np.ndarray:
+    # From the end of each trial (the session start for the first) to the
+    # start of the next.
+    return table["cs_onset"] - np.concatenate([[0.], table["us_offset"][:-1]])
+
+
+def test_cs_us():
+    table = compile_schedule(CS_US, "CS-US")
+    assert len(table) == 20
+    assert table["cs"].all() and table["us"].all()
+    assert not table["probe"].any()
+    assert np.allclose(table["us_onset"] - table["cs_onset"], 1.)
+    assert np.allclose(table["us_offset"] - table["us_onset"], 0.05)
+    # The ITIs are a shuffled grid over mean-iti +- range-iti.
+    assert np.all((gaps(table) >= 6.) & (gaps(table) <= 14.))
+    assert gaps(table).mean() == pytest.approx(10.)
+
+
+def test_seed_repeats_the_table():
+    assert np.array_equal(compile_schedule(CS_US, "CS-US"),
+                          compile_schedule(CS_US, "CS-US"))
+    other = compile_schedule(dict(CS_US, **{"schedule-seed": 1}), "CS-US")
+    assert not np.array_equal(compile_schedule(CS_US, "CS-US"), other)
+
+
+def test_schedule_key_wins_over_default():
+    table = compile_schedule(dict(CS_US, schedule="FT"), "CS-US")
+    assert not table["cs"].any()
+
+
+def test_extinction():
+    table = compile_schedule(CS_US, "extinction")
+    assert len(table) == 30
+    assert table["phase"].tolist() == [0] * 10 + [1] * 10 + [2] * 10
+    assert table["us"].tolist() == [True] * 10 + [False] * 10 + [True] * 10
+
+
+def test_ft():
+    var = {"trial": 50, "interval": 10., "us-duration": 0.05}
+    table = compile_schedule(var, "FT")
+    assert len(table) == 50
+    assert not table["cs"].any()
+    assert np.allclose(table["cs_onset"], table["us_onset"])
+    # `interval` is US onset to US onset.
+    assert np.allclose(np.diff(table["us_onset"]), 10.)
+
+
+def test_peak():
+    var = {
+        "trial": 100,
+        "interval": 10.,
+        "us-duration": 0.05,
+        "peak-ratio": 0.15,
+        "schedule-seed": 3,
+    }
+    table = compile_schedule(var, "PEAK")
+    probe = table["probe"]
+    assert probe.any()
+    assert not probe[:PEAK_LEAD].any()
+    for i in np.flatnonzero(probe):
+        assert not probe[i + 1:i + 1 + PEAK_TAIL].any()
+    # Probe gaps are whole seconds within [3 * interval, + 20 - us].
+    probe_gaps = gaps(table)[probe]
+    assert np.allclose(probe_gaps, np.round(probe_gaps))
+    assert probe_gaps.min() >= 30. and probe_gaps.max() <= 49.95
+    assert np.allclose(gaps(table)[~probe], 10. - 0.05)
+
+
+def test_phases_override_presets():
+    var = {
+        "us-duration": 0.1,
+        "cs-duration": 2.,
+        "phases": [
+            {"name": "a", "trials": 3, "mean-iti": 5.},
+            {"name": "b", "trials": 2, "mean-iti": 5., "cs": False},
+        ],
+    }
+    table = compile_schedule(var, "FT")
+    assert table["cs"].tolist() == [True] * 3 + [False] * 2
+    assert table["phase"].tolist() == [0, 0, 0, 1, 1]
+
+
+@pytest.mark.parametrize("var, schedule, match", [
+    (dict(CS_US, **{"range-iti": 12.}), "CS-US", "range-iti"),
+    (dict(CS_US, trial=0), "CS-US", "at least one trial"),
+    ({"trial": 5, "interval": 10., "us-duration": 0.05, "peak-ratio": 0.5},
+     "PEAK", "too few"),
+    ({k: v for k, v in CS_US.items() if k != "cs-duration"}, "CS-US",
+     "cs-duration"),
+    ({k: v for k, v in CS_US.items() if k != "us-duration"}, "CS-US",
+     "us-duration"),
+    (CS_US, "VR", "undefined schedule"),
+])
+def test_invalid(var, schedule, match):
+    with pytest.raises(ValueError, match=match):
+        compile_schedule(var, schedule)
@@ -0,0 +1,73 @@
+import asyncio
+import math
+
+import numpy as np
+import pytest
+
+# scheduler.py imports amas for the Agent type.
+pytest.importorskip("amas")
+
+from scheduler import DeadlineScheduler, timing_filename  # noqa
+
+
+class Sleeper(object):
+    async def sleep(self, t: float) -> None:
+        await asyncio.sleep(t)
+
+
+class Clock(object):
+    def __init__(self) -> None:
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_never_wakes_early():
+    sched = DeadlineScheduler(spin=0.002)
+
+    async def run():
+        sched.start()
+        woke = []
+        for offset in np.arange(1, 21) * 0.005:
+            now = await sched.wait_until(Sleeper(), offset)
+            woke.append(now - sched.deadline(offset))
+            sched.stamp(1, offset)
+        return woke
+
+    late = asyncio.run(run())
+    assert min(late) >= 0.
+    assert min(sched.lateness()) >= 0.
+    # Deadlines are absolute: lateness does not build up over the run.
+    assert np.median(late) < 0.005
+
+
+def test_stamp_and_confirm(tmp_path):
+    clock = Clock()
+    sched = DeadlineScheduler(clock=clock)
+    clock.now = 100.
+    assert sched.start() == 100.
+    clock.now = 101.5
+    assert sched.stamp(7, 1.) == (101.5, 7)
+    sched.stamp(12, 2.)
+    sched.confirm(7, 101.25)
+    sched.confirm(12, None)
+    assert sched.lateness() == [0.5, -0.5]
+    path = str(tmp_path / "session_timing.csv")
+    sched.dump(path)
+    with open(path) as f:
+        header, first, second = f.read().splitlines()
+    assert header == "event, planned, actual, lateness, confirmed, woke"
+    assert first.split(", ")[:5] == ["7", "101.0", "101.5", "0.5", "101.25"]
+    assert math.isnan(float(second.split(", ")[4]))
+
+
+def test_start_clears_the_records():
+    sched = DeadlineScheduler(clock=Clock())
+    sched.stamp(1, 0.)
+    assert sched.start(5.) == 5.
+    assert sched.records == [] and sched.deadline(2.) == 7.
+
+
+def test_timing_filename():
+    assert timing_filename("out/mouse1.csv") == "out/mouse1_timing.csv"